@@ -1,12 +1,20 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import requests
 import json
-import time
+import os
 import re
-from rag_query import rag_query, build_context
+from rag_query import ChatSession, loaded_shards, rerank_reports
 from diagnostic_agents import DiagnosticRouter, generate_full_report, answer_question
+from table_query import TableQueryEngine, format_markdown, to_rows
+from dossiers import DEFAULT_DOSSIER, list_dossiers, dossier_company, dossier_paths
+from structured_output import StructuredOutputError, complete_json, validate_chart_priorities
+from structured_output import stats as structured_output_stats
+from llm_usage import format_usage, usage_log, usage_summary
+from llm_gateway import complete, gateway_stats
+from metrics import recent, stage_summary
+from profiler import mb, peak_rss, process_rss
+from diagnostic_store import FRESH, STALE
 
 # === CONFIGURATION GLOBALE ===
 st.set_page_config(page_title="E-Center App", page_icon="⚖️", layout="wide")
@@ -35,20 +43,37 @@ if not check_password():
 st.sidebar.title("📂 Navigation")
 page = st.sidebar.radio(
     "Choisis une page :",
-    ["🧠 Assistant juridique", "📋 Diagnostics professionnels", "📊 Dashboard financier"],
+    ["🧠 Assistant juridique", "📋 Diagnostics professionnels", "📊 Dashboard financier", "📈 Performances"],
 )
 
+st.sidebar.markdown("---")
+available_dossiers = list_dossiers() or [DEFAULT_DOSSIER]
+dossier = st.sidebar.selectbox(
+    "📁 Dossier :",
+    available_dossiers,
+    index=available_dossiers.index(DEFAULT_DOSSIER) if DEFAULT_DOSSIER in available_dossiers else 0,
+    format_func=dossier_company,
+)
+extra_dossiers = st.sidebar.multiselect(
+    "🔀 Étendre la recherche à :",
+    [d for d in available_dossiers if d != dossier],
+    format_func=dossier_company,
+)
+searched_dossiers = [dossier] + extra_dossiers
+company = dossier_company(dossier)
+
 st.sidebar.markdown("---")
 if st.sidebar.button("🗑️ Réinitialiser la conversation"):
     if "messages" in st.session_state:
         st.session_state.messages = []
+    st.session_state.pop("chat", None)
     st.rerun()
 
 # -------------------------------------------------------------------
 # 🧠 PAGE 1 — ASSISTANT JURIDIQUE
 # -------------------------------------------------------------------
 if page == "🧠 Assistant juridique":
-    st.title("🧠 Assistant – E-Center")
+    st.title(f"🧠 Assistant – {company}")
     st.caption("Mission Restructuring X-HEC")
 
     # Zone de discussion
@@ -60,9 +85,16 @@ if page == "🧠 Assistant juridique":
         if "messages" not in st.session_state:
             st.session_state.messages = []
 
+        # Conversation (contexte documentaire cumulé) propre aux dossiers interrogés
+        if "chat" not in st.session_state or st.session_state.chat.dossiers != searched_dossiers:
+            st.session_state.chat = ChatSession(searched_dossiers)
+            st.session_state.messages = []
+
         for msg in st.session_state.messages:
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
+                if msg.get("usage"):
+                    st.caption(msg["usage"])
 
     with input_container:
         st.markdown("#### 💬 Pose ta question :")
@@ -82,40 +114,35 @@ if page == "🧠 Assistant juridique":
 
             with chat_container.chat_message("assistant"):
                 status_text = st.empty()
-                progress_bar = st.progress(0)
                 status_text.markdown("🔎 Construction du contexte en cours...")
 
-                context = build_context(prompt)
-                context_length = len(context)
-                max_chars = 20000
-                progress_value = min(context_length / max_chars, 1.0)
-
-                for i in range(int(progress_value * 100)):
-                    progress_bar.progress(i + 1)
-                    time.sleep(0.01)
-
-                progress_bar.progress(100)
-                status_text.markdown(f"✅ Contexte construit ({context_length} caractères)")
+                new_chunks, reused_chunks = st.session_state.chat.add_context(prompt)
+                status_text.markdown(f"✅ Contexte : {new_chunks} nouveaux passages, "
+                                     f"{reused_chunks} déjà dans la conversation")
 
                 with st.spinner("L'assistant réfléchit..."):
-                    response = rag_query(prompt)
+                    response, metrics = st.session_state.chat.ask(prompt)
 
-                progress_bar.empty()
                 status_text.empty()
 
+                usage = (f"{format_usage(metrics)} · {metrics['new_chunks']} passages ajoutés, "
+                         f"{metrics['reused_chunks']} réutilisés")
                 st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
+                st.caption(usage)
+                st.session_state.messages.append({"role": "assistant", "content": response, "usage": usage})
 
 # -------------------------------------------------------------------
 # 📋 PAGE 2 — DIAGNOSTICS PROFESSIONNELS
 # -------------------------------------------------------------------
 elif page == "📋 Diagnostics professionnels":
-    st.title("📋 Diagnostics professionnels – E-Center")
+    st.title(f"📋 Diagnostics professionnels – {company}")
     st.caption("Mission Restructuring X-HEC")
 
-    # Initialisation du routeur
-    if "router" not in st.session_state:
-        st.session_state.router = DiagnosticRouter()
+    # Initialisation du routeur (un par dossier : les diagnostics d'un autre dossier sont effacés)
+    if "router" not in st.session_state or st.session_state.router.dossier != dossier:
+        st.session_state.router = DiagnosticRouter(dossier)
+        for key in [k for k in st.session_state.keys() if str(k).startswith(("all_diagnostics", "diagnostic_"))]:
+            del st.session_state[key]
 
     # Onglets pour les différentes fonctionnalités
     tab1, tab2, tab3 = st.tabs(["📊 Tous les diagnostics", "🎯 Diagnostic spécifique", "❓ Question ciblée"])
@@ -125,20 +152,32 @@ elif page == "📋 Diagnostics professionnels":
         st.markdown("### Génération complète de tous les diagnostics")
         st.info("Cette fonction génère un rapport complet avec les 7 diagnostics : Marché, Produit, Concurrence, Histoire, Process, Chiffre, et Juridique.")
 
+        router = st.session_state.router
+        # Diagnostics enregistrés (dossier/diagnostics) : chargés sans appel LLM
+        stored = {domain: router.stored_diagnostic(domain) for domain in router.agents}
+        to_refresh = [domain for domain, (_, status) in stored.items() if status != FRESH]
+        if to_refresh:
+            st.warning("⚠️ À régénérer (absents ou obsolètes) : "
+                       + ", ".join(router.agents[d].domain for d in to_refresh))
+        else:
+            st.success(f"💾 Les {len(router.agents)} diagnostics enregistrés sont à jour (documents, prompts et modèle inchangés).")
+        force = st.checkbox("Tout régénérer (ignorer les diagnostics à jour)")
+
         if st.button("🚀 Générer tous les diagnostics", type="primary", use_container_width=True):
             with st.spinner("Génération en cours... Cela peut prendre quelques minutes."):
                 progress_bar = st.progress(0)
                 status_text = st.empty()
 
                 diagnostics = {}
-                domains = list(st.session_state.router.agents.keys())
+                domains = list(router.agents.keys()) if force else to_refresh
 
-                for i, (domain, agent) in enumerate(st.session_state.router.agents.items()):
+                for i, domain in enumerate(domains):
+                    agent = router.agents[domain]
                     status_text.text(f"Génération du diagnostic : {agent.domain}")
                     progress_bar.progress((i + 1) / len(domains))
 
                     try:
-                        diagnostics[domain] = agent.run()
+                        diagnostics[domain], _ = router.get_diagnostic(domain, force=True)
                     except Exception as e:
                         diagnostics[domain] = f"Erreur lors de la génération : {str(e)}"
 
@@ -146,31 +185,46 @@ elif page == "📋 Diagnostics professionnels":
                 status_text.empty()
 
                 st.session_state["all_diagnostics"] = diagnostics
-                st.success("✅ Tous les diagnostics ont été générés avec succès !")
+                stored = {domain: router.stored_diagnostic(domain) for domain in router.agents}
+                st.success(f"✅ {len(domains)} diagnostic(s) généré(s), "
+                           f"{len(router.agents) - len(domains)} réutilisé(s) !")
+
+        # Diagnostics de la session (erreurs comprises), sinon diagnostics enregistrés
+        generated = st.session_state.get("all_diagnostics", {})
+        report = {}
+        for domain in router.agents:
+            entry, status = stored[domain]
+            if domain in generated:
+                report[domain] = (generated[domain], status)
+            elif entry:
+                report[domain] = (entry["content"], status)
 
         # Afficher les diagnostics générés
-        if "all_diagnostics" in st.session_state:
+        if report:
             st.markdown("---")
             st.markdown("## 📑 Rapport complet")
 
             # Bouton pour télécharger le rapport complet
             full_report = ""
-            for domain, content in st.session_state["all_diagnostics"].items():
-                agent = st.session_state.router.agents[domain]
+            for domain, (content, _) in report.items():
+                agent = router.agents[domain]
                 full_report += f"\n\n# {agent.domain.upper()}\n\n{content}\n\n{'='*80}\n"
 
             st.download_button(
                 label="📥 Télécharger le rapport complet (Markdown)",
                 data=full_report,
-                file_name="diagnostic_complet_ecenter.md",
+                file_name=f"diagnostic_complet_{dossier}.md",
                 mime="text/markdown",
                 use_container_width=True
             )
 
-            # Affichage des diagnostics avec expanders
-            for domain, content in st.session_state["all_diagnostics"].items():
-                agent = st.session_state.router.agents[domain]
-                with st.expander(f"📌 {agent.domain}", expanded=False):
+            # Affichage des diagnostics avec expanders (les obsolètes sont signalés)
+            for domain, (content, status) in report.items():
+                agent = router.agents[domain]
+                label = f"📌 {agent.domain}"
+                if status == STALE:
+                    label += f" — ⚠️ obsolète ({', '.join(router.stale_reasons(domain, stored[domain][0]))} modifiés)"
+                with st.expander(label, expanded=False):
                     st.markdown(content)
 
     # TAB 2: Générer un diagnostic spécifique
@@ -198,23 +252,33 @@ elif page == "📋 Diagnostics professionnels":
 
             with st.spinner(f"Génération du diagnostic {agent.domain}..."):
                 try:
-                    diagnostic = agent.run()
+                    diagnostic, _ = st.session_state.router.get_diagnostic(selected_domain, force=True)
                     st.session_state[f"diagnostic_{selected_domain}"] = diagnostic
                     st.success(f"✅ Diagnostic {agent.domain} généré avec succès !")
                 except Exception as e:
                     st.error(f"❌ Erreur lors de la génération : {str(e)}")
 
+        # Diagnostic enregistré : affiché sans régénération (signalé s'il est obsolète)
+        entry, status = st.session_state.router.stored_diagnostic(selected_domain)
+        if entry and f"diagnostic_{selected_domain}" not in st.session_state:
+            st.session_state[f"diagnostic_{selected_domain}"] = entry["content"]
+
         # Afficher le diagnostic généré
         if f"diagnostic_{selected_domain}" in st.session_state:
             st.markdown("---")
             agent = st.session_state.router.agents[selected_domain]
             st.markdown(f"## 📋 {agent.domain}")
+            if status == STALE:
+                reasons = ", ".join(st.session_state.router.stale_reasons(selected_domain, entry))
+                st.warning(f"⚠️ Diagnostic obsolète ({reasons} modifiés depuis le {entry['created']}) : à régénérer.")
+            elif status == FRESH:
+                st.caption(f"💾 Enregistré le {entry['created']}, à jour")
             st.markdown(st.session_state[f"diagnostic_{selected_domain}"])
 
             st.download_button(
                 label=f"📥 Télécharger le diagnostic {agent.domain}",
                 data=st.session_state[f"diagnostic_{selected_domain}"],
-                file_name=f"diagnostic_{selected_domain}_ecenter.md",
+                file_name=f"diagnostic_{selected_domain}_{dossier}.md",
                 mime="text/markdown",
                 use_container_width=True
             )
@@ -227,7 +291,7 @@ elif page == "📋 Diagnostics professionnels":
         # Zone de saisie de question
         question = st.text_area(
             "Votre question :",
-            placeholder="Ex: Quelle est la situation financière de E-Center ? Qui sont les concurrents principaux ?",
+            placeholder=f"Ex: Quelle est la situation financière de {company} ? Qui sont les concurrents principaux ?",
             height=100
         )
 
@@ -240,9 +304,16 @@ elif page == "📋 Diagnostics professionnels":
 
                     st.info(f"🎯 Question routée vers l'agent : **{agent.domain}**")
 
+                    # ⚡ Réponse chiffrée immédiate depuis les tableaux (sans LLM)
+                    if domain == "chiffre":
+                        structured = agent.answer_structured(question)
+                        if structured:
+                            st.markdown("### 📊 Données chiffrées")
+                            st.markdown(format_markdown(structured))
+
                     try:
                         # Générer la réponse
-                        response = agent.run(custom_query=question)
+                        response, _ = st.session_state.router.get_diagnostic(domain, query=question)
 
                         st.markdown("---")
                         st.markdown(f"## 💡 Réponse de l'agent {agent.domain}")
@@ -252,7 +323,7 @@ elif page == "📋 Diagnostics professionnels":
                         st.download_button(
                             label="📥 Télécharger la réponse",
                             data=f"# Question\n\n{question}\n\n# Réponse ({agent.domain})\n\n{response}",
-                            file_name=f"reponse_{domain}_ecenter.md",
+                            file_name=f"reponse_{domain}_{dossier}.md",
                             mime="text/markdown",
                             use_container_width=True
                         )
@@ -261,14 +332,98 @@ elif page == "📋 Diagnostics professionnels":
             else:
                 st.warning("⚠️ Veuillez saisir une question.")
 
+# -------------------------------------------------------------------
+# 📈 PAGE 4 — PERFORMANCES
+# -------------------------------------------------------------------
+elif page == "📈 Performances":
+    st.title("📈 Performances et usage")
+    st.caption("Mesures du serveur Streamlit (toutes sessions confondues) depuis son démarrage")
+    if st.button("🔄 Rafraîchir"):
+        st.rerun()
+
+    # Appels LLM : tokens, cache de préfixe, latence par source (assistant, diagnostic:<agent>...)
+    st.markdown("### 🤖 Appels LLM")
+    summary = usage_summary()
+    if summary:
+        st.dataframe(pd.DataFrame([{"source": source, **values} for source, values in summary.items()]),
+                     use_container_width=True, hide_index=True)
+        calls = pd.DataFrame(usage_log()[::-1][:100])
+        calls["time"] = pd.to_datetime(calls["time"], unit="s")
+        with st.expander("Derniers appels"):
+            st.dataframe(calls, use_container_width=True, hide_index=True)
+    else:
+        st.info("Aucun appel LLM depuis le démarrage.")
+
+    # Erreurs, relances et limite de concurrence de la passerelle
+    st.markdown("### ⚠️ Erreurs et relances")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Passerelle LLM (par fournisseur)**")
+        st.dataframe(pd.DataFrame(gateway_stats()).T, use_container_width=True)
+    with col2:
+        st.markdown("**Réponses JSON (structured_output)**")
+        st.dataframe(pd.DataFrame([structured_output_stats()]), use_container_width=True, hide_index=True)
+
+    # Latence par étape et par agent
+    st.markdown("### ⏱️ Latence par étape")
+    stages = stage_summary()
+    if stages:
+        df_stages = pd.DataFrame(stages)
+        st.dataframe(df_stages, use_container_width=True, hide_index=True)
+        fig = px.bar(df_stages, x="stage", y=["p50_s", "p95_s"], facet_col="component", facet_col_wrap=4,
+                     barmode="group", title="Latence p50 / p95 (s)")
+        fig.update_xaxes(matches=None, showticklabels=True)
+        st.plotly_chart(fig, use_container_width=True)
+        with st.expander("Dernières mesures"):
+            st.dataframe(pd.DataFrame(recent(200)), use_container_width=True, hide_index=True)
+    else:
+        st.info("Aucune mesure depuis le démarrage.")
+
+    if rerank_reports:
+        st.markdown("### ⚖️ Re-classement (coût vs temps LLM économisé)")
+        st.dataframe(pd.DataFrame(list(rerank_reports)[::-1]), use_container_width=True, hide_index=True)
+
+    # Index et mémoire
+    st.markdown("### 💾 Index et mémoire")
+    col1, col2 = st.columns(2)
+    col1.metric("RSS du processus", f"{mb(process_rss())} Mo")
+    col2.metric("Pic RSS", f"{mb(max(peak_rss(), process_rss()))} Mo")
+    shards = loaded_shards()
+    if shards:
+        st.markdown("**Dossiers chargés**")
+        st.dataframe(pd.DataFrame([{**{k: v for k, v in s.items() if k != "files_mb"},
+                                    **{f"{name} (Mo)": size for name, size in s["files_mb"].items()}}
+                                   for s in shards]), use_container_width=True, hide_index=True)
+
+    paths = dossier_paths(dossier)
+    if os.path.exists(paths["index_stats"]):
+        with open(paths["index_stats"], "r", encoding="utf-8") as f:
+            index_stats = json.load(f)
+        st.markdown(f"**Dernière indexation de {company}** ({index_stats['finished_at']}, mode {index_stats['mode']})")
+        cols = st.columns(4)
+        cols[0].metric("Chunks", index_stats["chunks"])
+        cols[1].metric("Durée", f"{index_stats['elapsed_s']} s")
+        cols[2].metric("Débit", f"{index_stats['chunks_per_s']} chunks/s")
+        cols[3].metric("Pic RSS", f"{index_stats['peak_rss_mb']} Mo")
+        if index_stats["stages"]:
+            st.dataframe(pd.DataFrame(index_stats["stages"]).T, use_container_width=True)
+    if os.path.exists(paths["state"]):
+        with open(paths["state"], "r", encoding="utf-8") as f:
+            tasks = json.load(f).get("tasks", {})
+        if tasks:
+            with st.expander("Durées du dernier pipeline (main.py)"):
+                rows = [{"tâche": name, "durée (s)": t.get("duration_s"), "terminée": t.get("finished_at")}
+                        for name, t in tasks.items()]
+                st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
 # -------------------------------------------------------------------
 # 📊 PAGE 3 — DASHBOARD FINANCIER
 # -------------------------------------------------------------------
 else:
-    st.title("📊 Dashboard intelligent – E-Center")
+    st.title(f"📊 Dashboard intelligent – {company}")
 
     try:
-        with open("data/all_tables.json", "r", encoding="utf-8") as f:
+        with open(dossier_paths(dossier)["tables"], "r", encoding="utf-8") as f:
             tables = json.load(f)
     except FileNotFoundError:
         st.error("Fichier 'all_tables.json' introuvable.")
@@ -276,44 +431,60 @@ else:
 
     question = st.text_input("❓ Pose ta question :", placeholder="Ex : Quelle est l'évolution du chiffre d'affaires ?")
 
-    def ask_agent(question, tables, api_key):
-        subset = [{"titre": t["titre"], "extrait": str(t["data"][:2])} for t in tables]
+    def show_direct_answer(result):
+        """Affiche une réponse calculée localement depuis les tableaux normalisés."""
+        st.success("⚡ Réponse directe depuis les tableaux (sans appel LLM)")
+        df = pd.DataFrame(to_rows(result))
+        if result["type"] == "compare":
+            fig = px.line(df, x="periode", y="valeur", color="serie", markers=True, title=result["question"])
+        else:
+            fig = px.bar(df, x="label", y="valeur", color="periode", barmode="group",
+                         text="valeur", title=result["question"])
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown(format_markdown(result))
+
+    def ask_agent(question, tables):
+        subset = [{"titre": t["titre"], "extrait": t["data"][:2]} for t in tables]
         system_prompt = (
             "Tu es un assistant de data visualisation. "
             "Tu reçois une question utilisateur et une liste de tableaux extraits d'un rapport financier. "
             "Ta tâche : renvoyer les titres des graphiques les plus pertinents pour répondre à la question, "
             "et pour chacun, le type de visualisation le plus adapté parmi : "
             "'bar' (comparaison de valeurs), 'pie' (répartition d'une somme) ou 'line' (évolution temporelle). "
-            "Réponds uniquement en JSON sous la forme : "
-            "[{'titre': '...', 'pertinence': 1 à 5, 'type': 'bar'|'pie'|'line'}]."
+            "Réponds uniquement avec un objet JSON valide de la forme : "
+            '{"graphiques": [{"titre": "...", "pertinence": 1 à 5 (5 = le plus pertinent), "type": "bar" | "pie" | "line"}]}.'
         )
 
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Question: {question}\n\nDonnées:\n{json.dumps(subset, ensure_ascii=False)}"},
-            ],
-        }
-        headers = {
-            "Authorization": f"Bearer {st.secrets['DEEPSEEK_API_KEY']}",
-            "Content-Type": "application/json",
-        }
+        def send(messages):
+            text, _ = complete(messages, provider="deepseek", source="dashboard",
+                               response_format={"type": "json_object"})
+            return text
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Question: {question}\n\nDonnées:\n{json.dumps(subset, ensure_ascii=False)}"},
+        ]
         try:
-            response = requests.post("https://api.deepseek.com/v1/chat/completions", headers=headers, json=payload)
-            response.raise_for_status()
-            text = response.json()["choices"][0]["message"]["content"]
-            return json.loads(text)
+            return complete_json(send, messages, validate_chart_priorities,
+                                 schema_hint='{"graphiques": [{"titre": "...", "pertinence": 1-5, "type": "bar"}]}')
+        except StructuredOutputError as e:
+            st.error(f"Réponse de l'agent inexploitable : {e}")
+            return []
         except Exception as e:
             st.error(f"Erreur agent: {e}")
             return []
 
     if question:
         if st.button("🔍 Trouver les graphiques pertinents"):
+            # Moteur partagé, reconstruit si all_tables.json a changé (fusion, réindexation)
+            direct = TableQueryEngine.for_file(dossier_paths(dossier)["tables"]).answer(question)
+            if direct:
+                show_direct_answer(direct)
+
             with st.spinner("Analyse de la question..."):
-                priorities = ask_agent(question, tables, st.secrets["DEEPSEEK_API_KEY"])
+                priorities = [] if direct else ask_agent(question, tables)
                 if priorities:
-                    sorted_titles = [p["titre"] for p in sorted(priorities, key=lambda x: x["pertinence"])]
+                    sorted_titles = [p["titre"] for p in sorted(priorities, key=lambda x: -x["pertinence"])]
                     filtered = [t for t in tables if t["titre"] in sorted_titles[:5]]
 
                     st.success("✅ Graphiques identifiés comme pertinents :")
@@ -353,5 +524,5 @@ else:
                             st.warning(f"Erreur d'affichage pour '{table['titre']}' : {e}")
                             st.dataframe(df)
 
-                else:
+                elif not direct:
                     st.warning("Aucun graphique pertinent trouvé.")
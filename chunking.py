@@ -1,83 +1,182 @@
 import os
 import json
 import gc
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import psutil
 import numpy as np
 import faiss
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
 import time
+from lexical_index import BM25Index
+from index_storage import build_index
+from embedding_backend import EMBEDDING_BACKEND, load_embedder, write_index_meta
+from dossiers import DEFAULT_DOSSIER, dossier_paths
+from index_generations import GenerationWriter
+from profiler import NULL_PROFILER, RunProfiler, mb, peak_rss, process_rss
+from text_normalize import Normalizer
+from doc_metadata import EMPTY_PAGE, describe, format_page, page_at, text_blocks
 
 # === CONFIG ===
-TEXT_DIR = "data/texts"
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 80
-INDEX_PATH = "index_debug.faiss"
-CHUNKS_PATH = "chunks_debug.json"
 DEBUG_LOG = "debug_log.txt"
 BATCH_SIZE = 64  # ⚙️ encode plusieurs chunks à la fois (optimisation RAM + vitesse)
+INDEX_STORAGE = "flat"  # "flat" (float32) | "fp16" | "sq8" (int8) | "pq" — cf. index_storage.py
+NORMALIZE = True  # en-têtes/pieds de page répétés retirés, chunks identiques écartés — cf. text_normalize.py
+# Mode rapide (--fast)
+SUPER_BATCH = 2048  # chunks accumulés puis triés par longueur avant encodage
+READ_AHEAD_FILES = 4  # fichiers lus/découpés d'avance pendant l'encodage
+# Mode flux (--stream) : PDF → pages → chunks → embeddings → index, étapes en parallèle
+STREAM_PAGES_PER_TASK = 8  # pages extraites par tâche de processus
+STREAM_BATCH = 256  # chunks envoyés ensemble à l'encodeur
+STREAM_QUEUE_SIZE = 4  # batchs en attente entre deux étapes (files bornées)
+
+_log_file = None
 
 # === UTILS ===
 def log_debug(message):
     """Écrit les logs dans un fichier + console"""
+    global _log_file
     timestamp = time.strftime("[%H:%M:%S]")
     print(f"{timestamp} {message}")
-    with open(DEBUG_LOG, "a", encoding="utf-8") as f:
-        f.write(f"{timestamp} {message}\n")
+    if _log_file is None:
+        _log_file = open(DEBUG_LOG, "a", encoding="utf-8", buffering=1)
+    _log_file.write(f"{timestamp} {message}\n")
 
 def show_mem(prefix=""):
-    """Affiche la mémoire utilisée"""
+    """Affiche la mémoire du processus (RSS et pic), avec la RAM système pour contexte"""
     mem = psutil.virtual_memory()
     used = mem.used / (1024**3)
     total = mem.total / (1024**3)
-    log_debug(f"{prefix} 💾 RAM utilisée: {used:.2f} Go / {total:.2f} Go")
+    log_debug(f"{prefix} 💾 RAM processus: {mb(process_rss())} Mo (pic {mb(peak_rss())} Mo)"
+              f" | système: {used:.2f} Go / {total:.2f} Go")
+
+def chunk_spans(text, max_chars=500, overlap=80):
+    """Découpe un texte en petits morceaux avec chevauchement, avec leur position de début"""
+    for start in range(0, len(text), max_chars - overlap):
+        yield start, text[start:start + max_chars]
+
 
 def chunk_text(text, max_chars=500, overlap=80):
     """Découpe un texte en petits morceaux avec chevauchement"""
-    for start in range(0, len(text), max_chars - overlap):
-        yield text[start:start + max_chars]
+    for _, chunk in chunk_spans(text, max_chars, overlap):
+        yield chunk
 
 
-# === MAIN ===
-if __name__ == "__main__":
-    open(DEBUG_LOG, "w").close()  # reset log
-    log_debug("🚀 Démarrage du script RAG DEBUG")
+def clean_with_pages(normalizer, doc_id, text):
+    """
+    Nettoie un texte extrait bloc par bloc ; retourne (texte nettoyé, marques de page).
+    Les pages sont numérotées sur le texte brut (pages vides comprises) : une page vidée
+    par le nettoyage ne décale pas les suivantes, comme en mode flux.
+    """
+    blocks, marks, pos = [], [], 0
+    for _, block, page in text_blocks(text):
+        if block.strip() == EMPTY_PAGE:
+            continue
+        block = normalizer.clean_page(doc_id, block)
+        if block.strip():
+            marks.append((pos, page))
+            blocks.append(block)
+            pos += len(block) + 2
+    return "\n\n".join(blocks), marks or [(0, None)]
+
+
+class StreamChunker:
+    """
+    Découpage incrémental d'un texte reçu par morceaux (pages) : produit exactement
+    les chunks de chunk_text() sur le texte complet (sans espaces finaux), avec les
+    métadonnées du document et la page où commence chaque chunk (cf. feed).
+    """
+
+    def __init__(self, doc_id, max_chars=CHUNK_SIZE, overlap=CHUNK_OVERLAP, meta=None):
+        self.doc_id = doc_id
+        self.meta = meta or {}
+        self.page_marks = []  # (position dans le texte complet, page des morceaux suivants)
+        self.max_chars = max_chars
+        self.step = max_chars - overlap
+        self.buffer = ""
+        self.offset = 0  # position, dans le texte complet, du début du buffer
+        self.next_start = 0
+        self.count = 0
+
+    def _emit(self, end, final=False):
+        """Chunks dont la fenêtre est entièrement connue (toutes les fenêtres restantes si final)."""
+        chunks = []
+        while self.next_start < end and (final or self.next_start + self.max_chars <= end):
+            rel = self.next_start - self.offset
+            chunks.append({"doc_id": self.doc_id, "chunk_id": f"{self.doc_id}_{self.count}",
+                           "text": self.buffer[rel:rel + self.max_chars], **self.meta,
+                           "page": page_at(self.page_marks, self.next_start) if self.page_marks else None})
+            self.count += 1
+            self.next_start += self.step
+        drop = min(self.next_start - self.offset, len(self.buffer))
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.offset += drop
+        return chunks
+
+    def feed(self, piece, page=None):
+        """Ajoute un morceau de texte (de la page `page`) ; retourne les chunks désormais complets."""
+        self.page_marks.append((self.offset + len(self.buffer), page))
+        self.buffer += piece
+        return self._emit(self.offset + len(self.buffer.rstrip()))
+
+    def close(self):
+        """Fin du texte : retourne les derniers chunks (fenêtres incomplètes incluses)."""
+        self.buffer = self.buffer.rstrip()
+        return self._emit(self.offset + len(self.buffer), final=True)
 
-    # ⚙️ Initialiser le modèle AVANT lecture (évite pics mémoire plus tard)
-    log_debug("⚙️ Initialisation du modèle...")
-    model = SentenceTransformer(MODEL_NAME)
-    dim = model.get_sentence_embedding_dimension()
-    index = faiss.IndexFlatL2(dim)
-    show_mem("Après chargement du modèle")
 
+# === INDEXATION ===
+def index_standard(model, index, text_dir, profiler=NULL_PROFILER, normalizer=None):
+    """Indexation historique : fichier par fichier, batchs de BATCH_SIZE, suivi mémoire par batch."""
+    normalizer = normalizer or Normalizer(enabled=False)
     # Liste pour écrire les chunks progressivement
     all_chunks = []
     chunk_counter = 0
+    encode_time = 0.0
 
     # 1️⃣ Parcours fichier par fichier pour éviter surcharge RAM
-    for filename in os.listdir(TEXT_DIR):
+    for filename in sorted(os.listdir(text_dir)):
         if not filename.endswith(".txt"):
             continue
 
-        path = os.path.join(TEXT_DIR, filename)
-        with open(path, "r", encoding="utf-8") as f:
+        path = os.path.join(text_dir, filename)
+        with profiler.stage("read"), open(path, "r", encoding="utf-8") as f:
             text = f.read().strip()
 
         log_debug(f"📄 Chargé {filename} ({len(text)} caractères)")
+        doc_meta = describe(filename, text)
+        with profiler.stage("normalize"):
+            text, pages = clean_with_pages(normalizer, filename, text)
 
         # 2️⃣ Découpage en chunks + encodage par batch
         chunk_batch = []
         meta_batch = []
 
-        for i, c in enumerate(chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)):
-            meta_batch.append({"doc_id": filename, "chunk_id": f"{filename}_{i}", "text": c})
+        with profiler.stage("chunk"):
+            pieces = list(chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP))
+
+        for i, (start, c) in enumerate(pieces):
+            if not normalizer.keep(c):
+                continue
+            meta_batch.append({"doc_id": filename, "chunk_id": f"{filename}_{i}", "text": c, **doc_meta,
+                               "page": page_at(pages, start)})
             chunk_batch.append(c)
 
             # Quand on atteint la taille de batch → encodage
             if len(chunk_batch) >= BATCH_SIZE:
-                embeddings = model.encode(chunk_batch, convert_to_numpy=True, show_progress_bar=False)
-                index.add(embeddings)
+                t0 = time.perf_counter()
+                with profiler.stage("encode"):
+                    embeddings = model.encode(chunk_batch, convert_to_numpy=True, show_progress_bar=False)
+                encode_time += time.perf_counter() - t0
+                with profiler.stage("index_add"):
+                    index.add(embeddings)
                 all_chunks.extend(meta_batch)
                 chunk_counter += len(chunk_batch)
                 log_debug(f"🔹 Ajout de {len(chunk_batch)} chunks (total: {chunk_counter})")
@@ -89,8 +188,12 @@ if __name__ == "__main__":
 
         # 🔚 Dernier batch du fichier
         if chunk_batch:
-            embeddings = model.encode(chunk_batch, convert_to_numpy=True, show_progress_bar=False)
-            index.add(embeddings)
+            t0 = time.perf_counter()
+            with profiler.stage("encode"):
+                embeddings = model.encode(chunk_batch, convert_to_numpy=True, show_progress_bar=False)
+            encode_time += time.perf_counter() - t0
+            with profiler.stage("index_add"):
+                index.add(embeddings)
             all_chunks.extend(meta_batch)
             chunk_counter += len(chunk_batch)
             del embeddings
@@ -98,16 +201,372 @@ if __name__ == "__main__":
 
         show_mem(f"Fin traitement {filename}")
 
+    return all_chunks, encode_time
+
+
+def read_chunks(text_dir, out_queue, profiler=NULL_PROFILER, normalizer=None):
+    """Producteur : lit et découpe les fichiers en tâche de fond pendant l'encodage."""
+    normalizer = normalizer or Normalizer(enabled=False)
+    try:
+        for filename in sorted(os.listdir(text_dir)):
+            if not filename.endswith(".txt"):
+                continue
+            with profiler.stage("read"), open(os.path.join(text_dir, filename), "r", encoding="utf-8") as f:
+                text = f.read().strip()
+            doc_meta = describe(filename, text)
+            with profiler.stage("normalize"):
+                text, pages = clean_with_pages(normalizer, filename, text)
+            with profiler.stage("chunk"):
+                file_chunks = [
+                    {"doc_id": filename, "chunk_id": f"{filename}_{i}", "text": c, **doc_meta,
+                     "page": page_at(pages, start)}
+                    for i, (start, c) in enumerate(chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP))
+                    if normalizer.keep(c)
+                ]
+            out_queue.put((filename, len(text), file_chunks))
+    except Exception as e:
+        out_queue.put(e)  # remonté au consommateur plutôt qu'un index partiel silencieux
+    out_queue.put(None)
+
+
+def encode_length_sorted(model, texts, pool=None):
+    """
+    Encode des textes triés par longueur décroissante (batchs homogènes, moins de
+    padding), sur un pool multi-processus si fourni, puis rétablit l'ordre d'origine.
+    """
+    order = np.argsort([-len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+    if pool is not None:
+        embeddings = model.encode_multi_process(sorted_texts, pool, batch_size=BATCH_SIZE)
+    else:
+        embeddings = model.encode(sorted_texts, batch_size=BATCH_SIZE, convert_to_numpy=True,
+                                  show_progress_bar=False)
+    restored = np.empty_like(embeddings)
+    restored[order] = embeddings
+    return restored
+
+
+def index_fast(model, index, text_dir, workers, profiler=NULL_PROFILER, normalizer=None):
+    """
+    Indexation haut débit : lecture des fichiers en parallèle de l'encodage, chunks
+    regroupés en super-batchs triés par longueur, encodage sur `workers` processus.
+    Aucun gc.collect ni relevé mémoire par batch.
+    """
+    chunk_queue = queue.Queue(maxsize=READ_AHEAD_FILES)
+    threading.Thread(target=read_chunks, args=(text_dir, chunk_queue, profiler, normalizer),
+                     daemon=True).start()
+
+    pool = None
+    if workers > 1:
+        # Un thread BLAS par worker pour éviter la sur-souscription des cœurs
+        os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+        pool = model.start_multi_process_pool(["cpu"] * workers)
+        log_debug(f"⚡ Pool d'encodage démarré ({workers} processus)")
+
+    all_chunks, pending = [], []
+    encode_time = 0.0
+
+    def flush():
+        nonlocal encode_time
+        t0 = time.perf_counter()
+        with profiler.stage("encode"):
+            embeddings = encode_length_sorted(model, [c["text"] for c in pending], pool)
+        encode_time += time.perf_counter() - t0
+        with profiler.stage("index_add"):
+            index.add(np.ascontiguousarray(embeddings, dtype="float32"))
+        all_chunks.extend(pending)
+        log_debug(f"🔹 Super-batch de {len(pending)} chunks encodé (total: {len(all_chunks)})")
+        pending.clear()
+
+    try:
+        while True:
+            item = chunk_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            filename, n_chars, file_chunks = item
+            log_debug(f"📄 Chargé {filename} ({n_chars} caractères, {len(file_chunks)} chunks)")
+            pending.extend(file_chunks)
+            if len(pending) >= SUPER_BATCH:
+                flush()
+        if pending:
+            flush()
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+    return all_chunks, encode_time
+
+
+def stream_sources(raw_dir, text_dir):
+    """
+    Tâches d'extraction dans l'ordre : plages de pages puis tableaux de chaque PDF,
+    ensuite les textes de text_dir sans PDF d'origine (lus directement).
+    """
+    from pdf_extract import extract_page_range, extract_tables_section, page_count
+
+    pdf_stems = set()
+    for filename in sorted(f for f in os.listdir(raw_dir) if f.lower().endswith(".pdf")):
+        path = os.path.join(raw_dir, filename)
+        doc_id = os.path.splitext(filename)[0] + ".txt"
+        pdf_stems.add(doc_id)
+        n_pages = page_count(path)
+        for start in range(0, n_pages, STREAM_PAGES_PER_TASK):
+            yield doc_id, "pages", extract_page_range, (path, start, min(start + STREAM_PAGES_PER_TASK, n_pages))
+        yield doc_id, "tables", extract_tables_section, (path,)
+    if os.path.isdir(text_dir):
+        for filename in sorted(os.listdir(text_dir)):
+            if filename.endswith(".txt") and filename not in pdf_stems:
+                yield filename, "text", None, (os.path.join(text_dir, filename),)
+
+
+def index_streaming(model, index, raw_dir, text_dir, workers, profiler=NULL_PROFILER, normalizer=None):
+    """
+    Indexation en flux depuis les PDF : les pages extraites par `workers` processus sont
+    découpées au fil de l'eau, encodées (thread) puis ajoutées à l'index (thread).
+    Les étapes communiquent par des files bornées et se recouvrent : la durée totale
+    tend vers celle de l'étape la plus lente. Les textes extraits sont écrits dans text_dir.
+    Les pages sont normalisées avant découpage avec les lignes répétées apprises sur les
+    textes déjà présents (un PDF jamais extrait n'a que les numéros de page retirés).
+    """
+    from pdf_extract import TEXT_HEADER
+
+    normalizer = normalizer or Normalizer(enabled=False)
+    os.makedirs(text_dir, exist_ok=True)
+    batch_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)  # chunks → encodeur
+    vector_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)  # embeddings → index
+    all_chunks, errors = [], []
+    encode_time = 0.0
+
+    def encoder():
+        nonlocal encode_time
+        while True:
+            batch = batch_queue.get()
+            if batch is None:
+                break
+            if errors:
+                continue  # on vide la file pour ne pas bloquer le producteur
+            try:
+                t0 = time.perf_counter()
+                with profiler.stage("encode"):
+                    embeddings = model.encode([c["text"] for c in batch], batch_size=BATCH_SIZE,
+                                              convert_to_numpy=True, show_progress_bar=False)
+                encode_time += time.perf_counter() - t0
+                vector_queue.put((batch, embeddings))
+            except Exception as e:
+                errors.append(e)
+        vector_queue.put(None)
+
+    def writer():
+        while True:
+            item = vector_queue.get()
+            if item is None:
+                break
+            if errors:
+                continue
+            batch, embeddings = item
+            try:
+                with profiler.stage("index_add"):
+                    index.add(np.ascontiguousarray(embeddings, dtype="float32"))
+            except Exception as e:
+                errors.append(e)
+                continue
+            all_chunks.extend(batch)
+            log_debug(f"🔹 {len(batch)} chunks indexés (total: {len(all_chunks)})")
+
+    threads = [threading.Thread(target=encoder, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for t in threads:
+        t.start()
+
+    pending = []
+
+    def push(chunks, flush=False):
+        pending.extend(chunks)
+        while len(pending) >= STREAM_BATCH or (flush and pending):
+            batch_queue.put(pending[:STREAM_BATCH])  # bloque si l'encodeur est en retard
+            del pending[:STREAM_BATCH]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sources = stream_sources(raw_dir, text_dir)
+            inflight = deque()  # au plus 2 tâches par processus : extraction bornée elle aussi
+
+            def submit_next():
+                for doc_id, kind, func, args in sources:
+                    future = pool.submit(func, *args) if func is not None else None
+                    inflight.append((doc_id, kind, future, args))
+                    return
+
+            for _ in range(2 * workers):
+                submit_next()
+
+            chunker, parts = None, []
+            while inflight and not errors:
+                doc_id, kind, future, args = inflight.popleft()
+                with profiler.stage("extract_wait"):
+                    result = future.result() if future is not None else None
+                submit_next()
+
+                with profiler.stage("chunk"):
+                    if kind == "text":
+                        with open(args[0], "r", encoding="utf-8") as f:
+                            text = f.read().strip()
+                        text_chunker = StreamChunker(doc_id, meta=describe(doc_id, text))
+                        text, marks = clean_with_pages(normalizer, doc_id, text)
+                        chunks = []
+                        for (start, page), (end, _) in zip(marks, marks[1:] + [(len(text), None)]):
+                            chunks += text_chunker.feed(text[start:end], page)
+                        chunks += text_chunker.close()
+                        log_debug(f"📄 Chargé {doc_id} ({len(chunks)} chunks)")
+                    elif kind == "pages":
+                        if chunker is None:
+                            # Métadonnées du document d'après son nom et sa première page
+                            head = next((p for p in result if p), "")
+                            chunker, parts = StreamChunker(doc_id, meta=describe(doc_id, head)), [TEXT_HEADER]
+                            chunks = chunker.feed(normalizer.clean_page(doc_id, TEXT_HEADER))
+                        else:
+                            chunks = []
+                        for page_no, page_text in enumerate(result, start=args[1] + 1):
+                            page_text = format_page(page_text)  # même bloc que pdf_extract.smart_extract
+                            parts.append(page_text + "\n\n")
+                            if page_text != EMPTY_PAGE:
+                                page_text = normalizer.clean_page(doc_id, page_text)
+                                if page_text.strip():
+                                    chunks += chunker.feed(page_text + "\n\n", page_no)
+                    else:  # "tables" : dernière tâche du PDF
+                        if chunker is None:  # PDF sans page
+                            chunker, parts = StreamChunker(doc_id, meta=describe(doc_id)), [TEXT_HEADER]
+                            chunker.feed(normalizer.clean_page(doc_id, TEXT_HEADER))
+                        parts.append(result)
+                        chunks = chunker.feed(normalizer.clean(doc_id, result)) + chunker.close()
+                        with profiler.stage("write"), \
+                                open(os.path.join(text_dir, doc_id), "w", encoding="utf-8") as f:
+                            f.write("".join(parts).strip())
+                        log_debug(f"📄 Extrait {doc_id} ({chunker.count} chunks)")
+                        chunker, parts = None, []
+                push(normalizer.filter(chunks))
+        if not errors:
+            push([], flush=True)
+    finally:
+        batch_queue.put(None)
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+    return all_chunks, encode_time
+
+
+# === POINT D'ENTRÉE ===
+def build_dossier_index(dossier=DEFAULT_DOSSIER, fast=False, workers=None, profiler=NULL_PROFILER,
+                        stream=False):
+    """Découpe, encode et indexe les textes d'un dossier (ses PDF en mode flux) ; retourne le nombre de chunks."""
+    workers = workers or os.cpu_count() or 1
+    paths = dossier_paths(dossier)
+
+    open(DEBUG_LOG, "w").close()  # reset log
+    mode = "stream" if stream else "fast" if fast else "standard"
+    log_debug(f"🚀 Démarrage du script RAG DEBUG (dossier {dossier}, mode {mode})")
+
+    # ⚙️ Initialiser le modèle AVANT lecture (évite pics mémoire plus tard)
+    log_debug(f"⚙️ Initialisation du modèle (backend {EMBEDDING_BACKEND})...")
+    with profiler.stage("model_load"):
+        model = load_embedder(MODEL_NAME)
+    dim = model.get_sentence_embedding_dimension()
+    index = faiss.IndexFlatL2(dim)
+    show_mem("Après chargement du modèle")
+
+    # 1️⃣ 2️⃣ Lecture, normalisation, découpage et encodage
+    start = time.perf_counter()
+    with profiler.stage("normalize"):
+        normalizer = Normalizer.for_dir(paths["text_dir"], enabled=NORMALIZE)
+    if stream:
+        all_chunks, encode_time = index_streaming(model, index, paths["raw_dir"], paths["text_dir"],
+                                                  workers, profiler, normalizer)
+    elif fast:
+        all_chunks, encode_time = index_fast(model, index, paths["text_dir"], workers, profiler, normalizer)
+    else:
+        all_chunks, encode_time = index_standard(model, index, paths["text_dir"], profiler, normalizer)
+    elapsed = time.perf_counter() - start
+    chunk_counter = len(all_chunks)
+    log_debug(f"⏱️ {chunk_counter / max(elapsed, 1e-9):.1f} chunks/s de bout en bout "
+              f"({chunk_counter / max(encode_time, 1e-9):.1f} chunks/s en encodage)")
+
     # 3️⃣ Sauvegarde
     log_debug(f"✅ {chunk_counter} chunks encodés au total")
+    if NORMALIZE:
+        log_debug(f"🧹 {normalizer.stats['lines_removed']} lignes répétées retirées "
+                  f"({normalizer.stats['chars_removed']} caractères), "
+                  f"{normalizer.stats['duplicate_chunks']} chunks en double écartés")
     show_mem("Avant sauvegarde")
 
-    log_debug("💾 Sauvegarde de l'index...")
-    faiss.write_index(index, INDEX_PATH)
+    # Nouvelle génération de l'index : publiée d'un bloc une fois complète (cf. index_generations.py)
+    with GenerationWriter(dossier) as generation:
+        out = generation.paths
+        with profiler.stage("save"):
+            # Vecteurs float32 de référence : permettent de changer de stockage sans ré-encoder
+            vectors = index.reconstruct_n(0, index.ntotal)
+            np.save(out["embeddings"], vectors)
+
+            if INDEX_STORAGE != "flat":
+                log_debug(f"🗜️ Compression de l'index (stockage {INDEX_STORAGE})...")
+                index = build_index(vectors, INDEX_STORAGE)
+            del vectors
 
-    log_debug("💾 Sauvegarde des métadonnées chunks...")
-    with open(CHUNKS_PATH, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
+            log_debug("💾 Sauvegarde de l'index...")
+            faiss.write_index(index, out["index"])
+            write_index_meta(out["index"], MODEL_NAME, EMBEDDING_BACKEND, dim)
+
+            log_debug("💾 Sauvegarde des métadonnées chunks...")
+            with open(out["chunks"], "w", encoding="utf-8") as f:
+                json.dump(all_chunks, f, ensure_ascii=False, indent=2)
+
+        # 4️⃣ Index lexical BM25 (mêmes chunks, même ordre que l'index FAISS)
+        log_debug("🔤 Construction de l'index lexical BM25...")
+        with profiler.stage("bm25"):
+            bm25 = BM25Index.build(c["text"] for c in all_chunks)
+            bm25.save(out["bm25"])
+        log_debug(f"💾 Index BM25 sauvegardé ({len(bm25.postings)} termes)")
+    log_debug(f"🔄 Génération {generation.name} publiée")
 
     log_debug("✅ Terminé sans crash !")
     show_mem("Fin du traitement")
+
+    # Résumé de la dernière indexation, affiché par la page Performances de l'application
+    index_stats = {
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "generation": generation.name, "mode": mode, "chunks": chunk_counter, "vectors": index.ntotal,
+        "dim": dim,
+        "backend": EMBEDDING_BACKEND, "storage": INDEX_STORAGE, "normalize": normalizer.stats,
+        "elapsed_s": round(elapsed, 2), "encode_s": round(encode_time, 2),
+        "chunks_per_s": round(chunk_counter / max(elapsed, 1e-9), 1),
+        "peak_rss_mb": mb(max(peak_rss(), process_rss())),
+        "stages": profiler.report()["stages"] if profiler.enabled else {},
+    }
+    with open(paths["index_stats"], "w", encoding="utf-8") as f:
+        json.dump(index_stats, f, ensure_ascii=False, indent=2)
+
+    if profiler.enabled:
+        profiler.meta.update({"dossier": dossier, "mode": mode,
+                              "workers": workers if fast or stream else 1, "chunks": chunk_counter,
+                              "backend": EMBEDDING_BACKEND, "storage": INDEX_STORAGE})
+        log_debug(f"📈 Rapport de profilage : {profiler.save()}")
+
+    return chunk_counter
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Découpage + embeddings + index d'un dossier")
+    parser.add_argument("dossier", nargs="?", default=DEFAULT_DOSSIER, help="dossier à indexer (cf. dossiers.py)")
+    parser.add_argument("--fast", action="store_true", help="mode haut débit (multi-processus, tri par longueur)")
+    parser.add_argument("--stream", action="store_true",
+                        help="mode flux depuis raw_data/ : extraction, découpage, encodage et index en parallèle")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processus d'encodage (--fast) ou d'extraction (--stream)")
+    parser.add_argument("--profile", action="store_true", help="écrit un rapport de profilage JSON (profiles/)")
+    parser.add_argument("--tracemalloc", action="store_true", help="avec --profile : principaux allocateurs Python")
+    args = parser.parse_args()
+    profiler = RunProfiler("indexing", enabled=args.profile, trace_malloc=args.tracemalloc)
+    build_dossier_index(args.dossier, fast=args.fast, workers=args.workers, profiler=profiler, stream=args.stream)
@@ -0,0 +1,56 @@
+"""
+Comptage des tokens et mise à la taille des contextes envoyés aux agents de diagnostic
+(troncature, groupes de la phase map). Sans dépendance à l'index ni aux clés d'API.
+"""
+
+import re
+from typing import List
+
+import tiktoken
+
+# === CONFIG ===
+TOKENIZER_MODEL = "gpt-4o-mini"  # modèle des agents (diagnostic_agents.MODEL)
+CHUNK_SEPARATOR_RE = re.compile(r"\n(?=---\n)")  # début de chaque chunk dans rag_query.format_context()
+
+# Initialiser l'encodeur de tokens
+try:
+    encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+except KeyError:
+    encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Compte le nombre de tokens dans un texte."""
+    return len(encoding.encode(text))
+
+
+def truncate_context(context: str, max_tokens: int) -> str:
+    """Tronque le contexte pour ne pas dépasser max_tokens."""
+    tokens = encoding.encode(context)
+    if len(tokens) <= max_tokens:
+        return context
+
+    # Tronquer et ajouter un message
+    truncated_tokens = tokens[:max_tokens]
+    truncated_text = encoding.decode(truncated_tokens)
+    return truncated_text + "\n\n[... Contexte tronqué pour respecter la limite de tokens ...]"
+
+
+def split_context(context: str, max_tokens: int) -> List[str]:
+    """
+    Découpe un contexte en groupes d'au plus `max_tokens` tokens, sans couper un chunk
+    (et ses données tabulaires) ; seul un chunk plus long que la limite est coupé en tranches.
+    """
+    groups, current, current_tokens = [], [], 0
+    for piece in CHUNK_SEPARATOR_RE.split(context):
+        tokens = encoding.encode(piece)
+        for i in range(0, len(tokens), max_tokens):
+            part = tokens[i:i + max_tokens]
+            if current and current_tokens + len(part) > max_tokens:
+                groups.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece if len(tokens) <= max_tokens else encoding.decode(part))
+            current_tokens += len(part)
+    if current:
+        groups.append("\n".join(current))
+    return groups
@@ -6,12 +6,21 @@ Chaque agent est expert dans un domaine spécifique et peut utiliser différente
 import os
 import json
 import time
+import hashlib
+import copy
+import inspect
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
 from duckduckgo_search import DDGS
-from rag_query import build_context, retrieve, get_tabular_info
-import tiktoken
+from rag_query import build_context, retrieve, get_tabular_info, record_llm_time
+from dossiers import DEFAULT_DOSSIER, dossier_company, dossier_paths
+from table_query import TableQueryEngine, format_markdown
+from llm_usage import format_usage
+from llm_gateway import complete
+from metrics import record, record_error, timed
+from diagnostic_store import FRESH, DiagnosticStore
+from context_tokens import count_tokens, split_context, truncate_context
 
 load_dotenv()
 
@@ -20,45 +29,93 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("⚠️ OPENAI_API_KEY non définie dans .env")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
 MODEL = "gpt-4o-mini"  # Modèle OpenAI optimal pour le rapport qualité/coût
 MAX_CONTEXT_TOKENS = 100000  # Limite de sécurité pour le contexte (laisse de la marge pour la réponse)
-
-# Initialiser l'encodeur de tokens
-try:
-    encoding = tiktoken.encoding_for_model(MODEL)
-except KeyError:
-    encoding = tiktoken.get_encoding("cl100k_base")
-
-
-def count_tokens(text: str) -> int:
-    """Compte le nombre de tokens dans un texte."""
-    return len(encoding.encode(text))
-
-
-def truncate_context(context: str, max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
-    """Tronque le contexte pour ne pas dépasser max_tokens."""
-    tokens = encoding.encode(context)
-    if len(tokens) <= max_tokens:
-        return context
-
-    # Tronquer et ajouter un message
-    truncated_tokens = tokens[:max_tokens]
-    truncated_text = encoding.decode(truncated_tokens)
-    return truncated_text + "\n\n[... Contexte tronqué pour respecter la limite de tokens ...]"
-
+# Contexte plus long : map-reduce (faits extraits par groupe en parallèle) au lieu d'une troncature
+MAP_REDUCE = os.getenv("MAP_REDUCE", "1") != "0"
+MAP_GROUP_TOKENS = 24000  # taille d'un groupe de contexte traité en un appel (phase map)
+MAP_WORKERS = 4  # groupes traités simultanément (la passerelle limite aussi la concurrence OpenAI)
+MAX_REDUCE_ROUNDS = 3  # passes map successives si les faits extraits dépassent encore la limite
+PROMPT_VERSION = 1  # à incrémenter si l'assemblage des prompts change (run, call_openai) : diagnostics obsolètes
+MAP_SYSTEM_PROMPT = "Tu extrais des faits de documents d'entreprise, sans les interpréter."
+MAP_PROMPT = """Extrais de ces extraits TOUS les faits utiles à un diagnostic « {domain} » de {company} ({description}).
+
+Garde les chiffres, montants, dates, noms, parties, décisions et événements exacts, avec leur document source entre crochets.
+Réponds par une liste à puces concise, sans introduction ni conclusion. Si aucun fait n'est utile, réponds « Aucun fait utile »."""
+ERROR_PREFIX = "**⚠️ Erreur"  # réponses d'erreur de call_openai (jamais enregistrées)
 
 class BaseAgent:
     """Classe de base pour tous les agents spécialisés."""
 
-    def __init__(self, domain: str, description: str, use_web_search: bool = False):
+    # Périmètre de recherche par défaut (filtre de métadonnées, cf. doc_metadata.py) ; None : tout le dossier
+    SCOPE: Optional[Dict] = None
+
+    def __init__(self, domain: str, description: str, use_web_search: bool = False,
+                 dossier: Optional[str] = None):
         self.domain = domain
         self.description = description
         self.use_web_search = use_web_search
-
-    def get_rag_context(self, query: str) -> str:
-        """Récupère le contexte depuis le RAG."""
-        return build_context(query)
+        self.dossier = dossier or DEFAULT_DOSSIER
+        self.company = dossier_company(self.dossier)
+        self._template_hash = None
+        self.component = f"agent:{domain}"  # nom des mesures de latence (cf. metrics.py)
+
+    def rendered_prompts(self) -> List[Dict]:
+        """
+        Arguments des appels call_openai de generate_diagnostic, contexte remplacé par des
+        marqueurs : le gabarit effectivement envoyé, sans appel LLM.
+        """
+        calls = []
+        signature = inspect.signature(type(self).call_openai)
+
+        def record_call(*args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            calls.append({k: v for k, v in bound.arguments.items() if k != "self"})
+            return ""
+
+        probe = copy.copy(self)  # l'agent lui-même reste utilisable par d'autres threads
+        probe.call_openai = record_call
+        probe.generate_diagnostic("<CONTEXTE>", "<WEB>")
+        return calls
+
+    def template_hash(self) -> str:
+        """
+        Empreinte du gabarit de prompt (prompts rendus et paramètres de construction du
+        contexte) : un prompt modifié rend les diagnostics enregistrés obsolètes, une
+        réécriture du code qui ne change pas les prompts non.
+        """
+        if self._template_hash is None:
+            parts = {
+                "prompt_version": PROMPT_VERSION,
+                "domain": self.domain,
+                "description": self.description,
+                "use_web_search": self.use_web_search,
+                "scope": self.SCOPE,
+                "max_context_tokens": MAX_CONTEXT_TOKENS,
+                "map_reduce": [MAP_REDUCE, MAP_GROUP_TOKENS, MAX_REDUCE_ROUNDS, MAP_SYSTEM_PROMPT, MAP_PROMPT],
+                "prompts": self.rendered_prompts(),
+            }
+            payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+            self._template_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        return self._template_hash
+
+    def get_rag_context(self, query: str, report: Optional[Dict] = None) -> str:
+        """
+        Récupère le contexte depuis le RAG (limité au dossier de l'agent et à son périmètre).
+        Si aucun document du dossier n'entre dans le périmètre, tout le dossier est interrogé.
+        `report` reçoit le coût du re-classement (cf. rag_query.build_context).
+        """
+        if self.SCOPE:
+            context = build_context(query, dossiers=[self.dossier], filters=self.SCOPE, report=report)
+            if context:
+                return context
+            print(f"⚠️ Aucun document dans le périmètre {self.SCOPE} : recherche sur tout le dossier")
+        return build_context(query, dossiers=[self.dossier], report=report)
+
+    def get_structured_context(self, query: str) -> str:
+        """Données structurées obtenues sans LLM (aucune par défaut)."""
+        return ""
 
     def web_search(self, query: str, max_results: int = 3) -> List[Dict]:
         """Effectue une recherche web avec DuckDuckGo."""
@@ -84,12 +141,21 @@ class BaseAgent:
             return results
 
         except Exception as e:
+            record_error(self.component, "web_search")
             print(f"⚠️ Recherche web échouée (ignorée): {str(e)[:100]}")
             # Ne pas bloquer si la recherche web échoue
             return []
 
-    def call_openai(self, system_prompt: str, user_prompt: str, temperature: float = 0.3) -> str:
-        """Appelle l'API OpenAI avec gestion d'erreurs."""
+    def call_openai(self, system_prompt: str, user_prompt: str, temperature: float = 0.3,
+                    context: str = "") -> str:
+        """
+        Appelle l'API OpenAI avec gestion d'erreurs.
+        Le contexte documentaire précède les consignes : un même contexte (diagnostic relancé,
+        questions sur le même périmètre) forme un début de prompt stable, servi par le cache
+        de préfixe d'OpenAI.
+        """
+        if context:
+            user_prompt = f"{context}\n\n{user_prompt}"
         try:
             # Compter les tokens du prompt complet
             total_prompt = system_prompt + user_prompt
@@ -99,22 +165,22 @@ class BaseAgent:
             if prompt_tokens > 120000:  # Limite de sécurité
                 raise ValueError(f"Le prompt ({prompt_tokens:,} tokens) dépasse la limite de sécurité (120,000 tokens)")
 
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=[
+            result, metrics = complete(
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
+                provider="openai",
+                model=MODEL,
+                source=f"diagnostic:{self.domain}",
                 temperature=temperature,
             )
-
-            result = response.choices[0].message.content
-            result_tokens = count_tokens(result)
-            print(f"✅ Réponse générée: {result_tokens:,} tokens")
+            print(format_usage(metrics))
 
             return result
 
         except Exception as e:
+            record_error(self.component, "llm")
             error_msg = str(e)
             if "context_length_exceeded" in error_msg:
                 return f"""**⚠️ Erreur: Contexte trop long**
@@ -136,6 +202,42 @@ Une erreur s'est produite lors de la communication avec l'API OpenAI.
 
 Veuillez réessayer ou contactez l'administrateur."""
 
+    def extract_facts(self, group: str) -> str:
+        """Phase map : faits utiles au diagnostic extraits d'un groupe de contexte (exceptions propagées)."""
+        user_prompt = MAP_PROMPT.format(domain=self.domain, company=self.company, description=self.description)
+        result, metrics = complete(
+            [
+                {"role": "system", "content": MAP_SYSTEM_PROMPT},
+                {"role": "user", "content": f"{group}\n\n{user_prompt}"}
+            ],
+            provider="openai",
+            model=MODEL,
+            source=f"diagnostic:{self.domain}:map",
+            temperature=0,
+        )
+        return result
+
+    def reduce_context(self, context: str, max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+        """
+        Map-reduce d'un contexte trop long : groupes de MAP_GROUP_TOKENS tokens traités en
+        parallèle (MAP_WORKERS), faits réunis dans l'ordre ; nouvelle passe s'ils dépassent
+        encore `max_tokens`. Un groupe en échec fait échouer le diagnostic (pas de perte silencieuse).
+        """
+        for round_no in range(1, MAX_REDUCE_ROUNDS + 1):
+            groups = split_context(context, MAP_GROUP_TOKENS)
+            print(f"🗂️ Map-reduce (passe {round_no}) : {len(groups)} groupes de ≤ {MAP_GROUP_TOKENS:,} tokens")
+            with timed(self.component, "map") as info, ThreadPoolExecutor(max_workers=MAP_WORKERS) as pool:
+                info.update(groups=len(groups), round=round_no)
+                facts = list(pool.map(self.extract_facts, groups))
+            context = "\n\n".join(f"=== FAITS EXTRAITS (partie {i}/{len(facts)}) ===\n{f.strip()}"
+                                   for i, f in enumerate(facts, 1))
+            tokens = count_tokens(context)
+            print(f"📉 Faits extraits : {tokens:,} tokens")
+            if tokens <= max_tokens:
+                return context
+        print(f"⚠️ Faits encore trop longs après {MAX_REDUCE_ROUNDS} passes, troncature à {max_tokens:,} tokens")
+        return truncate_context(context, max_tokens)
+
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         """Génère un diagnostic basé sur le contexte."""
         raise NotImplementedError("Chaque agent doit implémenter sa propre méthode de diagnostic")
@@ -143,26 +245,41 @@ Veuillez réessayer ou contactez l'administrateur."""
     def run(self, custom_query: Optional[str] = None) -> str:
         """Exécute l'agent pour générer un diagnostic."""
         # Construction du contexte RAG
-        query = custom_query or f"Informations sur {self.domain} de E-Center"
+        query = custom_query or f"Informations sur {self.domain} de {self.company}"
         print(f"🔍 Récupération du contexte RAG pour: {self.domain}")
-        rag_context = self.get_rag_context(query)
+        report = {}  # coût du re-classement, complété par le temps LLM (page Performances)
+        with timed(self.component, "rag_context") as info:
+            rag_context = self.get_rag_context(query, report)
+
+            # Faits tabulaires résolus localement : le LLM n'a plus qu'à les commenter
+            structured_context = self.get_structured_context(query)
 
-        # Compter les tokens du contexte RAG
-        rag_tokens = count_tokens(rag_context)
-        print(f"📊 Contexte RAG: {rag_tokens:,} tokens")
+            # Compter les tokens du contexte RAG
+            rag_tokens = count_tokens(rag_context) + count_tokens(structured_context)
+            print(f"📊 Contexte RAG: {rag_tokens:,} tokens")
+            info["context_tokens"] = rag_tokens
 
-        # Tronquer si nécessaire
         if rag_tokens > MAX_CONTEXT_TOKENS:
-            print(f"⚠️ Contexte trop long, troncature à {MAX_CONTEXT_TOKENS:,} tokens")
-            rag_context = truncate_context(rag_context, MAX_CONTEXT_TOKENS)
-            rag_tokens = count_tokens(rag_context)
-            print(f"✂️ Contexte tronqué: {rag_tokens:,} tokens")
+            if MAP_REDUCE:
+                # Faits extraits par groupes en parallèle ; les valeurs exactes des tableaux restent telles quelles
+                print(f"⚠️ Contexte trop long ({rag_tokens:,} tokens) : map-reduce")
+                try:
+                    rag_context = self.reduce_context(rag_context, MAX_CONTEXT_TOKENS - count_tokens(structured_context))
+                except Exception as e:  # erreur déjà enregistrée par timed(..., "map")
+                    return f"{ERROR_PREFIX} lors de l'extraction des faits du contexte**\n\n**Détails:** {str(e)[:300]}"
+            else:
+                print(f"⚠️ Contexte trop long, troncature à {MAX_CONTEXT_TOKENS:,} tokens")
+                rag_context = truncate_context(rag_context, MAX_CONTEXT_TOKENS - count_tokens(structured_context))
+            print(f"✂️ Contexte réduit: {count_tokens(rag_context) + count_tokens(structured_context):,} tokens")
+        if structured_context:
+            rag_context = f"{structured_context}\n\n{rag_context}"
 
         # Recherche web si activée
         web_context = ""
         if self.use_web_search:
             print(f"🌐 Recherche web pour: {self.domain}")
-            web_results = self.web_search(f"E-Center {self.domain} France")
+            with timed(self.component, "web_search"):
+                web_results = self.web_search(f"{self.company} {self.domain} France")
             if web_results:
                 web_context = "\n\n=== INFORMATIONS WEB (sources externes) ===\n"
                 for i, result in enumerate(web_results, 1):
@@ -172,28 +289,29 @@ Veuillez réessayer ou contactez l'administrateur."""
 
         # Génération du diagnostic
         print(f"🤖 Génération du diagnostic {self.domain}...")
-        return self.generate_diagnostic(rag_context, web_context)
+        start = time.perf_counter()
+        with timed(self.component, "llm"):
+            diagnostic = self.generate_diagnostic(rag_context, web_context)
+        if not diagnostic.startswith(ERROR_PREFIX):
+            record_llm_time(len(rag_context), time.perf_counter() - start, report)
+        return diagnostic
 
 
 class MarcheAgent(BaseAgent):
     """Agent spécialisé dans l'analyse du marché actuel."""
 
-    def __init__(self):
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Marché actuel",
             description="Analyse le marché actuel, les tendances, la taille du marché et les opportunités",
-            use_web_search=True
+            use_web_search=True,
+            dossier=dossier
         )
 
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un analyste de marché expert en restructuration d'entreprise."
 
-        user_prompt = f"""Génère un diagnostic professionnel et détaillé sur le marché actuel de E-Center.
-
-CONTEXTE INTERNE (Documents E-Center):
-{context}
-
-{web_context}
+        user_prompt = f"""Génère un diagnostic professionnel et détaillé sur le marché actuel de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Vue d'ensemble du marché**
@@ -218,26 +336,25 @@ STRUCTURE DU DIAGNOSTIC:
 
 Fournis une analyse approfondie, factuelle et professionnelle. Utilise des données chiffrées quand disponibles."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE INTERNE (Documents {self.company}):\n{context}" + web_context
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class ProduitAgent(BaseAgent):
     """Agent spécialisé dans l'analyse des produits/services."""
 
-    def __init__(self):
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Produit",
             description="Analyse les produits et services, leur valeur ajoutée et leur performance",
-            use_web_search=False
+            use_web_search=False,
+            dossier=dossier
         )
 
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un expert en stratégie produit et innovation."
 
-        user_prompt = f"""Génère un diagnostic professionnel sur les produits et services de E-Center.
-
-CONTEXTE (Documents E-Center):
-{context}
+        user_prompt = f"""Génère un diagnostic professionnel sur les produits et services de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Catalogue de produits/services**
@@ -266,28 +383,25 @@ STRUCTURE DU DIAGNOSTIC:
 
 Sois précis, factuel et professionnel dans ton analyse."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE (Documents {self.company}):\n{context}"
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class ConcurrenceAgent(BaseAgent):
     """Agent spécialisé dans l'analyse concurrentielle."""
 
-    def __init__(self):
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Concurrence",
             description="Analyse les concurrents, leur positionnement et les avantages compétitifs",
-            use_web_search=True
+            use_web_search=True,
+            dossier=dossier
         )
 
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un expert en stratégie concurrentielle et intelligence économique."
 
-        user_prompt = f"""Tu es un analyste concurrentiel expert. Génère un diagnostic professionnel sur l'environnement concurrentiel de E-Center.
-
-CONTEXTE INTERNE (Documents E-Center):
-{context}
-
-{web_context}
+        user_prompt = f"""Tu es un analyste concurrentiel expert. Génère un diagnostic professionnel sur l'environnement concurrentiel de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Cartographie des concurrents**
@@ -295,11 +409,11 @@ STRUCTURE DU DIAGNOSTIC:
    - Concurrents indirects et substituts
 
 2. **Analyse comparative**
-   - Forces et faiblesses relatives de E-Center
+   - Forces et faiblesses relatives de {self.company}
    - Positionnement prix/qualité
 
 3. **Avantages compétitifs**
-   - Différenciateurs clés de E-Center
+   - Différenciateurs clés de {self.company}
    - Barrières à l'entrée du secteur
 
 4. **Stratégies concurrentielles observées**
@@ -316,26 +430,25 @@ STRUCTURE DU DIAGNOSTIC:
 
 Fournis une analyse détaillée, objective et professionnelle."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE INTERNE (Documents {self.company}):\n{context}" + web_context
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class HistoireAgent(BaseAgent):
     """Agent spécialisé dans l'analyse historique de l'entreprise."""
 
-    def __init__(self):
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Histoire",
             description="Retrace l'historique de l'entreprise, ses événements clés et son évolution",
-            use_web_search=False
+            use_web_search=False,
+            dossier=dossier
         )
 
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un expert en analyse historique d'entreprise et restructuration."
 
-        user_prompt = f"""Tu es un analyste d'entreprise expert. Génère un diagnostic historique professionnel de E-Center.
-
-CONTEXTE (Documents E-Center):
-{context}
+        user_prompt = f"""Tu es un analyste d'entreprise expert. Génère un diagnostic historique professionnel de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Chronologie de l'entreprise**
@@ -367,26 +480,25 @@ STRUCTURE DU DIAGNOSTIC:
 
 Construis une analyse chronologique détaillée et professionnelle."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE (Documents {self.company}):\n{context}"
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class ProcessAgent(BaseAgent):
     """Agent spécialisé dans l'analyse des processus opérationnels."""
 
-    def __init__(self):
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Process",
             description="Analyse les processus opérationnels, l'organisation et l'efficience",
-            use_web_search=False
+            use_web_search=False,
+            dossier=dossier
         )
 
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un expert en excellence opérationnelle et optimisation de processus."
 
-        user_prompt = f"""Tu es un expert en excellence opérationnelle. Génère un diagnostic professionnel sur les processus de E-Center.
-
-CONTEXTE (Documents E-Center):
-{context}
+        user_prompt = f"""Tu es un expert en excellence opérationnelle. Génère un diagnostic professionnel sur les processus de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Cartographie des processus**
@@ -417,26 +529,43 @@ STRUCTURE DU DIAGNOSTIC:
 
 Fournis une analyse opérationnelle détaillée et professionnelle."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE (Documents {self.company}):\n{context}"
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class ChiffreAgent(BaseAgent):
     """Agent spécialisé dans l'analyse financière."""
 
-    def __init__(self):
+    SCOPE = {"doc_type": ["comptes", "cessation"]}
+
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Chiffre",
             description="Analyse les données financières, la rentabilité et la santé financière",
-            use_web_search=False
+            use_web_search=False,
+            dossier=dossier
         )
 
+    @property
+    def table_engine(self) -> TableQueryEngine:
+        """Moteur sur all_tables.json, reconstruit après une fusion des tableaux ou une réindexation."""
+        return TableQueryEngine.for_file(dossier_paths(self.dossier)["tables"])
+
+    def answer_structured(self, question: str) -> Optional[Dict]:
+        """Répond à une question chiffrée directement depuis les tableaux (sans LLM)."""
+        return self.table_engine.answer(question)
+
+    def get_structured_context(self, query: str) -> str:
+        result = self.answer_structured(query)
+        if not result:
+            return ""
+        print(f"📊 {len(result['results'])} série(s) chiffrée(s) trouvée(s) sans LLM")
+        return "=== DONNÉES CHIFFRÉES (tableaux extraits, valeurs exactes) ===\n" + format_markdown(result)
+
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un expert en analyse financière et restructuration d'entreprise."
 
-        user_prompt = f"""Tu es un analyste financier expert. Génère un diagnostic financier professionnel de E-Center.
-
-CONTEXTE (Documents E-Center incluant comptes annuels et données financières):
-{context}
+        user_prompt = f"""Tu es un analyste financier expert. Génère un diagnostic financier professionnel de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Analyse du chiffre d'affaires**
@@ -472,28 +601,27 @@ STRUCTURE DU DIAGNOSTIC:
 
 Utilise TOUS les chiffres disponibles dans le contexte. Présente des tableaux si pertinent. Sois précis et professionnel."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE (Documents {self.company} incluant comptes annuels et données financières):\n{context}"
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class JuridiqueAgent(BaseAgent):
     """Agent spécialisé dans l'analyse juridique."""
 
-    def __init__(self):
+    SCOPE = {"doc_type": ["jugement", "plan", "rapport"]}  # le rapport de l'administrateur porte le projet de plan
+
+    def __init__(self, dossier: Optional[str] = None):
         super().__init__(
             domain="Juridique",
             description="Analyse les aspects juridiques, réglementaires et les procédures en cours",
-            use_web_search=True
+            use_web_search=True,
+            dossier=dossier
         )
 
     def generate_diagnostic(self, context: str, web_context: str = "") -> str:
         system_prompt = "Tu es un expert en droit des entreprises en difficulté et restructuration."
 
-        user_prompt = f"""Tu es un juriste expert en droit des entreprises en difficulté. Génère un diagnostic juridique professionnel de E-Center.
-
-CONTEXTE INTERNE (Documents juridiques E-Center):
-{context}
-
-{web_context}
+        user_prompt = f"""Tu es un juriste expert en droit des entreprises en difficulté. Génère un diagnostic juridique professionnel de {self.company}.
 
 STRUCTURE DU DIAGNOSTIC:
 1. **Statut juridique**
@@ -529,22 +657,25 @@ STRUCTURE DU DIAGNOSTIC:
 
 Fournis une analyse juridique détaillée, rigoureuse et professionnelle."""
 
-        return self.call_openai(system_prompt, user_prompt)
+        context = f"CONTEXTE INTERNE (Documents juridiques {self.company}):\n{context}" + web_context
+        return self.call_openai(system_prompt, user_prompt, context=context)
 
 
 class DiagnosticRouter:
     """Routeur intelligent pour diriger les questions vers le bon agent."""
 
-    def __init__(self):
+    def __init__(self, dossier: Optional[str] = None):
+        self.dossier = dossier or DEFAULT_DOSSIER
         self.agents = {
-            "marche": MarcheAgent(),
-            "produit": ProduitAgent(),
-            "concurrence": ConcurrenceAgent(),
-            "histoire": HistoireAgent(),
-            "process": ProcessAgent(),
-            "chiffre": ChiffreAgent(),
-            "juridique": JuridiqueAgent()
+            "marche": MarcheAgent(self.dossier),
+            "produit": ProduitAgent(self.dossier),
+            "concurrence": ConcurrenceAgent(self.dossier),
+            "histoire": HistoireAgent(self.dossier),
+            "process": ProcessAgent(self.dossier),
+            "chiffre": ChiffreAgent(self.dossier),
+            "juridique": JuridiqueAgent(self.dossier)
         }
+        self.store = DiagnosticStore(self.dossier)
 
         self.keywords = {
             "marche": ["marché", "secteur", "industrie", "tendance", "opportunité", "menace", "croissance"],
@@ -577,38 +708,66 @@ class DiagnosticRouter:
             # Par défaut, utiliser l'agent général (marché)
             return "marche"
 
+    def stored_diagnostic(self, domain: str, query: Optional[str] = None) -> Tuple[Optional[Dict], str]:
+        """Diagnostic enregistré et son statut (à jour, obsolète, absent)."""
+        return self.store.load(domain, self.agents[domain].template_hash(), MODEL, query)
+
+    def get_diagnostic(self, domain: str, query: Optional[str] = None, force: bool = False) -> Tuple[str, str]:
+        """
+        Retourne (diagnostic, statut) : le diagnostic enregistré s'il est à jour,
+        sinon il est régénéré (et enregistré, sauf erreur).
+        """
+        agent = self.agents[domain]
+        if not force:
+            entry, status = self.stored_diagnostic(domain, query)
+            if status == FRESH:
+                record(agent.component, "store_hit", 0.0)
+                print(f"💾 Diagnostic {agent.domain} à jour, réutilisé ({entry['created']})")
+                return entry["content"], status
+
+        content = agent.run(custom_query=query)
+        if not content.startswith(ERROR_PREFIX):
+            self.store.save(domain, agent.template_hash(), MODEL, content, query)
+        return content, "généré"
+
+    def stale_reasons(self, domain: str, entry: Dict) -> List[str]:
+        return self.store.stale_reasons(entry, domain, self.agents[domain].template_hash(), MODEL)
+
+    def diagnostics_status(self) -> Dict[str, str]:
+        return {domain: self.stored_diagnostic(domain)[1] for domain in self.agents}
+
     def route_query(self, query: str) -> Tuple[str, str]:
         """Route une question vers l'agent approprié et retourne le diagnostic."""
         domain = self.identify_domain(query)
         agent = self.agents[domain]
 
         print(f"🎯 Question routée vers l'agent: {agent.domain}")
-        response = agent.run(custom_query=query)
+        response, _ = self.get_diagnostic(domain, query=query)
 
         return agent.domain, response
 
-    def generate_all_diagnostics(self) -> Dict[str, str]:
-        """Génère tous les diagnostics pour tous les domaines."""
+    def generate_all_diagnostics(self, force: bool = False) -> Dict[str, str]:
+        """Génère tous les diagnostics ; seuls les absents ou obsolètes sont régénérés (sauf `force`)."""
         diagnostics = {}
 
         for domain, agent in self.agents.items():
-            print(f"\n🔄 Génération du diagnostic: {agent.domain}")
-            diagnostics[domain] = agent.run()
+            print(f"\n🔄 Diagnostic: {agent.domain}")
+            diagnostics[domain], _ = self.get_diagnostic(domain, force=force)
 
         return diagnostics
 
 
 # === FONCTIONS UTILITAIRES ===
 
-def generate_full_report() -> Dict[str, str]:
-    """Génère un rapport complet avec tous les diagnostics."""
-    router = DiagnosticRouter()
-    return router.generate_all_diagnostics()
+def generate_full_report(dossier: Optional[str] = None, force: bool = False) -> Dict[str, str]:
+    """Génère un rapport complet avec tous les diagnostics (réutilise ceux qui sont à jour)."""
+    router = DiagnosticRouter(dossier)
+    return router.generate_all_diagnostics(force=force)
 
 
-def answer_question(query: str) -> Tuple[str, str]:
+def answer_question(query: str, dossier: Optional[str] = None) -> Tuple[str, str]:
     """Répond à une question en utilisant l'agent spécialisé approprié."""
-    router = DiagnosticRouter()
+    router = DiagnosticRouter(dossier)
     return router.route_query(query)
 
 
@@ -0,0 +1,105 @@
+"""
+Stockage persistant des diagnostics générés (un fichier JSON par agent et par question).
+
+Un diagnostic est réutilisé tant que sa clé n'a pas changé :
+- agent (marche, chiffre, ...) et question (requête par défaut ou question ciblée)
+- empreinte du gabarit de prompt de l'agent (cf. BaseAgent.template_hash)
+- modèle LLM
+- version du corpus : génération d'index servie (cf. index_generations.py), empreinte de
+  l'index, des chunks, du BM25 et des tableaux du dossier
+
+Statuts : "à jour" (réutilisable tel quel), "obsolète" (clé différente : documents,
+prompt ou modèle modifiés), "absent".
+
+    dossiers/<nom>/diagnostics/
+    ├── marche.json
+    ├── chiffre.json
+    └── chiffre-<hash question>.json
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from dossiers import DEFAULT_DOSSIER, dossier_paths
+from index_generations import index_paths
+from file_utils import atomic_write, file_sha256
+
+# === CONFIG ===
+STORE_VERSION = 1
+CORPUS_FILES = ("index", "chunks", "bm25", "tables")  # artefacts dont dépendent les diagnostics
+
+FRESH, STALE, MISSING = "à jour", "obsolète", "absent"
+
+_hash_cache = {}  # empreintes des fichiers du corpus (recalculées si date ou taille changent)
+
+
+def corpus_version(dossier: Optional[str] = None) -> str:
+    """Empreinte de l'index servi (génération courante) et des tableaux d'un dossier."""
+    paths = index_paths(dossier)
+    h = hashlib.sha256((paths["generation"] or "-").encode())
+    for name in CORPUS_FILES:
+        path = paths[name]
+        h.update(name.encode())
+        h.update(file_sha256(path, _hash_cache).encode() if os.path.exists(path) else b"-")
+    return h.hexdigest()[:16]
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()[:12]
+
+
+class DiagnosticStore:
+    """Diagnostics d'un dossier, réutilisés tant que leur clé est inchangée."""
+
+    def __init__(self, dossier: Optional[str] = None):
+        self.dossier = dossier or DEFAULT_DOSSIER
+        self.folder = dossier_paths(self.dossier)["diagnostics"]
+
+    def path(self, agent_key: str, query: Optional[str] = None) -> str:
+        name = agent_key if not query else f"{agent_key}-{query_hash(query)}"
+        return os.path.join(self.folder, f"{name}.json")
+
+    def key(self, agent_key: str, template_hash: str, model: str, query: Optional[str] = None) -> Dict:
+        return {
+            "version": STORE_VERSION,
+            "agent": agent_key,
+            "query": query or "",
+            "template_hash": template_hash,
+            "model": model,
+            "corpus_version": corpus_version(self.dossier),  # fichiers re-hashés seulement s'ils ont changé
+        }
+
+    def load(self, agent_key: str, template_hash: str, model: str,
+             query: Optional[str] = None) -> Tuple[Optional[Dict], str]:
+        """Retourne (entrée enregistrée, statut). Une entrée obsolète est retournée pour affichage."""
+        path = self.path(agent_key, query)
+        if not os.path.exists(path):
+            return None, MISSING
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None, MISSING
+        fresh = entry.get("key") == self.key(agent_key, template_hash, model, query)
+        return entry, FRESH if fresh else STALE
+
+    def save(self, agent_key: str, template_hash: str, model: str, content: str,
+             query: Optional[str] = None) -> Dict:
+        entry = {
+            "key": self.key(agent_key, template_hash, model, query),
+            "content": content,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        atomic_write(self.path(agent_key, query), json.dumps(entry, indent=2, ensure_ascii=False))
+        return entry
+
+    def stale_reasons(self, entry: Dict, agent_key: str, template_hash: str, model: str,
+                      query: Optional[str] = None) -> list:
+        """Éléments de la clé qui ont changé depuis la génération (documents, prompt, modèle)."""
+        labels = {"corpus_version": "documents", "template_hash": "prompt", "model": "modèle"}
+        current = self.key(agent_key, template_hash, model, query)
+        stored = entry.get("key", {})
+        return [label for field, label in labels.items() if stored.get(field) != current[field]]
@@ -0,0 +1,153 @@
+"""
+Métadonnées des chunks : type de document, date et page, posées à l'indexation.
+
+- doc_type : d'après le nom du fichier, à défaut le début du texte (DOC_TYPES).
+- date : date du document (ISO, « AAAA-MM-JJ » ou « AAAA » si seule l'année est connue),
+  prise dans le nom du fichier puis dans le début du texte.
+- page : page du PDF où commence le chunk ; None pour l'en-tête et la section des
+  tableaux. Dans le texte extrait (pdf_extract.py), chaque page est un bloc suivi d'une
+  ligne vide (format_page), une page sans texte le bloc EMPTY_PAGE : le n-ième bloc de la
+  section texte est la n-ième page du PDF. Les pages sont numérotées sur le texte brut,
+  avant nettoyage (une page vidée par text_normalize.py ne décale pas les suivantes).
+
+Les filtres de recherche (rag_query.retrieve) portent sur ces champs :
+
+    {"doc_type": ["jugement", "plan"], "date_from": "2024", "date_to": "2025-06-30", "pages": (1, 5)}
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# === CONFIG ===
+METADATA_VERSION = 2  # à incrémenter si les règles changent : invalide l'index
+PAGE_FORMAT_VERSION = 1  # format des pages du texte extrait (format_page) : à incrémenter pour ré-extraire
+EMPTY_PAGE = "[page vide]"  # bloc d'une page sans texte : la numérotation des suivantes est conservée
+# (type, motif) dans l'ordre : le premier qui correspond l'emporte
+DOC_TYPES = (
+    ("cessation", r"cessation\s+des\s+paiements"),
+    ("comptes", r"comptes\s+annuels|bilan|liasse\s+fiscale"),
+    ("jugement", r"jugement|ordonnance"),
+    ("plan", r"projet\s+de\s+plan|plan\s+de\s+(?:sauvegarde|redressement|continuation|cession)"),
+    ("rapport", r"rapport"),
+)
+OTHER_TYPE = "autre"
+HEAD_CHARS = 1500  # début du texte examiné quand le nom du fichier ne suffit pas
+SECTION_PREFIX = "====="  # en-têtes de pdf_extract.py (texte extrait, tableaux)
+TABLES_SECTION = "===== TABLEAUX"
+
+MONTHS = {"janvier": 1, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6, "juillet": 7,
+          "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11, "decembre": 12}
+TEXT_DATE_RE = re.compile(r"(?<!\d)(\d{1,2})(?:er)?[\s_]+(" + "|".join(MONTHS) + r")[\s_]+(\d{4})(?!\d)")
+NUMERIC_DATE_RE = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+YEAR_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+BLANK_LINES_RE = re.compile(r"\n\s*\n")
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents, pour les motifs."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+# === DOCUMENT ===
+def doc_type(doc_id: str, text: str = "") -> str:
+    for source in (fold(doc_id), fold(text[:HEAD_CHARS])):
+        for name, pattern in DOC_TYPES:
+            if re.search(pattern, source):
+                return name
+    return OTHER_TYPE
+
+
+def find_date(text: str, year_only: bool = False) -> Optional[str]:
+    """Première date (« 25 novembre 2016 », « 25/11/2016 ») d'un texte, ou une année seule."""
+    text = fold(text)
+    found = []
+    m = TEXT_DATE_RE.search(text)
+    if m:
+        found.append((m.start(), f"{m.group(3)}-{MONTHS[m.group(2)]:02d}-{int(m.group(1)):02d}"))
+    m = NUMERIC_DATE_RE.search(text)
+    if m and 1 <= int(m.group(2)) <= 12:
+        found.append((m.start(), f"{m.group(3)}-{m.group(2)}-{m.group(1)}"))
+    if found:
+        return min(found)[1]
+    m = YEAR_RE.search(text) if year_only else None
+    return m.group(1) if m else None
+
+
+def doc_date(doc_id: str, text: str = "") -> Optional[str]:
+    return find_date(doc_id, year_only=True) or find_date(text[:HEAD_CHARS])
+
+
+def describe(doc_id: str, text: str = "") -> Dict:
+    """Métadonnées communes aux chunks d'un document."""
+    return {"doc_type": doc_type(doc_id, text), "date": doc_date(doc_id, text)}
+
+
+# === PAGES ===
+def format_page(text: Optional[str]) -> str:
+    """Bloc d'une page dans le texte extrait : sans ligne vide interne (OCR), EMPTY_PAGE si vide."""
+    text = BLANK_LINES_RE.sub("\n", (text or "").strip())
+    return text or EMPTY_PAGE
+
+
+def text_blocks(text: str) -> Iterator[Tuple[int, str, Optional[int]]]:
+    """(position de début, bloc, page) des blocs non vides d'un texte extrait ; page None hors des pages."""
+    page, in_pages, pos = 0, True, 0
+    for block in text.split("\n\n"):
+        head = block.lstrip()
+        if head.startswith(TABLES_SECTION):
+            in_pages = False
+        if head:
+            is_page = in_pages and not head.startswith(SECTION_PREFIX)
+            page += is_page
+            yield pos, block, page if is_page else None
+        pos += len(block) + 2
+
+
+def page_blocks(text: str) -> List[Tuple[int, Optional[int]]]:
+    """(position de début, page) de chaque bloc d'un texte extrait."""
+    return [(pos, page) for pos, _, page in text_blocks(text)] or [(0, None)]
+
+
+def page_at(marks: Sequence[Tuple[int, Optional[int]]], position: int) -> Optional[int]:
+    """Page du bloc qui contient `position` (marques triées par position)."""
+    i = bisect_left(marks, (position + 1,)) - 1  # dernière marque commençant à `position` ou avant
+    return marks[max(i, 0)][1]
+
+
+# === FILTRES ===
+def as_list(value) -> List:
+    return list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+
+
+def filter_key(filters: Optional[Dict]) -> Tuple:
+    """Forme hashable d'un filtre (cache des sélections)."""
+    return tuple(sorted((k, tuple(as_list(v))) for k, v in (filters or {}).items() if v is not None))
+
+
+def matches(chunk: Dict, filters: Optional[Dict]) -> bool:
+    """
+    Vrai si le chunk satisfait le filtre. Un chunk sans la métadonnée filtrée (index
+    antérieur, date inconnue...) n'est pas écarté : le filtre ne s'applique qu'à ce qui est connu.
+    """
+    if not filters:
+        return True
+    doc_types = filters.get("doc_type")
+    if doc_types and chunk.get("doc_type") and chunk["doc_type"] not in as_list(doc_types):
+        return False
+    date = chunk.get("date")
+    if date:
+        # comparaison sur la précision commune : « 2016 » est dans [2016-01-01, 2016-12-31]
+        date_from, date_to = filters.get("date_from"), filters.get("date_to")
+        if date_from and date[:len(date_from)] < date_from[:len(date)]:
+            return False
+        if date_to and date[:len(date_to)] > date_to[:len(date)]:
+            return False
+    pages, page = filters.get("pages"), chunk.get("page")
+    if pages is not None and page is not None:
+        first, last = (pages, pages) if isinstance(pages, int) else pages
+        if not first <= page <= last:
+            return False
+    return True
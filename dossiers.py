@@ -0,0 +1,132 @@
+"""
+Gestion des dossiers de restructuration (un shard d'index par dossier).
+Chaque dossier possède ses textes, ses tableaux et son index :
+
+    dossiers/<nom>/
+    ├── raw_data/          # PDF sources
+    ├── texts/             # textes extraits
+    ├── tables/            # tableaux extraits par source (cache du pipeline)
+    ├── all_tables.json    # tableaux extraits (fusion)
+    ├── index_generations/ # générations de l'index (cf. index_generations.py) :
+    │   ├── CURRENT        #   génération servie
+    │   └── gen-<date>/    #   index.faiss, chunks.json, bm25.json, embeddings.npy
+    ├── dossier.json       # métadonnées ({"company": "E-Center"})
+    ├── pipeline_state.json  # empreintes des artefacts (cf. pipeline.py)
+    ├── index_stats.json   # dernière indexation : durées, débit, mémoire (page Performances)
+    └── diagnostics/       # diagnostics générés (cf. diagnostic_store.py)
+
+Le dossier historique E-Center reste servi depuis les chemins d'origine
+(data/texts, index_debug.faiss, ...) tant qu'il n'a pas été migré dans dossiers/.
+Les clés index, chunks, bm25 et embeddings désignent l'index d'avant les générations :
+utiliser index_generations.index_paths() pour l'index servi.
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+# === CONFIG ===
+DOSSIERS_DIR = os.getenv("DOSSIERS_DIR", "dossiers")
+LEGACY_DOSSIER = "e-center"
+LEGACY_COMPANY = "E-Center"
+DEFAULT_DOSSIER = os.getenv("DOSSIER", LEGACY_DOSSIER)
+
+LEGACY_PATHS = {
+    "raw_dir": "raw_data",
+    "text_dir": "data/texts",
+    "tables": "data/all_tables.json",
+    "tables_dir": "data/tables",
+    "index": "index_debug.faiss",
+    "chunks": "chunks_debug.json",
+    "bm25": "bm25_debug.json",
+    "embeddings": "embeddings_debug.npy",
+    "generations": "data/index_generations",
+    "meta": "data/dossier.json",
+    "state": "data/pipeline_state.json",
+    "diagnostics": "data/diagnostics",
+    "index_stats": "data/index_stats.json",
+}
+
+DOSSIER_FILES = {
+    "raw_dir": "raw_data",
+    "text_dir": "texts",
+    "tables": "all_tables.json",
+    "tables_dir": "tables",
+    "index": "index.faiss",
+    "chunks": "chunks.json",
+    "bm25": "bm25.json",
+    "embeddings": "embeddings.npy",
+    "generations": "index_generations",
+    "meta": "dossier.json",
+    "state": "pipeline_state.json",
+    "diagnostics": "diagnostics",
+    "index_stats": "index_stats.json",
+}
+
+NAME_RE = re.compile(r"[a-z0-9][a-z0-9_-]*")
+
+
+def check_name(name: str) -> str:
+    """Valide un nom de dossier (slug, pas de chemin relatif)."""
+    if not NAME_RE.fullmatch(name or ""):
+        raise ValueError(f"⚠️ Nom de dossier invalide : {name!r} (attendu : minuscules, chiffres, - ou _)")
+    return name
+
+
+def dossier_dir(name: str) -> str:
+    return os.path.join(DOSSIERS_DIR, check_name(name))
+
+
+def is_legacy(name: str) -> bool:
+    """Le dossier historique est servi depuis les chemins d'origine s'il n'a pas été migré."""
+    return name == LEGACY_DOSSIER and not os.path.isdir(dossier_dir(name))
+
+
+def dossier_paths(name: Optional[str] = None) -> Dict[str, str]:
+    """Chemins des fichiers d'un dossier (textes, tableaux, index, chunks...)."""
+    name = check_name(name or DEFAULT_DOSSIER)
+    if is_legacy(name):
+        return dict(LEGACY_PATHS)
+    base = dossier_dir(name)
+    return {key: os.path.join(base, filename) for key, filename in DOSSIER_FILES.items()}
+
+
+def list_dossiers() -> List[str]:
+    """Liste les dossiers disponibles (le dossier historique en premier s'il existe)."""
+    names = []
+    if os.path.isdir(LEGACY_PATHS["text_dir"]) or os.path.exists(LEGACY_PATHS["index"]):
+        names.append(LEGACY_DOSSIER)
+    if os.path.isdir(DOSSIERS_DIR):
+        for entry in sorted(os.listdir(DOSSIERS_DIR)):
+            if NAME_RE.fullmatch(entry) and os.path.isdir(os.path.join(DOSSIERS_DIR, entry)) and entry not in names:
+                names.append(entry)
+    return names
+
+
+def dossier_company(name: Optional[str] = None) -> str:
+    """Nom de l'entreprise d'un dossier, utilisé dans les prompts et l'interface."""
+    name = name or DEFAULT_DOSSIER
+    meta_path = dossier_paths(name)["meta"]
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            company = json.load(f).get("company")
+        if company:
+            return company
+    return LEGACY_COMPANY if name == LEGACY_DOSSIER else name
+
+
+def create_dossier(name: str, company: str) -> Dict[str, str]:
+    """Crée l'arborescence d'un nouveau dossier et ses métadonnées."""
+    paths = dossier_paths(check_name(name))
+    os.makedirs(paths["raw_dir"], exist_ok=True)
+    os.makedirs(paths["text_dir"], exist_ok=True)
+    with open(paths["meta"], "w", encoding="utf-8") as f:
+        json.dump({"company": company}, f, ensure_ascii=False, indent=2)
+    return paths
+
+
+# === TEST ===
+if __name__ == "__main__":
+    for d in list_dossiers():
+        print(f"📁 {d} ({dossier_company(d)}) → {dossier_paths(d)['index']}")
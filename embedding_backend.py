@@ -0,0 +1,197 @@
+"""
+Backends d'embedding CPU pour l'indexation et l'encodage des requêtes.
+- "torch" : SentenceTransformer PyTorch standard (référence)
+- "onnx" : ONNX Runtime (nécessite optimum[onnxruntime])
+- "onnx-int8" : modèle ONNX quantifié int8 fourni avec le modèle sur le Hub
+- "int8" : PyTorch avec quantification dynamique int8 des couches Linear
+
+Tous les backends utilisent les mêmes poids : un index construit avec l'un reste
+interrogeable avec un autre. Un fichier <index>.meta.json enregistre le modèle et
+la dimension utilisés, et signale quand une reconstruction est nécessaire.
+
+Usage : python embedding_backend.py [dossier]  → benchmark des backends.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import psutil
+from sentence_transformers import SentenceTransformer
+
+# === CONFIG ===
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ("torch", "onnx", "onnx-int8", "int8")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = valeur par défaut de la bibliothèque
+ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+BENCHMARK_PATH = "embedding_benchmark.json"
+BENCHMARK_SENTENCES = 512
+BENCHMARK_QUERIES = 50
+BENCHMARK_K = 10
+
+
+def load_embedder(model_name: str = MODEL_NAME, backend: str = EMBEDDING_BACKEND,
+                  threads: int = EMBEDDING_THREADS) -> SentenceTransformer:
+    """Charge le modèle d'embedding avec le backend et le nombre de threads demandés."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend d'embedding inconnu : {backend} (attendu : {', '.join(BACKENDS)})")
+
+    if backend in ("torch", "int8"):
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        if backend == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("⚠️ Backend ONNX indisponible : pip install optimum[onnxruntime]") from e
+
+    session_options = onnxruntime.SessionOptions()
+    if threads:
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+    model_kwargs = {"session_options": session_options, "provider": "CPUExecutionProvider"}
+    if backend == "onnx-int8":
+        model_kwargs["file_name"] = ONNX_INT8_FILE
+    return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+# === COMPATIBILITÉ DES INDEX ===
+def index_meta_path(index_path: str) -> str:
+    return f"{index_path}.meta.json"
+
+
+def write_index_meta(index_path: str, model_name: str, backend: str, dim: int):
+    """Enregistre le modèle et le backend ayant produit les vecteurs d'un index."""
+    with open(index_meta_path(index_path), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "backend": backend, "dim": dim}, f, indent=2)
+
+
+def check_index_compat(index_path: str, index_dim: int, model_name: str = MODEL_NAME,
+                       backend: str = EMBEDDING_BACKEND) -> bool:
+    """
+    Vérifie qu'un index peut être interrogé avec le modèle courant.
+    Un changement de backend seul est compatible (mêmes poids) ; un changement
+    de modèle ou de dimension impose de reconstruire l'index.
+    """
+    meta_path = index_meta_path(index_path)
+    meta = {"model": MODEL_NAME, "backend": "torch", "dim": index_dim}  # index antérieurs aux métadonnées
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta.update(json.load(f))
+
+    if meta["model"] != model_name or meta["dim"] != index_dim:
+        print(f"❌ {index_path} construit avec {meta['model']} (dim {meta['dim']}) : "
+              f"reconstruction nécessaire pour {model_name} (relancer chunking.py)")
+        return False
+    if meta["backend"] != backend:
+        print(f"ℹ️ {index_path} construit avec le backend {meta['backend']}, requêtes encodées avec "
+              f"{backend} (même modèle, compatible)")
+    return True
+
+
+# === BENCHMARK ===
+def benchmark_backend(backend: str, sentences: List[str], queries: List[str],
+                      threads: int = EMBEDDING_THREADS) -> Dict:
+    """Mesure chargement, débit, latence et mémoire d'un backend."""
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    model = load_embedder(backend=backend, threads=threads)
+    load_s = time.perf_counter() - start
+    rss_loaded = process.memory_info().rss - rss_before
+
+    model.encode(sentences[:8], convert_to_numpy=True)  # warm-up
+    start = time.perf_counter()
+    corpus_emb = model.encode(sentences, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    encode_s = time.perf_counter() - start
+
+    latencies = []
+    query_emb = []
+    for q in queries:
+        start = time.perf_counter()
+        query_emb.append(model.encode([q], convert_to_numpy=True)[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "load_s": round(load_s, 3),
+        "rss_delta_mb": round(rss_loaded / 1024 ** 2, 1),
+        "sentences_per_s": round(len(sentences) / encode_s, 1),
+        "query_latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+        "query_latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+        "corpus_emb": np.asarray(corpus_emb, dtype="float32"),
+        "query_emb": np.asarray(query_emb, dtype="float32"),
+    }
+
+
+def top_k_ids(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Top-k L2 exact (même métrique que l'index FAISS)."""
+    d = (queries ** 2).sum(1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(1)[None, :]
+    return np.argsort(d, axis=1)[:, :k]
+
+
+def run_benchmark(sentences: List[str], queries: List[str], backends: List[str] = BACKENDS,
+                  threads: int = EMBEDDING_THREADS, k: int = BENCHMARK_K) -> Dict:
+    """
+    Compare chaque backend au backend torch : débit, latence, mémoire, similarité
+    cosinus des embeddings et accord des top-k (requêtes backend vs corpus torch,
+    c'est-à-dire un index existant interrogé avec le nouveau backend).
+    """
+    results = {}
+    for backend in backends:
+        try:
+            results[backend] = benchmark_backend(backend, sentences, queries, threads)
+            print(f"✅ {backend} : {results[backend]['sentences_per_s']} phrases/s")
+        except Exception as e:
+            print(f"⚠️ Backend {backend} ignoré : {e}")
+
+    reference = results.get("torch")
+    report = {"model": MODEL_NAME, "threads": threads, "n_sentences": len(sentences),
+              "n_queries": len(queries), "k": k, "backends": {}}
+    for backend, r in results.items():
+        entry = {key: v for key, v in r.items() if not key.endswith("_emb")}
+        if reference is not None:
+            a, b = r["corpus_emb"], reference["corpus_emb"]
+            cos = (a * b).sum(1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+            entry["cosine_vs_torch_mean"] = round(float(cos.mean()), 5)
+            entry["cosine_vs_torch_min"] = round(float(cos.min()), 5)
+            ref_ids = top_k_ids(reference["corpus_emb"], reference["query_emb"], k)
+            ids = top_k_ids(reference["corpus_emb"], r["query_emb"], k)
+            overlap = [len(set(x) & set(y)) / k for x, y in zip(ref_ids, ids)]
+            entry[f"top{k}_agreement"] = round(float(np.mean(overlap)), 4)
+        report["backends"][backend] = entry
+    return report
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    from dossiers import DEFAULT_DOSSIER
+    from index_generations import index_paths
+
+    dossier = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DOSSIER
+    with open(index_paths(dossier)["chunks"], "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(chunks), size=min(BENCHMARK_SENTENCES, len(chunks)), replace=False)
+    sentences = [chunks[i]["text"] for i in sample]
+    # Requêtes courtes : premières phrases de chunks tirés au hasard
+    queries = [s.split(".")[0][:200] for s in sentences[:BENCHMARK_QUERIES]]
+
+    bench = run_benchmark(sentences, queries)
+    print(f"\n{'backend':<10} {'phrases/s':>10} {'p50 ms':>8} {'RSS Mo':>8} {'cos':>8} {'top-k':>7}")
+    for name, e in bench["backends"].items():
+        print(f"{name:<10} {e['sentences_per_s']:>10} {e['query_latency_ms_p50']:>8} {e['rss_delta_mb']:>8} "
+              f"{e.get('cosine_vs_torch_mean', '-'):>8} {e.get(f'top{BENCHMARK_K}_agreement', '-'):>7}")
+
+    with open(BENCHMARK_PATH, "w", encoding="utf-8") as f:
+        json.dump(bench, f, indent=2)
+    print(f"\n💾 Benchmark sauvegardé dans {BENCHMARK_PATH}")
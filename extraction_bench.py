@@ -0,0 +1,300 @@
+"""
+Banc d'essai de l'extraction et de la structuration des PDF (débit, mémoire, appels LLM).
+
+Pour chaque PDF de raw_data/ et des copies agrandies synthétiquement (pages répétées
+×2, ×4...) afin de mesurer le passage à l'échelle, rejoue les étapes du pipeline :
+- smart_extract : détection (detect_table), texte (pdfplumber), OCR des pages scannées,
+  tableaux (partition_pdf)
+- segment_text : segments qui partiraient au LLM depuis le texte seul
+- extract_local_tables : tableaux convertis localement, pages laissées au LLM
+- extract_tables_from_text sur ces pages, avec un faux DeepSeek local (aucun appel réseau
+  externe, latence réglable) : passerelle, réparation et validation JSON comprises
+
+Chaque cas tourne dans un processus neuf : le pic de RSS mesuré est le sien.
+Mesures : pages/s, pic mémoire, temps par étape, segments et tokens envoyés au LLM.
+Le rapport JSON est écrit dans benchmarks/ pour comparer deux versions du code.
+
+Usage :
+    python extraction_bench.py                          # PDF de raw_data/, tailles ×1 et ×4
+    python extraction_bench.py --scales 1 2 8 --stub-latency 0.5
+    python extraction_bench.py --compare benchmarks/extraction_A.json benchmarks/extraction_B.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import pypdfium2
+
+from dossiers import DEFAULT_DOSSIER, dossier_paths
+from profiler import RunProfiler
+from table_detect import NUMBER_RE, is_tabular_line
+
+# === CONFIG ===
+REPORT_DIR = "benchmarks"
+SCALES = (1, 4)
+STUB_LATENCY_S = 0.0  # délai simulé par appel au faux DeepSeek
+STUB_MAX_ROWS = 200  # lignes renvoyées au plus par réponse simulée
+CHARS_PER_TOKEN = 3.2
+EXTRACTION_STAGES = ("detect", "text", "ocr", "tables")  # étapes de smart_extract
+
+
+# === FAUX DEEPSEEK ===
+def stub_tables(prompt: str) -> Dict:
+    """Réponse plausible : une ligne de tableau par ligne tabulaire du segment reçu."""
+    segment = prompt.split("---")[1] if prompt.count("---") >= 2 else prompt
+    rows = []
+    for line in segment.splitlines():
+        if is_tabular_line(line) and len(rows) < STUB_MAX_ROWS:
+            numbers = NUMBER_RE.findall(line)
+            label = line[:line.find(numbers[0])].strip() if numbers else line.strip()
+            rows.append({"label": label or "ligne", **{f"c{i}": n for i, n in enumerate(numbers[:6], 1)}})
+    return {"tables": [{"source": "", "titre": "stub", "unit": None, "data": rows}] if rows else []}
+
+
+class DeepSeekStub:
+    """Serveur HTTP local compatible /chat/completions, à la place de l'API DeepSeek."""
+
+    def __init__(self, latency_s: float = STUB_LATENCY_S):
+        self.latency_s = latency_s
+        self.stats = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                prompt = "\n".join(m.get("content") or "" for m in request.get("messages", []))
+                if stub.latency_s:
+                    time.sleep(stub.latency_s)
+                content = json.dumps(stub_tables(prompt), ensure_ascii=False)
+                usage = {"prompt_tokens": int(len(prompt) / CHARS_PER_TOKEN) + 1,
+                         "completion_tokens": int(len(content) / CHARS_PER_TOKEN) + 1}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                with stub._lock:
+                    stub.stats["calls"] += 1
+                    stub.stats["prompt_tokens"] += usage["prompt_tokens"]
+                    stub.stats["completion_tokens"] += usage["completion_tokens"]
+                body = json.dumps({
+                    "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": request.get("model"), "usage": usage,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        self.server.shutdown()
+
+
+# === CAS DE TEST ===
+def enlarge_pdf(pdf_path: str, scale: int, out_dir: str) -> str:
+    """Copie du PDF dont les pages sont répétées `scale` fois."""
+    if scale == 1:
+        return pdf_path
+    src = pypdfium2.PdfDocument(pdf_path)
+    dst = pypdfium2.PdfDocument.new()
+    for _ in range(scale):
+        dst.import_pages(src)
+    path = os.path.join(out_dir, f"x{scale}_{os.path.basename(pdf_path)}")
+    dst.save(path)
+    dst.close()
+    src.close()
+    return path
+
+
+def bench_case(pdf_path: str, source: str) -> Dict:
+    """Étapes d'extraction d'un PDF (exécuté dans un processus dédié)."""
+    from llm_structure import estimate_tokens, extract_tables_from_text, segment_text
+    from local_tables import extract_local_tables
+    from pdf_extract import page_count, smart_extract
+
+    profiler = RunProfiler("extraction_bench")
+    n_pages = page_count(pdf_path)
+    text = smart_extract(pdf_path, profiler)
+
+    with profiler.stage("segment"):
+        text_segments = segment_text(text)
+    unfiltered = segment_text(text, prefilter=False)
+
+    with profiler.stage("local_tables"):
+        local, llm_pages = extract_local_tables(pdf_path, source)
+    llm_text = "\n\n".join(page_text for _, page_text in llm_pages)
+    sent = segment_text(llm_text) if llm_pages else []
+    llm_tables = []
+    if llm_pages:
+        with profiler.stage("llm"):
+            llm_tables = extract_tables_from_text(llm_text, source_name=source)
+
+    report = profiler.report()
+    extraction_s = sum(report["stages"].get(s, {}).get("wall_s", 0.0) for s in EXTRACTION_STAGES)
+    return {
+        "pages": n_pages,
+        "file_mb": round(os.path.getsize(pdf_path) / 1024 ** 2, 2),
+        "text_chars": len(text),
+        "wall_s": report["wall_s"],
+        "process_cpu_s": report["process_cpu_s"],
+        "children_cpu_s": report["children_cpu_s"],
+        "pages_per_s": round(n_pages / max(report["wall_s"], 1e-9), 2),
+        "extraction_pages_per_s": round(n_pages / max(extraction_s, 1e-9), 2),
+        "peak_rss_mb": report["peak_rss_mb"],
+        "stages": report["stages"],
+        "segments_unfiltered": len(unfiltered),
+        "segments_text_path": len(text_segments),
+        "tokens_text_path": sum(estimate_tokens(s) for s in text_segments),
+        "local_tables": len(local),
+        "llm_pages": len(llm_pages),
+        "segments_sent": len(sent),
+        "tokens_sent": sum(estimate_tokens(s) for s in sent),
+        "llm_tables": len(llm_tables),
+    }
+
+
+def run_case(pdf_path: str, source: str, isolate: bool) -> Dict:
+    if not isolate:
+        return bench_case(pdf_path, source)
+    # spawn : processus neuf, sans la mémoire déjà allouée par le parent
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(bench_case, (pdf_path, source))
+
+
+def run_benchmark(raw_dir: str, scales: List[int] = SCALES, stub_latency: float = STUB_LATENCY_S,
+                  isolate: bool = True, only: Optional[str] = None) -> Dict:
+    stub = DeepSeekStub(stub_latency)
+    # Les processus de test héritent de l'environnement : tout appel DeepSeek va au faux serveur
+    os.environ["DEEPSEEK_BASE_URL"] = stub.url
+    os.environ["DEEPSEEK_API_KEY"] = "stub"
+
+    pdfs = sorted(f for f in os.listdir(raw_dir) if f.lower().endswith(".pdf") and (not only or only in f))
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "raw_dir": raw_dir, "scales": list(scales),
+              "stub_latency_s": stub_latency, "isolated": isolate, "cases": []}
+    tmp_dir = tempfile.mkdtemp(prefix="extraction_bench_")
+    try:
+        for scale in scales:
+            for filename in pdfs:
+                source = os.path.splitext(filename)[0] + ".txt"
+                case = {"source": filename, "scale": scale}
+                before = stub.snapshot()
+                try:
+                    path = enlarge_pdf(os.path.join(raw_dir, filename), scale, tmp_dir)
+                    case.update(run_case(path, source, isolate))
+                    if path != os.path.join(raw_dir, filename):
+                        os.remove(path)
+                except Exception as e:
+                    case["error"] = f"{type(e).__name__}: {e}"
+                    print(f"❌ {filename} ×{scale} : {case['error']}")
+                    report["cases"].append(case)
+                    continue
+                after = stub.snapshot()
+                case["stub"] = {k: after[k] - before[k] for k in after}
+                report["cases"].append(case)
+                print(f"✅ {filename[:45]:<45} ×{scale:<2} {case['pages']:>4} pages  {case['pages_per_s']:>7.1f} p/s  "
+                      f"pic {case['peak_rss_mb']:>6.0f} Mo  {case['segments_sent']:>3} segments LLM")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        stub.close()
+
+    report["totals"] = scale_totals(report["cases"])
+    report["stub"] = stub.snapshot()
+    return report
+
+
+# === RAPPORT ===
+def scale_totals(cases: List[Dict]) -> Dict[str, Dict]:
+    """Totaux par facteur d'agrandissement : pages, temps, débit, pic mémoire, segments LLM."""
+    totals = {}
+    for case in cases:
+        if "error" in case:
+            continue
+        t = totals.setdefault(str(case["scale"]), {"documents": 0, "pages": 0, "wall_s": 0.0, "peak_rss_mb": 0.0,
+                                                   "segments_sent": 0, "tokens_sent": 0, "stages": {}})
+        t["documents"] += 1
+        t["pages"] += case["pages"]
+        t["wall_s"] = round(t["wall_s"] + case["wall_s"], 4)
+        t["peak_rss_mb"] = max(t["peak_rss_mb"], case["peak_rss_mb"])
+        t["segments_sent"] += case["segments_sent"]
+        t["tokens_sent"] += case["tokens_sent"]
+        for name, stage in case["stages"].items():
+            t["stages"][name] = round(t["stages"].get(name, 0.0) + stage["wall_s"], 4)
+    for t in totals.values():
+        t["pages_per_s"] = round(t["pages"] / max(t["wall_s"], 1e-9), 2)
+    return totals
+
+
+def print_report(report: Dict):
+    print(f"\n📊 Extraction ({report['raw_dir']}, faux DeepSeek {report['stub_latency_s']} s/appel)")
+    print(f"{'taille':<7} {'docs':>5} {'pages':>6} {'temps s':>8} {'pages/s':>8} {'pic Mo':>7} "
+          f"{'segments':>9} {'tokens':>8}  temps par étape (s)")
+    for scale, t in report["totals"].items():
+        stages = ", ".join(f"{name} {s:.1f}" for name, s in sorted(t["stages"].items(), key=lambda x: -x[1]))
+        print(f"×{scale:<6} {t['documents']:>5} {t['pages']:>6} {t['wall_s']:>8.1f} {t['pages_per_s']:>8.1f} "
+              f"{t['peak_rss_mb']:>7.0f} {t['segments_sent']:>9} {t['tokens_sent']:>8}  {stages}")
+
+
+def compare_reports(before: Dict, after: Dict):
+    """Écarts par document et par taille, pour les cas présents dans les deux rapports."""
+    cases_before = {(c["source"], c["scale"]): c for c in before["cases"] if "error" not in c}
+    print(f"\n🔍 Comparaison ({before['created']} → {after['created']})")
+    print(f"{'document':<45} {'taille':>6} {'Δ temps s':>10} {'Δ pages/s':>10} {'Δ pic Mo':>9} {'Δ segments':>11}")
+    for case in after["cases"]:
+        ref = cases_before.get((case["source"], case["scale"]))
+        if ref is None or "error" in case:
+            continue
+        print(f"{case['source'][:45]:<45} {'×' + str(case['scale']):>6} {case['wall_s'] - ref['wall_s']:>+10.2f} "
+              f"{case['pages_per_s'] - ref['pages_per_s']:>+10.1f} {case['peak_rss_mb'] - ref['peak_rss_mb']:>+9.0f} "
+              f"{case['segments_sent'] - ref['segments_sent']:>+11}")
+
+
+def save_report(report: Dict, path: Optional[str] = None) -> str:
+    path = path or os.path.join(REPORT_DIR, f"extraction_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc d'essai de l'extraction des PDF (débit, mémoire, segments LLM)")
+    parser.add_argument("raw_dir", nargs="?", default=dossier_paths(DEFAULT_DOSSIER)["raw_dir"])
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES),
+                        help="facteurs d'agrandissement synthétique (pages répétées)")
+    parser.add_argument("--only", help="ne garde que les PDF dont le nom contient ce texte")
+    parser.add_argument("--stub-latency", type=float, default=STUB_LATENCY_S, help="délai simulé par appel LLM (s)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="tous les cas dans ce processus (plus rapide, pic mémoire cumulé)")
+    parser.add_argument("--out", help=f"fichier JSON du rapport (défaut : {REPORT_DIR}/extraction_<date>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"), help="compare deux rapports existants")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "r", encoding="utf-8") as f_before, \
+                open(args.compare[1], "r", encoding="utf-8") as f_after:
+            compare_reports(json.load(f_before), json.load(f_after))
+        raise SystemExit(0)
+
+    result = run_benchmark(args.raw_dir, args.scales, args.stub_latency, isolate=not args.in_process, only=args.only)
+    print_report(result)
+    print(f"\n💾 Rapport sauvegardé dans {save_report(result, args.out)}")
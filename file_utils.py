@@ -0,0 +1,44 @@
+"""
+Écriture atomique et hash de fichiers, partagés par le pipeline, l'OCR, les générations
+d'index et le cache des diagnostics.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Dict
+
+# === CONFIG ===
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def atomic_write(path: str, content: str):
+    """
+    Écrit un fichier via un fichier temporaire : jamais de sortie à moitié écrite.
+    Le nom temporaire est propre au processus et au thread : deux écrivains concurrents
+    du même fichier ne se marchent pas dessus, le dernier os.replace l'emporte.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def file_sha256(path: str, cache: Dict) -> str:
+    """Hash du contenu d'un fichier, mis en cache tant que sa date et sa taille ne changent pas."""
+    stat = os.stat(path)
+    cached = cache.get(path)
+    if cached and cached["mtime"] == stat.st_mtime and cached["size"] == stat.st_size:
+        return cached["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    cache[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": h.hexdigest()}
+    return cache[path]["sha256"]
@@ -0,0 +1,147 @@
+"""
+Générations versionnées de l'index d'un dossier.
+
+Chaque indexation écrit un jeu complet (FAISS, chunks, BM25, embeddings) dans un
+répertoire temporaire, renommé une fois terminé en `gen-<date>` (renommage atomique),
+puis le fichier CURRENT est basculé vers cette génération (écriture atomique) :
+
+    <generations>/
+    ├── CURRENT                 # nom de la génération servie
+    ├── gen-20250301-101500-042/
+    │   ├── index.faiss (+ .meta.json), chunks.json, bm25.json, embeddings.npy
+    └── gen-20250302-093000-517/
+
+Une génération publiée n'est jamais modifiée : un lecteur qui a lu CURRENT ne voit
+jamais de fichier à moitié écrit. rag_query.py surveille CURRENT et bascule en tâche de
+fond. Les anciennes générations au-delà de GENERATIONS_KEEP sont supprimées (les
+processus qui les ont déjà chargées, y compris en mmap, les gardent jusqu'à leur
+prochaine bascule).
+
+Sans CURRENT (index construits avant les générations), les chemins historiques
+de dossiers.py sont utilisés.
+"""
+
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from dossiers import DOSSIER_FILES, dossier_paths
+from file_utils import atomic_write
+
+# === CONFIG ===
+GENERATIONS_KEEP = 2  # générations conservées en plus de la courante (retour arrière, lecteurs lents)
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+TMP_PREFIX = ".tmp-"
+STALE_TMP_S = 24 * 3600  # répertoires temporaires abandonnés (indexation interrompue)
+INDEX_FILES = ("index", "chunks", "bm25", "embeddings")  # fichiers d'une génération
+
+
+def current_path(dossier: Optional[str] = None) -> str:
+    return os.path.join(dossier_paths(dossier)["generations"], CURRENT_FILE)
+
+
+def current_generation(dossier: Optional[str] = None) -> Optional[str]:
+    """Nom de la génération servie, None si le dossier n'en a pas encore."""
+    try:
+        with open(current_path(dossier), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def generation_paths(dossier: Optional[str], generation: str) -> Dict[str, str]:
+    base = os.path.join(dossier_paths(dossier)["generations"], generation)
+    return {key: os.path.join(base, DOSSIER_FILES[key]) for key in INDEX_FILES}
+
+
+def index_paths(dossier: Optional[str] = None) -> Dict[str, str]:
+    """Chemins du dossier, fichiers d'index pris dans la génération courante (clé "generation")."""
+    paths = dossier_paths(dossier)
+    generation = current_generation(dossier)
+    if generation:
+        paths.update(generation_paths(dossier, generation))
+    paths["generation"] = generation
+    return paths
+
+
+def list_generations(dossier: Optional[str] = None) -> List[str]:
+    """Générations publiées, de la plus ancienne à la plus récente."""
+    folder = dossier_paths(dossier)["generations"]
+    if not os.path.isdir(folder):
+        return []
+    return sorted(e for e in os.listdir(folder)
+                  if e.startswith(GENERATION_PREFIX) and os.path.isdir(os.path.join(folder, e)))
+
+
+# === ÉCRITURE ===
+class GenerationWriter:
+    """
+    Construction d'une nouvelle génération :
+
+        with GenerationWriter(dossier) as gen:
+            faiss.write_index(index, gen.paths["index"])
+            ...
+        # publiée (CURRENT) à la sortie du bloc, abandonnée en cas d'exception
+    """
+
+    def __init__(self, dossier: Optional[str] = None, keep: int = GENERATIONS_KEEP):
+        self.dossier = dossier
+        self.keep = keep
+        self.folder = dossier_paths(dossier)["generations"]
+        now = time.time()
+        self.name = f"{GENERATION_PREFIX}{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+        self.tmp_dir = os.path.join(self.folder, f"{TMP_PREFIX}{self.name}")
+        self.paths = {key: os.path.join(self.tmp_dir, DOSSIER_FILES[key]) for key in INDEX_FILES}
+
+    def __enter__(self):
+        os.makedirs(self.tmp_dir)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return False
+        self.publish()
+        return False
+
+    def publish(self):
+        """Renomme la génération terminée puis bascule CURRENT vers elle."""
+        os.replace(self.tmp_dir, os.path.join(self.folder, self.name))
+        atomic_write(os.path.join(self.folder, CURRENT_FILE), self.name)
+        collect_garbage(self.dossier, self.keep)
+
+
+# === NETTOYAGE ===
+def collect_garbage(dossier: Optional[str] = None, keep: int = GENERATIONS_KEEP) -> List[str]:
+    """Supprime les générations plus anciennes que les `keep` précédant la courante ; retourne leurs noms."""
+    folder = dossier_paths(dossier)["generations"]
+    current = current_generation(dossier)
+    generations = list_generations(dossier)
+    if current not in generations:
+        return []  # CURRENT illisible ou désynchronisé : on ne supprime rien
+    older = generations[:generations.index(current)]
+    removed = older[:max(0, len(older) - keep)]
+    for name in removed:
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    for entry in os.listdir(folder):
+        path = os.path.join(folder, entry)
+        if entry.startswith(TMP_PREFIX) and time.time() - os.path.getmtime(path) > STALE_TMP_S:
+            shutil.rmtree(path, ignore_errors=True)
+    if removed:
+        print(f"🧹 Générations d'index supprimées : {', '.join(removed)}")
+    return removed
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    import sys
+    from dossiers import DEFAULT_DOSSIER
+
+    dossier = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DOSSIER
+    current = current_generation(dossier)
+    for name in list_generations(dossier):
+        print(f"{'▶' if name == current else ' '} {name}")
+    if current is None:
+        print(f"⚠️ Aucune génération pour {dossier} : index historique ({dossier_paths(dossier)['index']})")
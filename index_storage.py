@@ -0,0 +1,193 @@
+"""
+Stockage compressé et mappé en mémoire des embeddings FAISS.
+Modes : "flat" (float32, chargé en RAM), "fp16", "sq8" (quantification scalaire int8)
+et "pq" (product quantization). Les modes compressés sont stockés dans un index IVF
+dont les listes inversées peuvent être mappées en mémoire (mmap) : plusieurs
+processus partagent alors le cache de pages au lieu d'une copie privée chacun.
+
+Usage : python index_storage.py [dossier]  → rapport mémoire / rappel vs float32 sur le corpus.
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+import psutil
+
+from dossiers import DEFAULT_DOSSIER
+from index_generations import index_paths
+
+# === CONFIG ===
+STORAGE_MODES = ("flat", "fp16", "sq8", "pq")
+REPORT_PATH = "index_storage_report.json"
+IVF_MAX_NLIST = 64
+PQ_SUBVECTORS = 48  # 384 / 48 = 8 dimensions par sous-quantificateur
+DEFAULT_NPROBE = 16
+RECALL_K = 10
+RECALL_QUERIES = 200
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    """Nombre de listes IVF adapté à la taille du corpus (≥ 39 points d'entraînement par liste)."""
+    return max(1, min(IVF_MAX_NLIST, int(math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def index_factory_string(storage: str, dim: int, n_vectors: int) -> str:
+    """Chaîne index_factory FAISS pour un mode de stockage."""
+    if storage == "flat":
+        return "Flat"
+    nlist = ivf_nlist(n_vectors)
+    if storage == "fp16":
+        return f"IVF{nlist},SQfp16"
+    if storage == "sq8":
+        return f"IVF{nlist},SQ8"
+    if storage == "pq":
+        m = PQ_SUBVECTORS if dim % PQ_SUBVECTORS == 0 else 1
+        nbits = max(4, min(8, int(math.log2(max(n_vectors // 39, 16)))))  # ≥ 39 points par centroïde
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    raise ValueError(f"Mode de stockage inconnu : {storage} (attendu : {', '.join(STORAGE_MODES)})")
+
+
+def build_index(embeddings: np.ndarray, storage: str = "flat") -> faiss.Index:
+    """Construit (et entraîne si besoin) un index FAISS L2 à partir de vecteurs float32."""
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n_vectors, dim = embeddings.shape
+    index = faiss.index_factory(dim, index_factory_string(storage, dim, n_vectors), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def set_nprobe(index: faiss.Index, nprobe: int = DEFAULT_NPROBE):
+    """Règle le nombre de listes IVF visitées (sans effet sur un index flat)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+
+
+def search_params(index: faiss.Index, ids: np.ndarray) -> faiss.SearchParameters:
+    """
+    Paramètres d'une recherche restreinte aux vecteurs `ids` (pré-filtrage par sélecteur
+    FAISS). Pour un index IVF, nprobe est augmenté en proportion de la part exclue :
+    les listes visitées contiennent alors autant de candidats autorisés que sans filtre.
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return faiss.SearchParameters(sel=selector)
+    share = len(ids) / max(index.ntotal, 1)
+    nprobe = min(ivf.nlist, max(ivf.nprobe, math.ceil(ivf.nprobe / max(share, 1e-9))))
+    return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+
+
+def load_index(path: str, mmap: bool = True, nprobe: int = DEFAULT_NPROBE) -> faiss.Index:
+    """
+    Charge un index FAISS. En mode mmap, les listes inversées d'un index IVF
+    restent sur disque et sont partagées via le cache de pages entre processus.
+    """
+    io_flags = faiss.IO_FLAG_MMAP if mmap else 0
+    try:
+        index = faiss.read_index(path, io_flags)
+    except RuntimeError:
+        # Certains types d'index ne supportent pas le mmap : lecture classique
+        index = faiss.read_index(path)
+    set_nprobe(index, nprobe)
+    return index
+
+
+def storage_mode(index: faiss.Index) -> str:
+    """Décrit le type de stockage d'un index chargé (pour les logs)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return "flat"
+    return f"{type(index).__name__} (nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+
+
+# === RAPPORT ===
+def process_rss() -> int:
+    return psutil.Process().memory_info().rss
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Rappel@k moyen : part des k voisins exacts retrouvés par l'index compressé."""
+    hits = sum(len(set(r) & set(c)) for r, c in zip(reference, candidate))
+    return hits / reference.size
+
+
+def storage_report(embeddings: np.ndarray, modes: List[str] = STORAGE_MODES, k: int = RECALL_K,
+                   n_queries: int = RECALL_QUERIES, nprobe: int = DEFAULT_NPROBE,
+                   tmp_dir: str = ".") -> Dict:
+    """
+    Compare chaque mode de stockage au float32 : taille disque, mémoire privée
+    au chargement (avec et sans mmap) et rappel@k. Les requêtes sont un
+    échantillon des vecteurs du corpus.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    rng = np.random.default_rng(0)
+    query_ids = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[query_ids]
+
+    reference = build_index(embeddings, "flat")
+    _, ref_ids = reference.search(queries, k)
+
+    report = {"n_vectors": int(embeddings.shape[0]), "dim": int(embeddings.shape[1]), "k": k,
+              "nprobe": nprobe, "modes": {}}
+    for mode in modes:
+        path = os.path.join(tmp_dir, f"_storage_{mode}.faiss")
+        faiss.write_index(build_index(embeddings, mode), path)
+        entry = {"factory": index_factory_string(mode, embeddings.shape[1], len(embeddings)),
+                 "file_bytes": os.path.getsize(path)}
+
+        for mmap in (False, True):
+            rss_before = process_rss()
+            index = load_index(path, mmap=mmap, nprobe=nprobe)
+            rss_loaded = process_rss() - rss_before
+            start = time.perf_counter()
+            _, ids = index.search(queries, k)
+            search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            key = "mmap" if mmap else "ram"
+            entry[f"rss_delta_{key}_bytes"] = int(rss_loaded)
+            entry[f"search_ms_per_query_{key}"] = round(search_ms, 4)
+            entry["recall_at_k"] = round(recall_at_k(ref_ids, ids), 4)
+            del index
+
+        os.remove(path)
+        report["modes"][mode] = entry
+
+    flat_bytes = report["modes"].get("flat", {}).get("file_bytes")
+    for entry in report["modes"].values():
+        if flat_bytes:
+            entry["size_vs_flat"] = round(entry["file_bytes"] / flat_bytes, 4)
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\n📊 Stockage des embeddings ({report['n_vectors']} vecteurs, dim {report['dim']}, "
+          f"rappel@{report['k']}, nprobe={report['nprobe']})")
+    print(f"{'mode':<6} {'fichier':>10} {'ratio':>7} {'RSS chargé':>11} {'RSS mmap':>10} {'rappel':>7}")
+    for mode, e in report["modes"].items():
+        print(f"{mode:<6} {e['file_bytes'] / 1024:>8.0f}Ko {e.get('size_vs_flat', 1):>7.2f} "
+              f"{e['rss_delta_ram_bytes'] / 1024:>9.0f}Ko {e['rss_delta_mmap_bytes'] / 1024:>8.0f}Ko "
+              f"{e['recall_at_k']:>7.3f}")
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    dossier = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DOSSIER
+    embeddings_path = index_paths(dossier)["embeddings"]  # vecteurs float32 écrits par chunking.py
+    if not os.path.exists(embeddings_path):
+        raise SystemExit(f"⚠️ {embeddings_path} introuvable : relancer chunking.py {dossier}")
+
+    vectors = np.load(embeddings_path)
+    result = storage_report(vectors)
+    print_report(result)
+
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Rapport sauvegardé dans {REPORT_PATH}")
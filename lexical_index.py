@@ -0,0 +1,169 @@
+"""
+Index lexical BM25 pour la recherche hybride (lexicale + dense).
+Les embeddings MiniLM retrouvent mal les identifiants exacts (numéros de compte,
+SIREN, dates, montants) : cet index inversé les capture au mot près.
+"""
+
+import json
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# === CONFIG ===
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # constante de la Reciprocal Rank Fusion
+MIN_IDENTIFIER_DIGITS = 5  # un token numérique de cette longueur est considéré comme identifiant
+HYBRID_CANDIDATES = 50  # candidats dense + lexical considérés avant fusion
+LEXICAL_WEIGHT = 1.0
+LEXICAL_WEIGHT_IDENTIFIER = 3.0  # requête avec numéro de compte, SIREN, date, montant...
+
+FRENCH_STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "cet", "cette", "dans", "de", "des", "du", "elle",
+    "en", "est", "et", "il", "ils", "je", "la", "le", "les", "leur", "leurs", "lui", "ma", "mais",
+    "me", "mes", "moi", "mon", "ne", "nos", "notre", "nous", "on", "ou", "par", "pas", "pour",
+    "qu", "que", "qui", "sa", "se", "ses", "son", "sont", "sur", "ta", "te", "tes", "toi", "ton",
+    "tu", "un", "une", "vos", "votre", "vous", "y", "d", "l", "j", "m", "n", "s", "t", "c",
+    "donne", "fais", "tout", "tous", "toute", "toutes", "quel", "quelle", "quels", "quelles",
+}
+
+# Nombres à séparateurs de milliers ("1 234 567", "433 925 718", "1.234.567")
+THOUSANDS_RE = re.compile(r"(?<!\d)\d{1,3}(?:[ \u00a0\u202f.]\d{3})+(?!\d)")
+# Dates numériques ("25/11/2016", "25.11.2016", "25-11-16")
+DATE_RE = re.compile(r"(?<!\d)(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})(?!\d)")
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+# === TOKENISATION ===
+def strip_accents(text: str) -> str:
+    """Supprime les accents ("débit" → "debit")."""
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def normalize_token(token: str) -> str:
+    """Racinisation légère : retire le pluriel des mots alphabétiques."""
+    if token.isalpha() and len(token) > 3 and token[-1] in "sx":
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenise un texte français pour BM25.
+    Les chaînes de chiffres séparées (milliers, dates) produisent en plus un token
+    compacté, afin que "433 925 718" et "433925718" se retrouvent.
+    """
+    text = strip_accents(text.lower())
+    tokens = []
+
+    for match in THOUSANDS_RE.finditer(text):
+        tokens.append(re.sub(r"\D", "", match.group()))
+    for match in DATE_RE.finditer(text):
+        day, month, year = match.groups()
+        tokens.append(f"{int(day):02d}{int(month):02d}{year}")
+
+    for word in WORD_RE.findall(text):
+        if word in FRENCH_STOPWORDS:
+            continue
+        if len(word) == 1 and not word.isdigit():
+            continue
+        tokens.append(normalize_token(word))
+
+    return tokens
+
+
+def has_identifier(query: str) -> bool:
+    """Indique si la requête contient un identifiant numérique (compte, SIREN, montant...)."""
+    return any(t.isdigit() and len(t) >= MIN_IDENTIFIER_DIGITS for t in tokenize(query))
+
+
+# === INDEX BM25 ===
+class BM25Index:
+    """Index inversé BM25 compact, sérialisable en JSON."""
+
+    def __init__(self, postings: Dict[str, List[List[int]]], doc_lengths: List[int],
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_lengths)
+        self.avgdl = (sum(doc_lengths) / self.n_docs) if self.n_docs else 0.0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """Construit l'index à partir des textes des chunks (dans l'ordre de l'index FAISS)."""
+        postings = defaultdict(list)
+        doc_lengths = []
+        for doc_idx, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append([doc_idx, tf])
+        return cls(dict(postings), doc_lengths, k1=k1, b=b)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 10, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """Retourne les (indice de chunk, score BM25) les mieux classés, parmi `allowed` si fourni."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_idx, tf in postings:
+                if allowed is not None and doc_idx not in allowed:
+                    continue
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_idx] / (self.avgdl or 1)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:top_k]
+
+    def save(self, path: str):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["postings"], data["doc_lengths"], k1=data["k1"], b=data["b"])
+
+
+# === FUSION ===
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], weights: Sequence[float] = None,
+                           k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fusionne plusieurs classements (listes d'indices, du meilleur au moins bon)
+    par Reciprocal Rank Fusion pondérée.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, idx in enumerate(ranking):
+            fused[idx] += weight / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def hybrid_ranking(query: str, dense_ranking: Sequence[int], bm25: "BM25Index" = None,
+                   n_candidates: int = HYBRID_CANDIDATES,
+                   allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+    """Fusionne le classement dense (FAISS) et le classement BM25 de la requête (chunks `allowed` si filtre)."""
+    if bm25 is None:
+        return reciprocal_rank_fusion([dense_ranking])
+    lexical_ranking = [i for i, _ in bm25.search(query, n_candidates, allowed)]
+    # Les identifiants exacts sont mal captés par les embeddings : on favorise BM25
+    lexical_weight = LEXICAL_WEIGHT_IDENTIFIER if has_identifier(query) else LEXICAL_WEIGHT
+    return reciprocal_rank_fusion([dense_ranking, lexical_ranking], weights=[1.0, lexical_weight])
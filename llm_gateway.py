@@ -0,0 +1,224 @@
+"""
+Passerelle unique vers les LLM (DeepSeek, OpenAI).
+- un client synchrone et un client asynchrone par fournisseur, créés une fois et partagés :
+  connexions HTTP gardées ouvertes (keep-alive) au lieu d'une poignée de main TLS par appel
+- concurrence limitée par fournisseur, qui s'adapte aux 429 : la limite est divisée par deux
+  à chaque refus (en respectant Retry-After) puis remonte d'un cran après une série de succès
+- délais (timeouts) explicites, relances avec attente exponentielle sur 429, 5xx,
+  timeout ou coupure réseau
+- comptage des tokens et du cache de préfixe de chaque appel (cf. llm_usage.py)
+
+    from llm_gateway import complete
+    text, metrics = complete(messages, provider="deepseek", source="assistant", temperature=0.2)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from openai import (APIConnectionError, APITimeoutError, AsyncOpenAI, DefaultAsyncHttpxClient,
+                    DefaultHttpxClient, InternalServerError, OpenAI, RateLimitError)
+
+from llm_usage import record_usage
+
+load_dotenv()
+
+# === CONFIG ===
+PROVIDERS = {
+    "deepseek": {"api_key_env": "DEEPSEEK_API_KEY",
+                 "base_url": os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
+                 "model": "deepseek-chat", "max_concurrency": int(os.getenv("DEEPSEEK_CONCURRENCY", "8"))},
+    "openai": {"api_key_env": "OPENAI_API_KEY", "base_url": None,
+               "model": "gpt-4o-mini", "max_concurrency": int(os.getenv("OPENAI_CONCURRENCY", "8"))},
+}
+TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120)
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 30.0
+INCREASE_AFTER = 8  # succès consécutifs avant de relever la limite d'un cran
+ASYNC_POLL_S = 0.05
+
+RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class AdaptiveLimiter:
+    """Nombre d'appels simultanés vers un fournisseur, réduit sur 429 puis relevé progressivement."""
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.active = 0
+        self.successes = 0
+        self.blocked_until = 0.0  # Retry-After : aucun nouvel appel avant cette date
+        self._cond = threading.Condition()
+
+    def _can_start(self) -> bool:
+        return self.active < self.limit and time.monotonic() >= self.blocked_until
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._can_start():
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while not self._can_start():
+                delay = self.blocked_until - time.monotonic()
+                self._cond.wait(timeout=delay if delay > 0 else None)
+            self.active += 1
+
+    async def acquire_async(self):
+        while not self.try_acquire():
+            await asyncio.sleep(ASYNC_POLL_S)
+
+    def release(self, outcome: str = "ok", retry_after: float = 0.0):
+        """`outcome` : "ok", "throttled" (429) ou "error"."""
+        with self._cond:
+            self.active -= 1
+            if outcome == "throttled":
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            elif outcome == "ok":
+                self.successes += 1
+                if self.successes >= INCREASE_AFTER and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self._cond.notify_all()
+
+
+_clients: Dict[str, OpenAI] = {}
+_async_clients: Dict[str, AsyncOpenAI] = {}
+_limiters = {name: AdaptiveLimiter(cfg["max_concurrency"]) for name, cfg in PROVIDERS.items()}
+_stats = {name: {"calls": 0, "retries": 0, "rate_limited": 0, "errors": 0} for name in PROVIDERS}
+_lock = threading.Lock()
+
+
+def _count(provider: str, key: str):
+    with _lock:
+        _stats[provider][key] += 1
+
+
+def _client_kwargs(provider: str) -> Dict:
+    cfg = PROVIDERS[provider]
+    api_key = os.getenv(cfg["api_key_env"])
+    if not api_key:
+        raise RuntimeError(f"⚠️ {cfg['api_key_env']} non définie (.env ou secrets Streamlit)")
+    # Les relances sont gérées ici (et non par le SDK) pour adapter la concurrence aux 429
+    kwargs = {"api_key": api_key, "timeout": TIMEOUT, "max_retries": 0}
+    if cfg["base_url"]:
+        kwargs["base_url"] = cfg["base_url"]
+    return kwargs
+
+
+def get_client(provider: str = "deepseek") -> OpenAI:
+    """Client synchrone partagé d'un fournisseur (pool de connexions keep-alive)."""
+    with _lock:
+        if provider not in _clients:
+            _clients[provider] = OpenAI(**_client_kwargs(provider),
+                                        http_client=DefaultHttpxClient(limits=POOL_LIMITS))
+        return _clients[provider]
+
+
+def get_async_client(provider: str = "deepseek") -> AsyncOpenAI:
+    """Client asynchrone partagé d'un fournisseur."""
+    with _lock:
+        if provider not in _async_clients:
+            _async_clients[provider] = AsyncOpenAI(**_client_kwargs(provider),
+                                                   http_client=DefaultAsyncHttpxClient(limits=POOL_LIMITS))
+        return _async_clients[provider]
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Retry-After s'il est fourni, sinon attente exponentielle avec gigue."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(BACKOFF_MAX_S, float(response.headers.get("retry-after", "")))
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _on_failure(provider: str, error: Exception, attempt: int) -> float:
+    """Libère le créneau, compte l'échec et retourne l'attente avant relance (lève si épuisé)."""
+    throttled = isinstance(error, RateLimitError)
+    delay = _retry_delay(error, attempt)
+    _limiters[provider].release("throttled" if throttled else "error", delay if throttled else 0.0)
+    _count(provider, "rate_limited" if throttled else "errors")
+    if attempt == MAX_RETRIES:
+        raise error
+    _count(provider, "retries")
+    print(f"⏳ {provider} : {type(error).__name__}, nouvelle tentative dans {delay:.1f} s "
+          f"(limite {_limiters[provider].limit} appels simultanés)")
+    return delay
+
+
+def _request(provider: str, model: Optional[str], messages: List[Dict], params: Dict) -> Dict:
+    return {"model": model or PROVIDERS[provider]["model"], "messages": messages, **params}
+
+
+def complete(messages: List[Dict], provider: str = "deepseek", model: Optional[str] = None,
+             source: str = "llm", **params) -> Tuple[str, Dict]:
+    """
+    Appel synchrone (chat completions). `params` : temperature, response_format, ...
+    Retourne (texte de la réponse, métriques d'usage).
+    """
+    client, limiter = get_client(provider), _limiters[provider]
+    request = _request(provider, model, messages, params)
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = client.chat.completions.create(**request)
+        except RETRYABLE as e:
+            time.sleep(_on_failure(provider, e, attempt))
+            continue
+        except Exception:
+            limiter.release("error")
+            _count(provider, "errors")
+            raise
+        limiter.release("ok")
+        _count(provider, "calls")
+        metrics = record_usage(source, response.usage, time.perf_counter() - start)
+        return response.choices[0].message.content, metrics
+
+
+async def acomplete(messages: List[Dict], provider: str = "deepseek", model: Optional[str] = None,
+                    source: str = "llm", **params) -> Tuple[str, Dict]:
+    """Équivalent asynchrone de complete() (même limite de concurrence par fournisseur)."""
+    client, limiter = get_async_client(provider), _limiters[provider]
+    request = _request(provider, model, messages, params)
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire_async()
+        start = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(**request)
+        except RETRYABLE as e:
+            await asyncio.sleep(_on_failure(provider, e, attempt))
+            continue
+        except Exception:
+            limiter.release("error")
+            _count(provider, "errors")
+            raise
+        limiter.release("ok")
+        _count(provider, "calls")
+        metrics = record_usage(source, response.usage, time.perf_counter() - start)
+        return response.choices[0].message.content, metrics
+
+
+def gateway_stats() -> Dict[str, Dict]:
+    """Appels, relances, 429 et limite de concurrence courante par fournisseur."""
+    with _lock:
+        stats = {name: dict(values) for name, values in _stats.items()}
+    for name, limiter in _limiters.items():
+        stats[name].update({"limit": limiter.limit, "max_limit": limiter.max_limit, "active": limiter.active})
+    return stats
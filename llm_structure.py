@@ -4,104 +4,157 @@
 import os
 import re
 import json
-import requests
+import hashlib
+import argparse
 from dotenv import load_dotenv
 
+from dossiers import DEFAULT_DOSSIER, dossier_paths
+from file_utils import atomic_write
+from llm_gateway import complete
+from structured_output import StructuredOutputError, complete_json, validate_tables
+from table_detect import has_tabular_content, is_tabular_line
+from text_normalize import strip_repeated_lines
+
 # ==========================
 # CONFIG
 # ==========================
 
 load_dotenv()
-API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise RuntimeError("⚠️ DEEPSEEK_API_KEY manquante dans le fichier .env")
 
-DEEPSEEK_URL = "https://api.deepseek.com/chat/completions"
-HEADERS = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json",
-}
+DEEPSEEK_MODEL = "deepseek-chat"
+PROMPT_VERSION = 2  # à incrémenter quand le prompt change : invalide les points de reprise
+
+INPUT_FOLDER = dossier_paths(DEFAULT_DOSSIER)["text_dir"]
+TABLES_DIR = dossier_paths(DEFAULT_DOSSIER)["tables_dir"]  # <source>.json + <source>.jsonl (reprise)
+OUTPUT_FILE = dossier_paths(DEFAULT_DOSSIER)["tables"]
 
-INPUT_FOLDER = "outputs"
-OUTPUT_FILE = "all_tables.json"
+# Segmentation : blocs (pages / sections) regroupés jusqu'à un budget de tokens
+MAX_SEGMENT_TOKENS = int(os.getenv("MAX_SEGMENT_TOKENS", "3000"))  # la réponse JSON est du même ordre
+CHARS_PER_TOKEN = 3.2  # estimation pour du français chiffré (tokenizer DeepSeek)
+BLOCK_MAX_LINES = 50  # une "page" quand le texte n'a pas de ligne vide entre les pages
+# Fin de page probable (pied de page, période) : point de coupe préféré une fois BLOCK_MAX_LINES atteint
+PAGE_BREAK_RE = re.compile(r"Tour\s+CB|Page\s+\d+|du\s+\d{2}/\d{2}/\d{4}", re.I)
+SECTION_RE = re.compile(r"^(?:=====.*=====|\[Tableau \d+\])$")  # début de section
 
 # ==========================
 # OUTILS
 # ==========================
 
-def segment_text(text: str, max_pages: int = 6) -> list:
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def split_blocks(text: str) -> list:
     """
-    Coupe le texte en segments d’environ `max_pages` pages
-    ou lorsqu'une rupture logique est détectée.
+    Découpe le texte en blocs d'environ une page, le long des sauts de page (lignes vides)
+    et de section. Un bloc sans ligne vide est coupé à la première fin de page probable
+    (PAGE_BREAK_RE) après BLOCK_MAX_LINES lignes, au plus tard à 2 × BLOCK_MAX_LINES :
+    une ligne « Exercice du 01/01/2024 au 31/12/2024 » reste avec son tableau.
     """
-    LINES_PER_PAGE = 50
-    lines = text.splitlines()
-    segments = []
-    current = []
-
-    for i, line in enumerate(lines):
+    blocks, current = [], []
+    for line in text.splitlines():
+        if not line.strip() and current:  # ligne vide : séparateur de pages de pdf_extract
+            blocks.append(current)
+            current = []
+            continue
+        if SECTION_RE.match(line.strip()) and current:
+            blocks.append(current)
+            current = []
         current.append(line)
+        if len(current) >= 2 * BLOCK_MAX_LINES or (len(current) >= BLOCK_MAX_LINES and PAGE_BREAK_RE.search(line)):
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return ["\n".join(b) for b in blocks if any(l.strip() for l in b)]
 
-        # rupture logique (nouvelle section ou page)
-        if re.search(r"Tour\s+CB|Page\s+\d+|du\s+\d{2}/\d{2}/\d{4}", line, re.I):
-            if len(current) >= LINES_PER_PAGE * max_pages:
-                segments.append("\n".join(current))
-                current = []
 
-        # rupture naturelle (tous les ~6 pages)
-        elif len(current) >= LINES_PER_PAGE * max_pages:
-            segments.append("\n".join(current))
-            current = []
+def select_tabular_blocks(blocks: list) -> list:
+    """
+    Garde les blocs avec du contenu tabulaire, plus ceux qui prolongent un tableau
+    coupé par un saut de page (première ligne tabulaire après un bloc retenu).
+    """
+    kept, previous_kept = [], False
+    for block in blocks:
+        first_line = next((l for l in block.splitlines() if l.strip()), "")
+        keep = has_tabular_content(block) or (previous_kept and is_tabular_line(first_line))
+        if keep:
+            kept.append(block)
+        previous_kept = keep
+    return kept
 
+
+def pack_blocks(blocks: list, max_tokens: int = MAX_SEGMENT_TOKENS) -> list:
+    """Regroupe des blocs consécutifs en segments d'au plus `max_tokens` tokens estimés."""
+    segments, current, current_tokens = [], [], 0
+    for block in blocks:
+        pieces = [block]
+        if estimate_tokens(block) > max_tokens:  # bloc trop long : coupé par lignes
+            pieces, piece = [], []
+            for line in block.splitlines():
+                if piece and estimate_tokens("\n".join(piece + [line])) > max_tokens:
+                    pieces.append("\n".join(piece))
+                    piece = []
+                piece.append(line)
+            pieces.append("\n".join(piece))
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                segments.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
     if current:
         segments.append("\n".join(current))
-
     return segments
 
 
-def call_deepseek(prompt: str) -> str:
-    """Appelle DeepSeek et retourne le contenu brut."""
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-    }
-    r = requests.post(DEEPSEEK_URL, headers=HEADERS, json=payload, timeout=120)
-    if r.status_code != 200:
-        raise RuntimeError(f"DeepSeek HTTP {r.status_code}: {r.text}")
-    return r.json()["choices"][0]["message"]["content"]
-
-
-def extract_tables_from_text(text: str, source_name: str = "") -> list:
+def segment_text(text: str, max_tokens: int = MAX_SEGMENT_TOKENS, prefilter: bool = True) -> list:
     """
-    Extrait tous les tableaux d’un texte segmenté en plusieurs blocs.
+    Segments à envoyer au LLM : blocs d'une page environ, débarrassés des en-têtes et
+    pieds de page répétés, filtrés localement (prose sans tableau écartée) puis
+    regroupés jusqu'au budget de tokens.
     """
-    segments = segment_text(text)
-    print(f"📄 {len(segments)} segments détectés dans {source_name}")
-    tables = []
+    blocks = split_blocks(strip_repeated_lines(text))
+    if prefilter:
+        blocks = select_tabular_blocks(blocks)
+    return pack_blocks(blocks, max_tokens)
 
-    for i, segment in enumerate(segments, start=1):
-        print(f"→ Traitement segment {i}/{len(segments)} ({source_name})...")
 
-        prompt = f"""
+TABLES_SCHEMA_HINT = '{"tables": [{"source": "...", "titre": "...", "unit": "EUR" | null, ' \
+                     '"data": [{"label": "...", "<colonne>": nombre | null}]}]}'
+
+
+def call_deepseek(prompt, json_mode: bool = False) -> str:
+    """Appelle DeepSeek (prompt ou liste de messages) via la passerelle et retourne le contenu brut."""
+    messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
+    params = {"response_format": {"type": "json_object"}} if json_mode else {}
+    text, _ = complete(messages, provider="deepseek", model=DEEPSEEK_MODEL, source="tables", **params)
+    return text
+
+
+def build_prompt(segment: str, source_name: str) -> str:
+    return f"""
 Tu es un assistant qui lit un texte et en extrait tous les tableaux chiffrés ou tabulaires.
 
 Consignes :
 - Détecte les tableaux financiers ou structurés.
-- Renvoie UNIQUEMENT du JSON valide, format :
-  [
-    {{
-      "source": "{source_name}",
-      "titre": "nom du tableau (si identifiable)",
-      "unit": "EUR" si mentionné,
-      "data": [
-        {{ "label": "Chiffre d'affaires net", "2013": 889743, "2014": 742628, "2015": 807635 }},
-        ...
-      ]
-    }},
-    ...
-  ]
-- Supprime les espaces dans les nombres ("1 234" → 1234).
+- Renvoie UNIQUEMENT un objet JSON valide, format :
+  {{
+    "tables": [
+      {{
+        "source": "{source_name}",
+        "titre": "nom du tableau (si identifiable)",
+        "unit": "EUR" si mentionné, sinon null,
+        "data": [
+          {{ "label": "Chiffre d'affaires net", "2013": 889743, "2014": 742628, "2015": 807635 }}
+        ]
+      }}
+    ]
+  }}
+- Supprime les espaces dans les nombres ("1 234" → 1234), sans guillemets autour des nombres.
 - Si une valeur est absente, mets null.
+- S'il n'y a aucun tableau, renvoie {{"tables": []}}.
 - Ne renvoie que le JSON.
 
 Texte à traiter :
@@ -110,44 +163,157 @@ Texte à traiter :
 ---
         """
 
-        try:
-            response_text = call_deepseek(prompt)
+
+# ==========================
+# POINTS DE REPRISE
+# ==========================
+
+def segment_key(segment: str, source_name: str) -> str:
+    """Identifie un segment (contenu, source, modèle, version du prompt) d'une exécution à l'autre."""
+    h = hashlib.sha256(f"{DEEPSEEK_MODEL}|{PROMPT_VERSION}|{source_name}|{segment}".encode("utf-8"))
+    return h.hexdigest()[:20]
+
+
+def load_checkpoint(path: str) -> dict:
+    """Résultats déjà obtenus par segment (dernier enregistrement gagnant, ligne tronquée ignorée)."""
+    records = {}
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # écriture interrompue (crash, Ctrl-C)
+                records[record["key"]] = record
+    return records
+
+
+def compact_checkpoint(path: str, records: list):
+    """Réécrit le point de reprise avec les seuls segments réussis encore d'actualité."""
+    atomic_write(path, "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+
+def extract_tables_from_text(text: str, source_name: str = "", checkpoint: str = None,
+                             strict: bool = False, prefilter: bool = True) -> list:
+    """
+    Extrait tous les tableaux d’un texte segmenté en plusieurs blocs.
+    Avec `checkpoint` (fichier JSONL), chaque segment traité y est écrit aussitôt ;
+    une nouvelle exécution ne relance que les segments absents ou en échec.
+    Avec `strict`, des segments en échec lèvent une erreur (après sauvegarde du reste).
+    Sans `prefilter`, aucun bloc n'est écarté (pages déjà choisies, cf. local_tables).
+    """
+    segments = segment_text(text, prefilter=prefilter)
+    print(f"📄 {len(segments)} segments avec tableaux dans {source_name} "
+          f"(~{sum(estimate_tokens(s) for s in segments)} tokens envoyés)")
+    tables = []
+
+    keys = [segment_key(segment, source_name) for segment in segments]
+    done = {}
+    log = None
+    if checkpoint:
+        done = {k: r for k, r in load_checkpoint(checkpoint).items() if r["status"] == "ok" and k in keys}
+        os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+        compact_checkpoint(checkpoint, [done[k] for k in keys if k in done])
+        log = open(checkpoint, "a", encoding="utf-8", buffering=1)
+        if done:
+            print(f"♻️ {len(done)}/{len(segments)} segments repris depuis {checkpoint}")
+
+    failed = 0
+    try:
+        for i, (segment, key) in enumerate(zip(segments, keys), start=1):
+            if key in done:
+                tables.extend(done[key]["tables"])
+                continue
+            print(f"→ Traitement segment {i}/{len(segments)} ({source_name})...")
+
+            record = {"key": key, "segment": i, "status": "ok", "tables": []}
             try:
-                parsed = json.loads(response_text)
-                if isinstance(parsed, list):
-                    tables.extend(parsed)
-                else:
-                    tables.append(parsed)
-            except json.JSONDecodeError:
-                print(f"⚠️ Réponse non JSON pour {source_name} segment {i}, ignorée.")
-        except Exception as e:
-            print(f"❌ Erreur sur {source_name} segment {i}: {e}")
+                record["tables"] = complete_json(
+                    lambda messages: call_deepseek(messages, json_mode=True),
+                    [{"role": "user", "content": build_prompt(segment, source_name)}],
+                    lambda data: validate_tables(data, source_name),
+                    schema_hint=TABLES_SCHEMA_HINT,
+                )
+            except StructuredOutputError as e:
+                record.update(status="invalid_json", error=str(e))
+                print(f"⚠️ Réponse non JSON pour {source_name} segment {i} malgré réparation et relance : {e}")
+            except Exception as e:
+                record.update(status="error", error=str(e))
+                print(f"❌ Erreur sur {source_name} segment {i}: {e}")
 
+            failed += record["status"] != "ok"
+            tables.extend(record["tables"])
+            if log:
+                log.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if log:
+            log.close()
+
+    if strict and failed:
+        raise RuntimeError(f"{failed}/{len(segments)} segments en échec pour {source_name} (relancer pour reprendre)")
     return tables
 
 
+def merge_tables(tables_dir: str, output_file: str) -> int:
+    """Fusionne les tableaux par source (<source>.json) dans all_tables.json ; retourne leur nombre."""
+    all_tables = []
+    for fname in sorted(f for f in os.listdir(tables_dir) if f.endswith(".json")):
+        with open(os.path.join(tables_dir, fname), "r", encoding="utf-8") as f:
+            all_tables.extend(json.load(f))
+    atomic_write(output_file, json.dumps(all_tables, indent=2, ensure_ascii=False))
+    return len(all_tables)
+
+
 # ==========================
 # MAIN
 # ==========================
 
 if __name__ == "__main__":
-    all_tables = []
+    parser = argparse.ArgumentParser(description="Extraction des tableaux des textes d'un dossier via DeepSeek")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="compte les appels LLM et les tokens avec / sans pré-filtrage, sans appeler l'API")
+    parser.add_argument("--resume", action="store_true",
+                        help="reprend les segments déjà traités (points de reprise JSONL de tables/)")
+    args = parser.parse_args()
+
     txt_files = [f for f in os.listdir(INPUT_FOLDER) if f.lower().endswith(".txt")]
 
     print(f"📂 {len(txt_files)} fichiers trouvés dans {INPUT_FOLDER}/")
 
+    if args.dry_run:
+        totals = [0, 0, 0, 0]
+        for fname in sorted(txt_files):
+            with open(os.path.join(INPUT_FOLDER, fname), "r", encoding="utf-8") as f:
+                text = f.read()
+            counts = []
+            for prefilter in (False, True):
+                segments = segment_text(text, prefilter=prefilter)
+                counts += [len(segments), sum(estimate_tokens(s) for s in segments)]
+            totals = [t + c for t, c in zip(totals, counts)]
+            print(f"  {fname[:50]:<50} {counts[0]:>4} → {counts[2]:>4} appels  ({counts[1]} → {counts[3]} tokens)")
+        print(f"\n📉 Total : {totals[0]} → {totals[2]} appels LLM, {totals[1]} → {totals[3]} tokens")
+        raise SystemExit(0)
+
+    os.makedirs(TABLES_DIR, exist_ok=True)
+    failures = []
     for fname in txt_files:
         path = os.path.join(INPUT_FOLDER, fname)
+        stem = os.path.splitext(fname)[0]
+        checkpoint = os.path.join(TABLES_DIR, f"{stem}.jsonl")
+        if not args.resume and os.path.exists(checkpoint):
+            os.remove(checkpoint)
         print(f"\n▶️ Traitement de {fname}...")
         try:
             with open(path, "r", encoding="utf-8") as f:
                 text = f.read()
-            tables = extract_tables_from_text(text, source_name=fname)
-            all_tables.extend(tables)
+            tables = extract_tables_from_text(text, source_name=fname, checkpoint=checkpoint, strict=True)
+            with open(os.path.join(TABLES_DIR, f"{stem}.json"), "w", encoding="utf-8") as fw:
+                json.dump(tables, fw, indent=2, ensure_ascii=False)
         except Exception as e:
+            failures.append(fname)
             print(f"❌ Erreur sur {fname}: {e}")
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as fw:
-        json.dump(all_tables, fw, indent=2, ensure_ascii=False)
-
-    print(f"\n✅ Tous les tableaux enregistrés dans {OUTPUT_FILE}")
+    n_tables = merge_tables(TABLES_DIR, OUTPUT_FILE)
+    print(f"\n✅ {n_tables} tableaux enregistrés dans {OUTPUT_FILE}")
+    if failures:
+        print(f"⚠️ Segments en échec dans {len(failures)} fichier(s) : relancer avec --resume")
@@ -0,0 +1,84 @@
+"""
+Suivi des tokens de prompt et du cache de préfixe des fournisseurs LLM.
+DeepSeek (prompt_cache_hit_tokens) et OpenAI (prompt_tokens_details.cached_tokens)
+facturent moins cher et répondent plus vite quand le début du prompt est identique
+à une requête récente : on mesure ici la part du prompt servie depuis ce cache.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# === CONFIG ===
+USAGE_LOG_SIZE = 500  # derniers appels gardés pour l'affichage
+
+USAGE_LOG = deque(maxlen=USAGE_LOG_SIZE)
+_log_lock = threading.Lock()
+
+
+def _get(obj, key, default=None):
+    """Lit un champ d'usage, que la réponse vienne du SDK OpenAI (objet) ou de requests (dict)."""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+def usage_metrics(usage) -> Dict:
+    """Tokens de prompt, tokens servis par le cache de préfixe et tokens générés."""
+    prompt = _get(usage, "prompt_tokens", 0) or 0
+    cached = _get(usage, "prompt_cache_hit_tokens")  # DeepSeek
+    if cached is None:
+        cached = _get(_get(usage, "prompt_tokens_details"), "cached_tokens", 0)  # OpenAI
+    cached = cached or 0
+    return {
+        "prompt_tokens": prompt,
+        "cached_tokens": cached,
+        "completion_tokens": _get(usage, "completion_tokens", 0) or 0,
+        "cache_hit_rate": round(cached / prompt, 3) if prompt else 0.0,
+    }
+
+
+def record_usage(source: str, usage, elapsed_s: Optional[float] = None) -> Dict:
+    """Enregistre l'usage d'un appel (source : assistant, diagnostic, ...) et retourne ses métriques."""
+    metrics = usage_metrics(usage)
+    metrics.update({"source": source, "time": time.time()})
+    if elapsed_s is not None:
+        metrics["elapsed_s"] = round(elapsed_s, 2)
+    with _log_lock:
+        USAGE_LOG.append(metrics)
+    return metrics
+
+
+def usage_log() -> List[Dict]:
+    with _log_lock:
+        return list(USAGE_LOG)
+
+
+def usage_summary() -> Dict[str, Dict]:
+    """Totaux par source : appels, tokens de prompt, tokens en cache, taux de hit, latence."""
+    summary, latencies = {}, {}
+    for m in usage_log():
+        s = summary.setdefault(m["source"], {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                                             "completion_tokens": 0})
+        s["calls"] += 1
+        for key in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            s[key] += m[key]
+        if "elapsed_s" in m:
+            latencies.setdefault(m["source"], []).append(m["elapsed_s"])
+    for source, s in summary.items():
+        s["cache_hit_rate"] = round(s["cached_tokens"] / s["prompt_tokens"], 3) if s["prompt_tokens"] else 0.0
+        values = sorted(latencies.get(source, []))
+        s["mean_s"] = round(sum(values) / len(values), 2) if values else None
+        s["p95_s"] = values[min(len(values) - 1, int(0.95 * len(values)))] if values else None
+    return summary
+
+
+def format_usage(metrics: Dict) -> str:
+    line = (f"🧮 {metrics['prompt_tokens']:,} tokens de prompt dont {metrics['cached_tokens']:,} en cache "
+            f"({metrics['cache_hit_rate']:.0%}) · {metrics['completion_tokens']:,} tokens générés")
+    if "elapsed_s" in metrics:
+        line += f" · {metrics['elapsed_s']:.1f} s"
+    return line.replace(",", " ")
@@ -0,0 +1,313 @@
+"""
+Extraction locale (sans LLM) des tableaux des PDF, au même format que llm_structure :
+    {"source": ..., "titre": ..., "unit": ..., "data": [{"label": ..., "2014": 742628, ...}]}
+
+Les tableaux exposés par pdfplumber (et, en option, par Unstructured en hi_res) sont
+convertis de façon déterministe : nombres à la française, colonnes d'années (N, N-1),
+unité. Chaque tableau reçoit une confiance ; seules les pages dont un tableau est peu
+fiable (ou dont le texte est tabulaire sans tableau détecté) sont envoyées au LLM.
+
+Usage : python local_tables.py [dossier]  → rapport hors ligne (tableaux locaux, pages pour le LLM).
+"""
+
+import os
+import re
+import sys
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+import pdfplumber
+
+from ocr import fill_missing_text
+from table_detect import has_tabular_content
+from table_query import column_period, parse_number
+
+# === CONFIG ===
+MIN_CONFIDENCE = float(os.getenv("LOCAL_TABLES_MIN_CONFIDENCE", "0.75"))
+MIN_NUMERIC_SHARE = 0.2  # en dessous : tableau non chiffré (organigramme, liste de noms), ignoré
+NUMERIC_COLUMN_SHARE = 0.6  # part de cellules numériques pour qu'une colonne soit une colonne de valeurs
+TITLE_MARGIN = 60  # hauteur (points) lue au-dessus d'un tableau pour son titre
+UNSTRUCTURED_TABLES = os.getenv("UNSTRUCTURED_TABLES") == "1"  # hi_res : lent, modèles de détection requis
+
+DATE_CELL_RE = re.compile(r"\d{1,2}[./]\d{1,2}(?:[./]\d{2,4})?")
+UNIT_PATTERNS = [
+    (re.compile(r"\bk\s?€|\bkeur\b|milliers d.euros|en milliers", re.I), "KEUR"),
+    (re.compile(r"\bm\s?€|millions d.euros", re.I), "MEUR"),
+    (re.compile(r"€|\beur(?:os)?\b", re.I), "EUR"),
+]
+
+
+# === CELLULES ===
+def clean_cell(cell) -> str:
+    return re.sub(r"\s+", " ", str(cell or "")).strip()
+
+
+def cell_number(cell: str) -> Optional[float]:
+    """
+    Valeur numérique d'une cellule. Les dates ("02.01") ne sont pas des nombres, ni les
+    cellules empilées ("118 631\n2 111"), que parse_number fusionnerait en un seul nombre.
+    """
+    if not cell or "\n" in cell or DATE_CELL_RE.fullmatch(cell):
+        return None
+    return parse_number(re.sub(r"^-\s+", "-", cell))
+
+
+def is_empty_value(cell: str) -> bool:
+    return cell in ("", "-", "–", "—", "- €", "-€", "NS", "ns", "n.d.")
+
+
+def detect_unit(*texts: str) -> Optional[str]:
+    for text in texts:
+        for pattern, unit in UNIT_PATTERNS:
+            if text and pattern.search(text):
+                return unit
+    return None
+
+
+def expand_stacked_rows(rows: List[List[str]]) -> Tuple[List[List[str]], int]:
+    """
+    pdfplumber empile parfois plusieurs lignes d'un tableau dans une cellule ("a\nb\nc").
+    Une ligne est dépliée si toutes ses cellules non vides ont le même nombre de lignes ;
+    un libellé simplement renvoyé à la ligne est recollé. Sinon la ligne est comptée
+    comme non résolue (valeurs impossibles à rattacher à leur libellé).
+    """
+    expanded, unresolved = [], 0
+    for row in rows:
+        heights = [len(c.split("\n")) for c in row if c]
+        height = max(heights, default=1)
+        if height > 1 and len(set(heights)) == 1:
+            parts = [c.split("\n") if c else [""] * height for c in row]
+            expanded.extend([clean_cell(p[i]) for p in parts] for i in range(height))
+            continue
+        stacked = [("\n" in c and cell_number(c.split("\n")[0].strip()) is not None) for c in row]
+        unresolved += any(stacked)
+        # les valeurs empilées restent non numériques : elles font baisser la confiance
+        expanded.append([c if is_stacked else clean_cell(c) for c, is_stacked in zip(row, stacked)])
+    return expanded, unresolved
+
+
+# === CONVERSION ===
+def header_names(header_rows: List[List[Optional[str]]], n_cols: int) -> List[str]:
+    """Noms de colonnes : lignes d'en-tête concaténées, cellules fusionnées (None) propagées à droite."""
+    names = [""] * n_cols
+    for row in header_rows:
+        previous = ""
+        for j in range(n_cols):
+            cell = previous if row[j] is None else row[j]
+            previous = cell
+            names[j] = f"{names[j]} {cell}".strip()
+    return names
+
+
+def column_keys(names: List[str], numeric_cols: List[int]) -> Dict[int, str]:
+    """Clés des colonnes de valeurs : période ("2015", "N-1") si elle est unique, sinon l'en-tête."""
+    periods = {j: column_period(names[j]) for j in numeric_cols}
+    keys = {}
+    for j in numeric_cols:
+        p = periods[j]
+        unique = p is not None and list(periods.values()).count(p) == 1
+        keys[j] = p if unique else (names[j] or f"col{j + 1}")
+    seen = {}
+    for j in numeric_cols:  # doublons restants ("Net", "Net") → suffixe
+        seen[keys[j]] = seen.get(keys[j], 0) + 1
+        if seen[keys[j]] > 1:
+            keys[j] = f"{keys[j]} ({seen[keys[j]]})"
+    return keys
+
+
+def parse_table(raw_rows: List[List], source: str, titre: str = "", context: str = "") -> Optional[Dict]:
+    """
+    Convertit un tableau brut (liste de lignes de cellules) au format llm_structure,
+    avec une clé "confidence" entre 0 et 1. Retourne None pour un tableau non chiffré.
+    """
+    raw_rows = [[c if c is None else str(c) for c in row] for row in raw_rows if row]
+    if len(raw_rows) < 2:
+        return None
+    n_cols = max(len(r) for r in raw_rows)
+    raw_rows = [r + [None] * (n_cols - len(r)) for r in raw_rows]
+
+    # En-tête : lignes initiales sans valeur numérique (hors années)
+    header_end = 0
+    for row in raw_rows:
+        cells = [clean_cell((c or "").split("\n")[0]) for c in row]
+        if any(cell_number(c) is not None and not column_period(c) for c in cells[1:]):
+            break
+        header_end += 1
+    if header_end == len(raw_rows):
+        return None
+    header_rows = raw_rows[:header_end]
+    body, unresolved = expand_stacked_rows([[c or "" for c in row] for row in raw_rows[header_end:]])
+
+    # Colonnes de valeurs : majoritairement numériques
+    numeric_cols = []
+    numeric_cells = filled_cells = 0
+    for j in range(n_cols):
+        values = [row[j] for row in body if not is_empty_value(row[j])]
+        numbers = [v for v in values if cell_number(v) is not None]
+        filled_cells += len(values)
+        numeric_cells += len(numbers)
+        if values and len(numbers) / len(values) >= NUMERIC_COLUMN_SHARE:
+            numeric_cols.append(j)
+    if not numeric_cols or numeric_cells / max(filled_cells, 1) < MIN_NUMERIC_SHARE:
+        return None
+    label_cols = [j for j in range(n_cols) if j not in numeric_cols]
+
+    names = header_names([[clean_cell(c) if c is not None else None for c in r] for r in header_rows], n_cols)
+    keys = column_keys(names, numeric_cols)
+
+    data, parsed, expected, labelled = [], 0, 0, 0
+    for row in body:
+        label = " ".join(row[j] for j in label_cols if row[j]).strip()
+        entry = {"label": label}
+        has_value = False
+        for j in numeric_cols:
+            value = None if is_empty_value(row[j]) else cell_number(row[j])
+            if not is_empty_value(row[j]):
+                expected += 1
+                parsed += value is not None
+            has_value = has_value or value is not None
+            entry[keys[j]] = value
+        if not has_value and not label:
+            continue
+        labelled += bool(label)
+        data.append(entry)
+    if not data:
+        return None
+
+    periods = [k for k in keys.values() if column_period(k)]
+    confidence = (parsed / max(expected, 1)) * (labelled / len(data))
+    confidence *= 1.0 if periods else 0.85
+    confidence *= 0.5 if unresolved else 1.0
+    return {
+        "source": source,
+        "titre": titre,
+        "unit": detect_unit(titre, " ".join(names), context),
+        "data": data,
+        "confidence": round(confidence, 3),
+    }
+
+
+# === PDF ===
+def table_title(page, bbox) -> str:
+    """Dernière ligne de texte au-dessus du tableau (titre probable)."""
+    top = bbox[1]
+    if top <= 1:
+        return ""
+    above = page.crop((0, max(0, top - TITLE_MARGIN), page.width, top)).extract_text() or ""
+    lines = [l.strip() for l in above.splitlines() if l.strip()]
+    return lines[-1] if lines else ""
+
+
+class _HTMLTableParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.rows, self._row, self._cell = [], None, None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th"):
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._row is not None and self._cell is not None:
+            self._row.append("".join(self._cell).strip())
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def rows_from_html(html: str) -> List[List[str]]:
+    """Lignes d'un tableau HTML (metadata.text_as_html des éléments Unstructured)."""
+    parser = _HTMLTableParser()
+    parser.feed(html)
+    return parser.rows
+
+
+def unstructured_tables(pdf_path: str) -> Dict[int, List[List[List[str]]]]:
+    """Tableaux structurés détectés par Unstructured (hi_res), par numéro de page (base 0)."""
+    from unstructured.partition.pdf import partition_pdf
+
+    by_page = {}
+    for el in partition_pdf(pdf_path, strategy="hi_res", infer_table_structure=True):
+        html = getattr(el.metadata, "text_as_html", None)
+        if el.category == "Table" and html:
+            by_page.setdefault((el.metadata.page_number or 1) - 1, []).append(rows_from_html(html))
+    return by_page
+
+
+def extract_local_tables(pdf_path: str, source: str) -> Tuple[List[Dict], List[Tuple[int, str]]]:
+    """
+    Tableaux d'un PDF convertis localement, et pages à confier au LLM (numéro, texte) :
+    tableau de confiance insuffisante, ou texte tabulaire sans tableau détecté.
+    """
+    tables, llm_pages = [], []
+    extra = unstructured_tables(pdf_path) if UNSTRUCTURED_TABLES else {}
+    with pdfplumber.open(pdf_path) as pdf:
+        # Pages scannées : texte OCR (en cache après l'extraction), confié au LLM s'il est tabulaire
+        texts = fill_missing_text(pdf_path, pdf, [page.extract_text() or "" for page in pdf.pages])
+        for page_no, page in enumerate(pdf.pages):
+            text = texts[page_no]
+            found = [(t.extract(), table_title(page, t.bbox)) for t in page.find_tables()]
+            found += [(rows, "") for rows in extra.get(page_no, [])]
+
+            page_tables, low_confidence = [], False
+            for rows, titre in found:
+                table = parse_table(rows, source, titre=titre)
+                if table is None:
+                    continue
+                if table["confidence"] >= MIN_CONFIDENCE:
+                    page_tables.append(table)
+                else:
+                    low_confidence = True
+
+            if low_confidence or (not page_tables and has_tabular_content(text)):
+                llm_pages.append((page_no, text))  # la page entière : pas de doublon local
+            else:
+                tables.extend(page_tables)
+    return tables, llm_pages
+
+
+def extract_tables_hybrid(pdf_path: str, source: str, checkpoint: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Tableaux locaux + LLM sur les seules pages peu fiables ; retourne (tableaux, statistiques).
+    `checkpoint` : point de reprise JSONL des segments LLM (cf. llm_structure).
+    """
+    tables, llm_pages = extract_local_tables(pdf_path, source)
+    stats = {"local_tables": len(tables), "llm_pages": len(llm_pages), "llm_tables": 0}
+    if llm_pages:
+        from llm_structure import extract_tables_from_text
+
+        # Pages déjà retenues pour le LLM : pas de second pré-filtrage qui pourrait les écarter
+        llm_tables = extract_tables_from_text("\n\n".join(text for _, text in llm_pages), source_name=source,
+                                              checkpoint=checkpoint, strict=True, prefilter=False)
+        stats["llm_tables"] = len(llm_tables)
+        tables.extend(llm_tables)
+    for table in tables:
+        table.pop("confidence", None)
+    print(f"📊 {source} : {stats['local_tables']} tableaux locaux, "
+          f"{stats['llm_pages']} pages envoyées au LLM ({stats['llm_tables']} tableaux)")
+    return tables, stats
+
+
+# === RAPPORT ===
+if __name__ == "__main__":
+    from dossiers import DEFAULT_DOSSIER, dossier_paths
+
+    raw_dir = dossier_paths(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DOSSIER)["raw_dir"]
+    total_tables = total_pages = total_llm = 0
+    for filename in sorted(f for f in os.listdir(raw_dir) if f.lower().endswith(".pdf")):
+        path = os.path.join(raw_dir, filename)
+        local, pages = extract_local_tables(path, os.path.splitext(filename)[0] + ".txt")
+        with pdfplumber.open(path) as pdf:
+            n_pages = len(pdf.pages)
+        total_tables += len(local)
+        total_pages += n_pages
+        total_llm += len(pages)
+        print(f"📄 {filename[:50]:<50} {len(local):>4} tableaux locaux, {len(pages):>3}/{n_pages} pages pour le LLM")
+    print(f"\n✅ {total_tables} tableaux extraits localement ; {total_llm}/{total_pages} pages restent pour le LLM")
@@ -1,24 +1,38 @@
-import sys
-import os
-from pdf_extract import extract_pdfs  
+import argparse
+
+from dossiers import DEFAULT_DOSSIER
+from pipeline import run_pipeline
 
 
 def main():
     """
-    Point d'entrée principal du script.
-    - Vérifie la présence du dossier 'pdfs'
-    - Lance l'extraction
+    Point d'entrée principal : amène un dossier de raw_data/ à un index interrogeable.
+    - Extraction PDF → texte (un processus par PDF)
+    - Structuration des tableaux (DeepSeek) puis fusion dans all_tables.json
+    - Découpage, embeddings, index FAISS et BM25
+    Seules les étapes dont les entrées ont changé sont relancées (cf. pipeline.py).
     """
-    print("🚀 Lancement de l’extraction PDF vers texte/tableaux...\n")
-    
-    # Appel de ta fonction d'extraction
-    extract_pdfs(pdf_folder="pdfs", output_folder="outputs")
+    parser = argparse.ArgumentParser(description="Pipeline complet d'un dossier : PDF → index")
+    parser.add_argument("dossier", nargs="?", default=DEFAULT_DOSSIER, help="dossier à traiter (cf. dossiers.py)")
+    parser.add_argument("--force", action="store_true", help="relance toutes les étapes")
+    parser.add_argument("--workers", type=int, default=None, help="processus pour l'extraction et l'indexation")
+    parser.add_argument("--trust-existing", action="store_true",
+                        help="considère à jour les sorties déjà présentes sans empreinte (première exécution)")
+    parser.add_argument("--dry-run", action="store_true", help="affiche les étapes à relancer sans les exécuter")
+    args = parser.parse_args()
 
-    print("\n🎯 Extraction terminée. Les fichiers sont disponibles dans le dossier 'outputs/'.")
+    print("🚀 Lancement du pipeline PDF → textes → tableaux → index...\n")
+    status = run_pipeline(args.dossier, force=args.force, workers=args.workers,
+                          trust_existing=args.trust_existing, dry_run=args.dry_run)
+    for name, s in status.items():
+        if s != "à jour":
+            print(f"   {s:<11} {name}")
+    if any(s in ("échec", "bloquée") for s in status.values()):
+        raise SystemExit(1)
 
 
 # ------------------------------------------------------
 # 🏁 Exécution directe
 # ------------------------------------------------------
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
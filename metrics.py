@@ -0,0 +1,88 @@
+"""
+Instrumentation de l'application (processus Streamlit) : latence de chaque étape
+(recherche, re-classement, contexte, appels LLM, agents...), erreurs et grandeurs
+associées (taille de contexte, tokens). Les mesures sont gardées en mémoire sur une
+fenêtre glissante et affichées par la page « 📈 Performances » de app.py.
+
+    from metrics import timed
+    with timed("rag", "context") as info:
+        context = ...
+        info["context_chars"] = len(context)
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+# === CONFIG ===
+EVENTS_SIZE = 5000  # mesures gardées (toutes étapes confondues)
+
+_events = deque(maxlen=EVENTS_SIZE)
+_errors = defaultdict(int)
+_lock = threading.Lock()
+
+
+def record(component: str, stage: str, seconds: float, **extra):
+    """Enregistre la durée d'une étape (et ses grandeurs : context_chars, tokens...)."""
+    event = {"component": component, "stage": stage, "seconds": round(seconds, 4), "time": time.time(), **extra}
+    with _lock:
+        _events.append(event)
+
+
+def record_error(component: str, stage: str):
+    with _lock:
+        _errors[(component, stage)] += 1
+
+
+@contextmanager
+def timed(component: str, stage: str):
+    """Chronomètre un bloc ; le dict fourni reçoit les grandeurs à enregistrer avec la durée."""
+    info = {}
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception:
+        record_error(component, stage)
+        raise
+    record(component, stage, time.perf_counter() - start, **info)
+
+
+def recent(n: int = 100) -> List[Dict]:
+    with _lock:
+        return list(_events)[-n:][::-1]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stage_summary() -> List[Dict]:
+    """Par composant et étape : appels, erreurs, latence moyenne / p50 / p95 / max, moyennes des grandeurs."""
+    with _lock:
+        events = list(_events)
+        errors = dict(_errors)
+    groups = defaultdict(list)
+    for e in events:
+        groups[(e["component"], e["stage"])].append(e)
+    rows = []
+    for key in sorted(set(groups) | set(errors)):
+        items = groups.get(key, [])
+        durations = [e["seconds"] for e in items]
+        row = {
+            "component": key[0], "stage": key[1], "calls": len(items), "errors": errors.get(key, 0),
+            "mean_s": round(sum(durations) / len(durations), 3) if durations else 0.0,
+            "p50_s": percentile(durations, 0.5), "p95_s": percentile(durations, 0.95),
+            "max_s": max(durations, default=0.0),
+        }
+        extras = {k for e in items for k, v in e.items()
+                  if k not in ("component", "stage", "seconds", "time") and isinstance(v, (int, float))}
+        for k in sorted(extras):
+            values = [e[k] for e in items if isinstance(e.get(k), (int, float))]
+            row[f"mean_{k}"] = round(sum(values) / len(values), 1)
+        rows.append(row)
+    return rows
@@ -0,0 +1,185 @@
+"""
+OCR sélectif des pages scannées (Tesseract), page par page.
+
+Une page est considérée comme scannée quand pdfplumber n'y trouve presque pas de texte
+alors qu'une image en couvre la majeure partie (les scans du greffe ne portent qu'une
+mention « Première page »...). Seules ces pages sont rastérisées (pypdfium2, résolution
+OCR_DPI) puis passées à Tesseract, en parallèle dans un pool de processus : un document
+mixte ne paie que ses pages scannées.
+
+Le texte reconnu est mis en cache par empreinte de page (flux de contenu et images de la
+page, langue, résolution) : une page déjà lue n'est jamais ré-OCRisée, même dans un
+autre PDF ou un autre dossier.
+
+Nécessite le binaire tesseract et ses données de langue (apt install tesseract-ocr-fra) ;
+à défaut, les pages scannées gardent leur maigre couche texte, avec un avertissement.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import pypdfium2
+
+from file_utils import atomic_write
+
+# === CONFIG ===
+OCR_ENABLED = os.getenv("OCR", "1") != "0"
+OCR_LANG = os.getenv("OCR_LANG", "fra")
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))  # 200 : plus rapide, 300 : recommandé pour Tesseract
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "data/ocr_cache")
+OCR_VERSION = 1  # à incrémenter si le prétraitement change : invalide le cache
+MIN_TEXT_CHARS = 200  # en dessous, la page n'a pas de vraie couche texte
+MIN_IMAGE_COVERAGE = 0.5  # part de la page couverte par des images pour une page scannée
+MISSING_LANG_MARKERS = ("Failed loading language", "Error opening data file")  # stderr de tesseract
+
+_tesseract_missing = False
+
+
+# === DÉTECTION ===
+def image_coverage(page) -> float:
+    """Part de la surface d'une page pdfplumber couverte par ses images."""
+    area = float(page.width * page.height) or 1.0
+    covered = sum(max(0.0, min(img["x1"], page.width) - max(img["x0"], 0))
+                  * max(0.0, min(img["bottom"], page.height) - max(img["top"], 0)) for img in page.images)
+    return min(1.0, covered / area)
+
+
+def needs_ocr(page, text: str) -> bool:
+    """Page scannée : presque pas de texte extrait, une image occupe l'essentiel de la page."""
+    return len(text.strip()) < MIN_TEXT_CHARS and image_coverage(page) >= MIN_IMAGE_COVERAGE
+
+
+def page_fingerprint(page, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> str:
+    """Empreinte du contenu d'une page (flux de dessin + images) et des paramètres d'OCR."""
+    h = hashlib.sha256(f"{OCR_VERSION}|{lang}|{dpi}".encode())
+    for stream in page.page_obj.contents or []:
+        try:
+            h.update(stream.get_data() or b"")
+        except Exception:
+            pass  # flux illisible : les images suffisent à identifier un scan
+    for img in page.images:
+        h.update(img["stream"].get_rawdata() or b"")
+    return h.hexdigest()
+
+
+# === CACHE ===
+def cache_path(fingerprint: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, fingerprint[:2], f"{fingerprint}.txt")
+
+
+def cached_text(fingerprint: str) -> Optional[str]:
+    path = cache_path(fingerprint)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# === OCR ===
+def _init_worker():
+    # Un processus par page : Tesseract ne doit pas lancer ses propres threads en plus
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def ocr_page(pdf_path: str, page_no: int, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> str:
+    """Rastérise une page (base 0) à `dpi` et retourne le texte reconnu par Tesseract."""
+    import pytesseract
+
+    pdf = pypdfium2.PdfDocument(pdf_path)
+    try:
+        image = pdf[page_no].render(scale=dpi / 72, grayscale=True).to_pil()
+    finally:
+        pdf.close()
+    return pytesseract.image_to_string(image, lang=lang).strip()
+
+
+def disable_ocr(reason) -> Dict[int, str]:
+    """Tesseract inutilisable : plus aucune tentative d'OCR dans ce processus."""
+    global _tesseract_missing
+    _tesseract_missing = True
+    print(f"⚠️ OCR indisponible ({reason}) : pages scannées gardées sans OCR")
+    return {}
+
+
+def is_setup_error(error: Exception) -> bool:
+    """Erreur d'installation (binaire ou langue absents) plutôt qu'échec propre à une page."""
+    import pytesseract
+    if isinstance(error, pytesseract.TesseractNotFoundError):
+        return True
+    return any(marker in str(error) for marker in MISSING_LANG_MARKERS)
+
+
+def page_failed(pdf_path: str, page_no: int, error: Exception) -> bool:
+    """Signale l'échec d'OCR d'une page ; True si c'est tout l'OCR qui est hors service."""
+    if is_setup_error(error):
+        disable_ocr(error)
+        return True
+    print(f"⚠️ OCR impossible page {page_no + 1} de {os.path.basename(pdf_path)} ({error}) : page gardée sans OCR")
+    return False
+
+
+def ocr_pages(pdf_path: str, page_numbers: List[int], dpi: int = OCR_DPI, lang: str = OCR_LANG,
+              workers: int = OCR_WORKERS) -> Dict[int, str]:
+    """
+    OCR de plusieurs pages d'un PDF, en parallèle si plusieurs pages et plusieurs workers.
+    Une page en échec est simplement omise ; seule une installation défaillante coupe l'OCR.
+    """
+    if not page_numbers or _tesseract_missing:
+        return {}
+    try:
+        import pytesseract  # noqa: F401
+    except ImportError:
+        return disable_ocr("pytesseract non installé")
+
+    texts = {}
+    workers = min(workers, len(page_numbers))
+    if workers <= 1:
+        for n in page_numbers:
+            try:
+                texts[n] = ocr_page(pdf_path, n, dpi, lang)
+            except (OSError, RuntimeError) as e:
+                if page_failed(pdf_path, n, e):
+                    break
+        return texts
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {n: pool.submit(ocr_page, pdf_path, n, dpi, lang) for n in page_numbers}
+        for n, future in futures.items():
+            try:
+                texts[n] = future.result()
+            except (OSError, RuntimeError) as e:
+                if page_failed(pdf_path, n, e):
+                    pool.shutdown(cancel_futures=True)
+                    break
+    return texts
+
+
+def fill_missing_text(pdf_path: str, pdf, texts: List[str], page_offset: int = 0,
+                      workers: int = OCR_WORKERS) -> List[str]:
+    """
+    Remplace le texte des pages scannées par leur OCR (cache, sinon Tesseract).
+    `pdf` : document pdfplumber ouvert ; `texts[i]` correspond à la page `page_offset + i`.
+    """
+    if not OCR_ENABLED:
+        return texts
+    texts = list(texts)
+    todo = {}  # numéro de page → empreinte
+    for i, text in enumerate(texts):
+        page = pdf.pages[page_offset + i]
+        if not needs_ocr(page, text):
+            continue
+        fingerprint = page_fingerprint(page)
+        cached = cached_text(fingerprint)
+        if cached is not None:
+            texts[i] = cached or text
+        else:
+            todo[page_offset + i] = fingerprint
+
+    if todo:
+        print(f"🔎 OCR de {len(todo)} page(s) scannée(s) de {os.path.basename(pdf_path)} ({OCR_DPI} dpi)")
+    for page_no, ocr_text in ocr_pages(pdf_path, sorted(todo), workers=workers).items():
+        atomic_write(cache_path(todo[page_no]), ocr_text)
+        texts[page_no - page_offset] = ocr_text or texts[page_no - page_offset]
+    return texts
@@ -1,30 +1,48 @@
 import os
+import argparse
 import pdfplumber
 from unstructured.partition.pdf import partition_pdf
 from typing import List, Dict, Union
+from doc_metadata import format_page
+from dossiers import DEFAULT_DOSSIER, dossier_paths
+from ocr import OCR_WORKERS, fill_missing_text
+from profiler import NULL_PROFILER, RunProfiler
+from table_detect import has_tabular_content
+
+TEXT_HEADER = "===== TEXTE EXTRAIT =====\n\n"
+TABLES_HEADER = "===== TABLEAUX EXTRAITS =====\n\n"
 
 
 def detect_table(sample_text: str) -> bool:
-    """Détecte si le texte ressemble à un tableau."""
-    lines = sample_text.split("\n")
-    table_like = 0
-    for l in lines:
-        if "|" in l or "\t" in l:
-            table_like += 1
-        elif len(l.split()) > 8 and any(char.isdigit() for char in l):
-            table_like += 1
-    return table_like >= 3
+    """Détecte si le texte ressemble à un tableau (lignes chiffrées consécutives, colonnes)."""
+    return has_tabular_content(sample_text, min_lines=3)
+
+
+def extract_pages(path: str, profiler: RunProfiler = NULL_PROFILER, workers: int = OCR_WORKERS) -> List[str]:
+    """Texte de chaque page d’un PDF, pages scannées lues par OCR (cf. ocr.py) sur `workers` processus."""
+    with pdfplumber.open(path) as pdf:
+        with profiler.stage("text"):
+            pages = [page.extract_text() or "" for page in pdf.pages]
+        with profiler.stage("ocr"):
+            return fill_missing_text(path, pdf, pages, workers=workers)
 
 
 def extract_text_from_pdf(path: str) -> str:
-    """Extraction classique du texte d’un PDF."""
-    text = ""
+    """Extraction classique du texte d’un PDF (un bloc par page, pages vides comprises)."""
+    return "\n\n".join(format_page(p) for p in extract_pages(path)).strip()
+
+
+def page_count(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Texte des pages [start, end) d'un PDF (une chaîne par page, vide si pas de texte)."""
     with pdfplumber.open(path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n\n"
-    return text.strip()
+        pages = [page.extract_text() or "" for page in pdf.pages[start:end]]
+        # Déjà dans un processus d'extraction : OCR des pages scannées sans pool supplémentaire
+        return fill_missing_text(path, pdf, pages, page_offset=start, workers=1)
 
 
 def extract_tables_with_unstructured(path: str) -> List[Dict]:
@@ -37,31 +55,49 @@ def extract_tables_with_unstructured(path: str) -> List[Dict]:
     return tables
 
 
-def smart_extract(pdf_path: str) -> str:
-    """Extrait tout le contenu d’un PDF (texte + tableaux) en texte structuré."""
-    combined_output = ""
+def format_tables(tables: List[str]) -> str:
+    """Section "tableaux" du texte extrait (vide s'il n'y a aucun tableau)."""
+    if not tables:
+        return ""
+    return TABLES_HEADER + "".join(f"[Tableau {i}]\n{t}\n\n" for i, t in enumerate(tables, start=1))
+
 
-    # 1️⃣ Détection du type
+def extract_tables_section(pdf_path: str) -> str:
+    """Détecte les tableaux sur la première page et, le cas échéant, les extrait via Unstructured."""
     with pdfplumber.open(pdf_path) as pdf:
         sample_text = pdf.pages[0].extract_text() or ""
+    if not detect_table(sample_text):
+        return ""
+    return format_tables(extract_tables_with_unstructured(pdf_path))
+
+
+def smart_extract(pdf_path: str, profiler: RunProfiler = NULL_PROFILER, workers: int = OCR_WORKERS) -> str:
+    """Extrait tout le contenu d’un PDF (texte + tableaux) en texte structuré (`workers` : pool d'OCR)."""
+    combined_output = ""
 
-    # 2️⃣ Extraction texte
-    text_content = extract_text_from_pdf(pdf_path)
-    combined_output += "===== TEXTE EXTRAIT =====\n\n"
-    combined_output += text_content + "\n\n"
+    # 1️⃣ Détection du type, sur la couche texte native : un scan n'est pas confié
+    # à partition_pdf (qui ferait l'OCR du document entier)
+    with profiler.stage("detect"):
+        with pdfplumber.open(pdf_path) as pdf:
+            sample_text = pdf.pages[0].extract_text() or ""
+        has_tables = detect_table(sample_text)
+
+    # 2️⃣ Extraction texte (OCR des seules pages scannées)
+    pages = extract_pages(pdf_path, profiler, workers)
+    combined_output += TEXT_HEADER
+    # Un bloc par page, pages vides comprises : le n-ième bloc est la page n (cf. doc_metadata.py)
+    combined_output += "\n\n".join(format_page(p) for p in pages).strip() + "\n\n"
 
     # 3️⃣ Extraction tableaux
-    if detect_table(sample_text):
-        tables = extract_tables_with_unstructured(pdf_path)
-        if tables:
-            combined_output += "===== TABLEAUX EXTRAITS =====\n\n"
-            for i, t in enumerate(tables, start=1):
-                combined_output += f"[Tableau {i}]\n{t}\n\n"
+    if has_tables:
+        with profiler.stage("tables"):
+            tables = extract_tables_with_unstructured(pdf_path)
+        combined_output += format_tables(tables)
 
     return combined_output.strip()
 
 
-def process_folder(input_folder: str, output_folder: str):
+def process_folder(input_folder: str, output_folder: str, profiler: RunProfiler = NULL_PROFILER):
     """Parcourt tous les PDF d’un dossier et crée un .txt pour chacun."""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -73,16 +109,32 @@ def process_folder(input_folder: str, output_folder: str):
             print(f"📄 Extraction de {filename}...")
 
             try:
-                extracted = smart_extract(pdf_path)
-                with open(output_path, "w", encoding="utf-8") as f:
+                extracted = smart_extract(pdf_path, profiler)
+                with profiler.stage("write"), open(output_path, "w", encoding="utf-8") as f:
                     f.write(extracted)
                 print(f"✅ Fichier extrait → {output_path}")
             except Exception as e:
                 print(f"❌ Erreur sur {filename}: {e}")
 
 
-if __name__ == "__main__":
-    input_folder = "data"
-    output_folder = "outputs"
+def extract_pdfs(pdf_folder: str = None, output_folder: str = None, profiler: RunProfiler = NULL_PROFILER):
+    """Extrait les PDF d'un dossier (par défaut raw_data/ → texts/ du dossier courant)."""
+    paths = dossier_paths(DEFAULT_DOSSIER)
+    process_folder(pdf_folder or paths["raw_dir"], output_folder or paths["text_dir"], profiler)
 
-    process_folder(input_folder, output_folder)
+
+if __name__ == "__main__":
+    default_paths = dossier_paths(DEFAULT_DOSSIER)
+    parser = argparse.ArgumentParser(description="Extraction texte + tableaux des PDF d'un dossier")
+    parser.add_argument("input_folder", nargs="?", default=default_paths["raw_dir"])
+    parser.add_argument("output_folder", nargs="?", default=default_paths["text_dir"])
+    parser.add_argument("--profile", action="store_true", help="écrit un rapport de profilage JSON (profiles/)")
+    parser.add_argument("--tracemalloc", action="store_true", help="avec --profile : principaux allocateurs Python")
+    args = parser.parse_args()
+
+    profiler = RunProfiler("extraction", enabled=args.profile, trace_malloc=args.tracemalloc)
+    extract_pdfs(args.input_folder, args.output_folder, profiler)
+
+    if args.profile:
+        profiler.meta.update({"input_folder": args.input_folder, "output_folder": args.output_folder})
+        print(f"📈 Rapport de profilage : {profiler.save()}")
@@ -0,0 +1,287 @@
+"""
+Pipeline incrémental d'un dossier : PDF bruts → textes → tableaux → index interrogeable.
+
+Les étapes forment un graphe de dépendances :
+
+    extract:<pdf>  ──►  structure:<txt>  ──►  merge_tables
+          │
+          └──────────────►  index  (chunks + embeddings + FAISS + BM25)
+
+Chaque tâche a une empreinte (hash de ses fichiers d'entrée + paramètres) enregistrée
+dans pipeline_state.json : une tâche n'est relancée que si son empreinte a changé ou
+si l'une de ses sorties manque. Les tâches indépendantes tournent en parallèle
+(extraction et indexation dans des processus, appels LLM dans des threads).
+
+Usage : python main.py [dossier] [--force] [--workers N] [--trust-existing] [--dry-run]
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from dossiers import DEFAULT_DOSSIER, dossier_paths
+from file_utils import atomic_write, file_sha256
+
+# === CONFIG ===
+PIPELINE_VERSION = 1
+STRUCTURE_WORKERS = 4  # appels DeepSeek simultanés
+
+
+# === FICHIERS ===
+def list_files(folder: str, extension: str) -> List[str]:
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(extension))
+
+
+def stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# === TÂCHES (fonctions de niveau module : exécutables dans un autre processus) ===
+def run_extract(pdf_path: str, txt_path: str):
+    from pdf_extract import smart_extract
+    # Déjà un processus par PDF : OCR sans pool supplémentaire (sinon cpu² processus Tesseract)
+    atomic_write(txt_path, smart_extract(pdf_path, workers=1))
+
+
+def run_structure(txt_path: str, json_path: str, pdf_path: Optional[str] = None):
+    """Tableaux d'une source : extraction locale depuis le PDF (LLM en secours), sinon LLM sur le texte."""
+    source = os.path.basename(txt_path)
+    checkpoint = f"{os.path.splitext(json_path)[0]}.jsonl"  # segments LLM déjà traités (reprise)
+    if pdf_path is not None:
+        from local_tables import extract_tables_hybrid
+        tables, _ = extract_tables_hybrid(pdf_path, source, checkpoint=checkpoint)
+    else:
+        from llm_structure import extract_tables_from_text
+        with open(txt_path, "r", encoding="utf-8") as f:
+            tables = extract_tables_from_text(f.read(), source_name=source, checkpoint=checkpoint, strict=True)
+    atomic_write(json_path, json.dumps(tables, indent=2, ensure_ascii=False))
+
+
+def run_merge(tables_dir: str, tables_path: str):
+    from llm_structure import merge_tables
+    merge_tables(tables_dir, tables_path)
+
+
+def run_index(dossier: str):
+    from chunking import build_dossier_index
+    build_dossier_index(dossier)
+
+
+class Task:
+    """Nœud du graphe : une fonction, ses fichiers d'entrée/sortie et ses dépendances."""
+
+    def __init__(self, name: str, func: Callable, args: tuple, inputs: List[str], outputs: List[str],
+                 params: Optional[Dict] = None, deps: Optional[List[str]] = None, kind: str = "thread"):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        self.deps = deps or []
+        self.kind = kind  # "process" (CPU) ou "thread" (E/S, appels réseau)
+
+    def fingerprint(self, hash_cache: Dict) -> str:
+        """Empreinte calculée juste avant l'exécution (les entrées viennent d'être produites)."""
+        h = hashlib.sha256()
+        h.update(json.dumps({"version": PIPELINE_VERSION, "task": self.name, "params": self.params},
+                            sort_keys=True).encode())
+        for path in sorted(self.inputs):
+            h.update(path.encode())
+            h.update(file_sha256(path, hash_cache).encode() if os.path.exists(path) else b"-")
+        return h.hexdigest()
+
+
+# === ÉTAT ===
+def load_state(path: str) -> Dict:
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == PIPELINE_VERSION:
+            return state
+    return {"version": PIPELINE_VERSION, "hashes": {}, "tasks": {}}
+
+
+def save_state(path: str, state: Dict):
+    atomic_write(path, json.dumps(state, indent=2, ensure_ascii=False))
+
+
+def seed_tables_dir(paths: Dict[str, str]):
+    """Dossier existant : découpe all_tables.json par source pour ne pas relancer le LLM."""
+    if os.path.isdir(paths["tables_dir"]) or not os.path.exists(paths["tables"]):
+        return
+    with open(paths["tables"], "r", encoding="utf-8") as f:
+        all_tables = json.load(f)
+    by_source = {}
+    for table in all_tables:
+        by_source.setdefault(stem(table.get("source") or "sans_source"), []).append(table)
+    for name, tables in by_source.items():
+        atomic_write(os.path.join(paths["tables_dir"], f"{name}.json"),
+                     json.dumps(tables, indent=2, ensure_ascii=False))
+    print(f"🌱 {len(all_tables)} tableaux existants répartis en {len(by_source)} fichiers dans {paths['tables_dir']}")
+
+
+# === GRAPHE ===
+def plan(dossier: str) -> List[Task]:
+    """Construit le graphe des tâches d'un dossier à partir de raw_data/ et texts/."""
+    from chunking import CHUNK_OVERLAP, CHUNK_SIZE, INDEX_STORAGE, MODEL_NAME, NORMALIZE
+    from embedding_backend import EMBEDDING_BACKEND
+    from llm_structure import DEEPSEEK_MODEL, MAX_SEGMENT_TOKENS, PROMPT_VERSION
+    from local_tables import MIN_CONFIDENCE, UNSTRUCTURED_TABLES
+    from table_detect import DETECT_VERSION
+    from ocr import OCR_DPI, OCR_ENABLED, OCR_LANG, OCR_VERSION
+    from doc_metadata import METADATA_VERSION, PAGE_FORMAT_VERSION
+    from index_generations import current_path
+    from text_normalize import NORMALIZE_VERSION
+
+    paths = dossier_paths(dossier)
+    tasks = []
+    producers = {}  # fichier texte → tâche qui le produit
+    pdf_of = {}  # fichier texte → PDF d'origine (extraction locale des tableaux)
+
+    for pdf in list_files(paths["raw_dir"], ".pdf"):
+        txt = os.path.join(paths["text_dir"], f"{stem(pdf)}.txt")
+        tasks.append(Task(f"extract:{os.path.basename(pdf)}", run_extract, (pdf, txt),
+                          inputs=[pdf], outputs=[txt], kind="process",
+                          params={"ocr": OCR_ENABLED and [OCR_LANG, OCR_DPI, OCR_VERSION],
+                                  "pages": PAGE_FORMAT_VERSION}))
+        producers[txt] = tasks[-1].name
+        pdf_of[txt] = pdf
+
+    # Les textes déposés directement dans texts/ sont aussi structurés et indexés
+    texts = sorted(set(producers) | set(list_files(paths["text_dir"], ".txt")))
+
+    table_files = []
+    for txt in texts:
+        out = os.path.join(paths["tables_dir"], f"{stem(txt)}.json")
+        pdf = pdf_of.get(txt)
+        params = {"model": DEEPSEEK_MODEL, "prompt": PROMPT_VERSION, "max_segment_tokens": MAX_SEGMENT_TOKENS,
+                  "normalize": NORMALIZE_VERSION, "detect": DETECT_VERSION}
+        if pdf:
+            params.update({"local_min_confidence": MIN_CONFIDENCE, "unstructured": UNSTRUCTURED_TABLES})
+        tasks.append(Task(f"structure:{os.path.basename(txt)}", run_structure, (txt, out, pdf),
+                          inputs=[txt] + ([pdf] if pdf else []), outputs=[out], params=params,
+                          deps=[producers[txt]] if txt in producers else []))
+        table_files.append(out)
+
+    # Les fichiers de tableaux sans texte associé (saisie manuelle, anciennes sources) sont conservés
+    merge_inputs = sorted(set(table_files) | set(list_files(paths["tables_dir"], ".json")))
+    tasks.append(Task("merge_tables", run_merge, (paths["tables_dir"], paths["tables"]),
+                      inputs=merge_inputs, outputs=[paths["tables"]],
+                      deps=[t.name for t in tasks if t.name.startswith("structure:")]))
+
+    tasks.append(Task("index", run_index, (dossier,), inputs=texts,
+                      outputs=[current_path(dossier)],  # génération publiée en dernier (cf. index_generations.py)
+                      params={"model": MODEL_NAME, "backend": EMBEDDING_BACKEND, "storage": INDEX_STORAGE,
+                              "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                              "normalize": NORMALIZE and NORMALIZE_VERSION, "metadata": METADATA_VERSION},
+                      deps=list(producers.values()), kind="process"))
+    return tasks
+
+
+def prune_stale_outputs(tasks: List[Task], state: Dict) -> bool:
+    """Supprime les sorties de tâches disparues du graphe (PDF retiré de raw_data/...)."""
+    current = {t.name for t in tasks}
+    stale = [n for n in state["tasks"] if n not in current]
+    for name in stale:
+        for path in state["tasks"][name].get("outputs", []):
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"🗑️ Sortie obsolète supprimée : {path}")
+        del state["tasks"][name]
+    return bool(stale)
+
+
+def run_pipeline(dossier: str = DEFAULT_DOSSIER, force: bool = False, workers: Optional[int] = None,
+                 trust_existing: bool = False, dry_run: bool = False) -> Dict[str, str]:
+    """
+    Exécute le graphe d'un dossier en ne relançant que les tâches dont l'empreinte a changé.
+    Retourne le statut de chaque tâche (ok, à jour, échec, bloquée, à relancer).
+    """
+    paths = dossier_paths(dossier)
+    workers = workers or os.cpu_count() or 1
+    state = load_state(paths["state"])
+    if not dry_run:
+        seed_tables_dir(paths)
+    tasks = plan(dossier)
+    while not dry_run and prune_stale_outputs(tasks, state):
+        tasks = plan(dossier)  # un texte supprimé retire aussi ses tableaux du graphe
+    by_name = {t.name: t for t in tasks}
+
+    status = {}
+    pending = list(tasks)
+    running = {}
+    start = time.perf_counter()
+    print(f"🚀 Pipeline {dossier} : {len(tasks)} tâches ({workers} processus)")
+
+    with ProcessPoolExecutor(max_workers=workers) as processes, \
+            ThreadPoolExecutor(max_workers=STRUCTURE_WORKERS) as threads:
+        while pending or running:
+            scheduled = len(pending)
+            for task in list(pending):
+                dep_status = [status.get(d) for d in task.deps]
+                if any(s is None for s in dep_status):
+                    continue  # dépendance encore en cours
+                pending.remove(task)
+                if any(s in ("échec", "bloquée") for s in dep_status):
+                    status[task.name] = "bloquée"
+                    print(f"⛔ {task.name} : dépendance en échec")
+                    continue
+                if dry_run and "à relancer" in dep_status:
+                    status[task.name] = "à relancer"  # ses entrées seront reproduites par la dépendance
+                    continue
+
+                fingerprint = task.fingerprint(state["hashes"])
+                previous = state["tasks"].get(task.name, {})
+                outputs_ok = all(os.path.exists(p) for p in task.outputs)
+                if trust_existing and not previous and outputs_ok:
+                    previous = {"fingerprint": fingerprint}
+                    state["tasks"][task.name] = {"fingerprint": fingerprint, "outputs": task.outputs}
+                if not force and outputs_ok and previous.get("fingerprint") == fingerprint:
+                    status[task.name] = "à jour"
+                    continue
+                if dry_run:
+                    status[task.name] = "à relancer"
+                    continue
+
+                print(f"▶️ {task.name}")
+                pool = processes if task.kind == "process" else threads
+                running[pool.submit(task.func, *task.args)] = (task, fingerprint, time.perf_counter())
+
+            if not running:
+                if len(pending) == scheduled:
+                    break  # plus rien d'exécutable
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, fingerprint, t0 = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    status[task.name] = "échec"
+                    print(f"❌ {task.name} : {e}")
+                    continue
+                status[task.name] = "ok"
+                state["tasks"][task.name] = {
+                    "fingerprint": fingerprint,
+                    "outputs": task.outputs,
+                    "duration_s": round(time.perf_counter() - t0, 2),
+                    "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                save_state(paths["state"], state)  # une tâche terminée n'est jamais refaite après une interruption
+                print(f"✅ {task.name} ({state['tasks'][task.name]['duration_s']} s)")
+
+    if not dry_run:
+        save_state(paths["state"], state)
+    counts = {s: list(status.values()).count(s) for s in sorted(set(status.values()))}
+    print(f"\n🎯 Pipeline terminé en {time.perf_counter() - start:.1f} s : "
+          + ", ".join(f"{n} {s}" for s, n in counts.items()))
+    missing = [n for n in by_name if n not in status]
+    if missing:
+        print(f"⚠️ Tâches non planifiées (dépendance inconnue) : {', '.join(missing)}")
+    return status
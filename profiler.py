@@ -0,0 +1,178 @@
+"""
+Profilage des scripts d'indexation et d'extraction.
+Mesure, pour ce processus uniquement (et non la RAM du système) : RSS courant et pic,
+temps mur et CPU par étape (lecture, découpage, encodage, ajout à l'index, sauvegarde...)
+et, en option, les principaux allocateurs Python via tracemalloc.
+Le CPU est compté en deux parts : process_cpu_s (tous les threads du processus, dont ceux
+de torch/BLAS) et children_cpu_s (processus fils terminés : pools d'encodage, d'OCR...).
+Le rapport est un JSON comparable d'une exécution à l'autre.
+
+Usage : python profiler.py avant.json apres.json  → écarts par étape.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# === CONFIG ===
+PROFILES_DIR = "profiles"
+TRACEMALLOC_TOP = 15
+
+
+# === MÉMOIRE PROCESSUS ===
+def process_rss() -> int:
+    """RSS du processus courant (octets)."""
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss() -> int:
+    """Pic de RSS du processus courant depuis son démarrage (octets)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Ko sous Linux
+    return getattr(psutil.Process().memory_info(), "peak_wset", process_rss())
+
+
+def children_cpu_time() -> float:
+    """Temps CPU (user + système) des processus fils terminés et attendus."""
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def mb(n_bytes: int) -> float:
+    return round(n_bytes / 1024 ** 2, 1)
+
+
+# === PROFILER ===
+class RunProfiler:
+    """Chronomètre des étapes d'une exécution ; inactif (coût nul) si enabled=False."""
+
+    def __init__(self, run: str, enabled: bool = True, trace_malloc: bool = False):
+        self.run = run
+        self.enabled = enabled
+        self.trace_malloc = enabled and trace_malloc
+        self.meta = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._children_cpu0 = children_cpu_time()
+        self._rss0 = process_rss() if enabled else 0
+        if self.trace_malloc:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Mesure une étape (cumulée sur tous ses appels). Le temps CPU est celui de tout le
+        processus (threads natifs de torch compris) et de ses fils terminés pendant l'étape
+        (pool fermé avant la fin de l'étape) : des étapes simultanées dans plusieurs threads
+        se comptent donc mutuellement.
+        """
+        if not self.enabled:
+            yield
+            return
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        children0 = children_cpu_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall0
+            cpu = time.process_time() - cpu0
+            children = children_cpu_time() - children0
+            rss = process_rss()
+            with self._lock:
+                s = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "process_cpu_s": 0.0,
+                                                  "children_cpu_s": 0.0, "rss_max_mb": 0.0})
+                s["calls"] += 1
+                s["wall_s"] += wall
+                s["process_cpu_s"] += cpu
+                s["children_cpu_s"] += children
+                s["rss_max_mb"] = max(s["rss_max_mb"], mb(rss))
+
+    def report(self) -> Dict:
+        report = {
+            "run": self.run,
+            "started_at": self._started_at,
+            "meta": self.meta,
+            "wall_s": round(time.perf_counter() - self._wall0, 4),
+            "process_cpu_s": round(time.process_time() - self._cpu0, 4),
+            "children_cpu_s": round(children_cpu_time() - self._children_cpu0, 4),
+            "rss_start_mb": mb(self._rss0),
+            "rss_end_mb": mb(process_rss()),
+            "peak_rss_mb": mb(max(peak_rss(), process_rss())),
+            "stages": {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in s.items()}
+                for name, s in self.stages.items()
+            },
+        }
+        if self.trace_malloc:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "current_mb": mb(current),
+                "peak_mb": mb(peak),
+                "top": [
+                    {"where": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]
+                ],
+            }
+        return report
+
+    def save(self, path: Optional[str] = None) -> Optional[str]:
+        """Écrit le rapport JSON (par défaut dans profiles/<run>_<date>.json)."""
+        if not self.enabled:
+            return None
+        if path is None:
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            path = os.path.join(PROFILES_DIR, f"{self.run}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+NULL_PROFILER = RunProfiler("noop", enabled=False)
+
+
+# === COMPARAISON ===
+def compare_reports(before: Dict, after: Dict) -> Dict:
+    """Écarts entre deux rapports (temps et mémoire, global et par étape)."""
+    def delta(a, b):
+        return {"before": a, "after": b, "delta": round(b - a, 4) if a is not None and b is not None else None}
+
+    diff = {key: delta(before.get(key), after.get(key))
+            for key in ("wall_s", "process_cpu_s", "children_cpu_s", "peak_rss_mb")}
+    diff["stages"] = {}
+    for name in sorted(set(before["stages"]) | set(after["stages"])):
+        b, a = before["stages"].get(name, {}), after["stages"].get(name, {})
+        diff["stages"][name] = {key: delta(b.get(key), a.get(key))
+                                for key in ("wall_s", "process_cpu_s", "children_cpu_s", "rss_max_mb")}
+    return diff
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        raise SystemExit("Usage : python profiler.py avant.json apres.json")
+    with open(sys.argv[1], "r", encoding="utf-8") as f1, open(sys.argv[2], "r", encoding="utf-8") as f2:
+        result = compare_reports(json.load(f1), json.load(f2))
+
+    print(f"{'étape':<14} {'mur avant':>10} {'mur après':>10} {'Δ':>9}")
+    for name, d in [("TOTAL", result["wall_s"])] + [(n, s["wall_s"]) for n, s in result["stages"].items()]:
+        fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+        print(f"{name:<14} {fmt(d['before']):>10} {fmt(d['after']):>10} {fmt(d['delta']):>9}")
+    p = result["peak_rss_mb"]
+    print(f"\n💾 Pic RSS : {p['before']} Mo → {p['after']} Mo")
@@ -1,115 +1,470 @@
 import os
-import faiss
 import json
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI  # DeepSeek utilise une interface OpenAI-compatible
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from lexical_index import HYBRID_CANDIDATES, BM25Index, hybrid_ranking
+from index_storage import load_index, search_params, storage_mode
+from doc_metadata import filter_key, matches
+from dossiers import DEFAULT_DOSSIER
+from index_generations import current_generation, index_paths
+from embedding_backend import EMBEDDING_BACKEND, check_index_compat, load_embedder
+from reranker import RERANK_CANDIDATES, RERANK_ENABLED, RERANK_TOP_K, get_reranker
+from llm_usage import format_usage
+from llm_gateway import complete
+from metrics import timed
 
 load_dotenv()
 
 
 # === CONFIG ===
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-INDEX_PATH = "index_debug.faiss"
-CHUNKS_PATH = "chunks_debug.json"
-TABLES_PATH = "data/all_tables.json"
 TOP_K = 10  # Réduit de 20 à 10 pour éviter le dépassement de contexte
+INDEX_MMAP = True  # index IVF compressé mappé en mémoire (cache de pages partagé entre processus)
+INDEX_NPROBE = 16
+MAX_LOADED_SHARDS = 32  # dossiers gardés en mémoire (LRU), les autres sont rechargés à la demande
+FANOUT_WORKERS = 8  # recherches parallèles lors d'une requête multi-dossiers
+INDEX_POLL_S = float(os.getenv("INDEX_POLL_S", "5"))  # détection des nouvelles générations d'index (0 : jamais)
+RERANK_REPORTS = 200  # derniers rapports de re-classement gardés (coût vs temps LLM économisé)
+FILTER_CACHE_SIZE = 64  # sélections de chunks gardées par dossier (filtres de métadonnées)
+SESSION_MAX_PROMPT_CHARS = 120000  # au-delà, la conversation repart d'un contexte neuf
 
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
 if not API_KEY:
     raise ValueError("⚠️ DEEPSEEK_API_KEY non définie.")
 
-client = OpenAI(
-    api_key=API_KEY,
-    base_url="https://api.deepseek.com"  # ✅ pas de /v1 ici
+LLM_MODEL = "deepseek-chat"
+# Prompt système identique pour tous les appels : début de prompt commun (cache de préfixe)
+SYSTEM_PROMPT = (
+    "Tu es un assistant juridique expert en restructuration d'entreprise. "
+    "Utilise uniquement les informations du contexte fourni pour répondre précisément."
 )
 
-LLM_MODEL = "deepseek-chat"
 
-# === INITIALISATION ===
-print("🔹 Chargement du modèle d'embedding et de l'index...")
-model = SentenceTransformer(MODEL_NAME)
-index = faiss.read_index(INDEX_PATH)
+# === SHARDS PAR DOSSIER ===
+class Shard:
+    """Index d'un dossier (génération courante) : FAISS + BM25 + chunks + tableaux."""
 
-with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-    chunks = json.load(f)
+    def __init__(self, dossier: str):
+        paths = index_paths(dossier)  # lus une fois : toute la génération ou aucune
+        self.dossier = dossier
+        self.paths = paths
+        self.generation = paths["generation"]
+        self.index = load_index(paths["index"], mmap=INDEX_MMAP, nprobe=INDEX_NPROBE)
+        if not check_index_compat(paths["index"], self.index.d, MODEL_NAME):
+            raise RuntimeError(f"⚠️ Index du dossier {dossier} incompatible avec {MODEL_NAME} : "
+                               f"relancer chunking.py {dossier}")
 
-with open(TABLES_PATH, "r", encoding="utf-8") as f:
-    tables = json.load(f)
+        with open(paths["chunks"], "r", encoding="utf-8") as f:
+            self.chunks = json.load(f)
 
-print(f"✅ Index chargé ({len(chunks)} chunks, {len(tables)} entrées tabulaires)")
+        self.tables = []
+        if os.path.exists(paths["tables"]):
+            with open(paths["tables"], "r", encoding="utf-8") as f:
+                self.tables = json.load(f)
+
+        self._selections = OrderedDict()  # clé de filtre → (indices autorisés, paramètres FAISS)
+        self._selections_lock = threading.Lock()
+
+        self.bm25 = None
+        if os.path.exists(paths["bm25"]):
+            self.bm25 = BM25Index.load(paths["bm25"])
+            if self.bm25.n_docs != len(self.chunks):
+                print(f"⚠️ [{dossier}] Index BM25 désynchronisé des chunks, recherche dense uniquement (relancer chunking.py)")
+                self.bm25 = None
+        else:
+            print(f"⚠️ [{dossier}] Index BM25 introuvable, recherche dense uniquement (relancer chunking.py)")
+
+        print(f"✅ [{dossier}] Index chargé ({len(self.chunks)} chunks, {len(self.tables)} entrées tabulaires, "
+              f"stockage {storage_mode(self.index)}, génération {self.generation or 'historique'})")
+
+    def select(self, filters):
+        """
+        Chunks satisfaisant un filtre de métadonnées (cf. doc_metadata.py) : (ensemble des
+        indices, paramètres de recherche FAISS restreinte), None sans filtre. Mis en cache.
+        """
+        key = filter_key(filters)
+        if not key:
+            return None
+        with self._selections_lock:
+            if key in self._selections:
+                self._selections.move_to_end(key)
+                return self._selections[key]
+        ids = [i for i, chunk in enumerate(self.chunks) if matches(chunk, filters)]
+        selection = (set(ids), search_params(self.index, np.array(ids, dtype="int64")) if ids else None)
+        with self._selections_lock:
+            self._selections[key] = selection
+            while len(self._selections) > FILTER_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
+
+    def dense_search(self, q_emb, top_k, params=None):
+        """Retourne les indices des chunks les plus proches de la requête (FAISS), pré-filtrés par `params`."""
+        distances, indices = self.index.search(q_emb, top_k, params=params)
+        return [int(i) for i in indices[0] if i >= 0]
+
+    def search(self, query, q_emb, top_k=TOP_K, filters=None):
+        """
+        Recherche hybride : fusionne les classements dense (FAISS) et lexical (BM25).
+        Avec `filters`, seuls les chunks aux métadonnées correspondantes sont candidats
+        (sélecteur d'identifiants FAISS, postings BM25 filtrés).
+        """
+        n_candidates = max(top_k, HYBRID_CANDIDATES)
+        selection = self.select(filters)
+        if selection is None:
+            allowed, params = None, None
+        else:
+            allowed, params = selection
+            if not allowed:
+                return []
+        dense_ranking = self.dense_search(q_emb, n_candidates, params)
+        fused = hybrid_ranking(query, dense_ranking, self.bm25, n_candidates, allowed)
+        return [(dict(self.chunks[i], dossier=self.dossier, generation=self.generation), score)
+                for i, score in fused[:top_k]]
+
+    def stats(self):
+        """Taille de l'index et des fichiers du dossier (page Performances)."""
+        paths = self.paths
+        files = {name: round(os.path.getsize(paths[name]) / 1024 ** 2, 2)
+                 for name in ("index", "chunks", "bm25", "embeddings", "tables") if os.path.exists(paths[name])}
+        return {"dossier": self.dossier, "generation": self.generation, "chunks": len(self.chunks), "vectors": self.index.ntotal,
+                "storage": storage_mode(self.index), "tables": len(self.tables),
+                "bm25": self.bm25 is not None, "files_mb": files}
+
+    def get_tabular_info(self, doc_id):
+        """Associe les infos tabulaires au document, en tolérant les variations de nom."""
+        results = []
+        doc_id_clean = os.path.splitext(doc_id.lower().strip())[0]
+        for t in self.tables:
+            src_clean = os.path.splitext(t.get("source", "").lower().strip())[0]
+            if src_clean == doc_id_clean:
+                results.append(t)
+        return results
+
+
+_shards = OrderedDict()
+_shards_lock = threading.Lock()
+_loading_locks = {}  # dossier → verrou de chargement (un seul Shard() à la fois par dossier)
+_fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS)
+
+
+def get_shard(dossier=None):
+    """
+    Retourne le shard d'un dossier, chargé à la demande (sans redémarrage de l'app).
+    Le chargement se fait hors du verrou global : les autres dossiers restent servis, et les
+    requêtes simultanées sur un dossier en cours de chargement attendent ce seul chargement.
+    """
+    dossier = dossier or DEFAULT_DOSSIER
+    with _shards_lock:
+        if dossier in _shards:
+            _shards.move_to_end(dossier)
+            return _shards[dossier]
+        loading = _loading_locks.setdefault(dossier, threading.Lock())
+    with loading:
+        with _shards_lock:
+            if dossier in _shards:  # chargé par une requête concurrente pendant l'attente
+                _shards.move_to_end(dossier)
+                return _shards[dossier]
+        shard = Shard(dossier)
+        with _shards_lock:
+            _shards[dossier] = shard
+            while len(_shards) > MAX_LOADED_SHARDS:
+                evicted, _ = _shards.popitem(last=False)
+                print(f"♻️ Dossier {evicted} déchargé de la mémoire")
+        return shard
+
+
+def swap_new_generations():
+    """
+    Recharge en tâche de fond les dossiers dont une nouvelle génération d'index a été publiée.
+    Le nouveau shard est construit hors verrou puis remplace l'ancien d'un coup : les requêtes
+    en cours finissent sur l'ancien, les suivantes utilisent le nouveau.
+    """
+    with _shards_lock:
+        loaded = list(_shards.items())
+    for dossier, shard in loaded:
+        generation = current_generation(dossier)
+        if generation is None or generation in (shard.generation, _failed_generations.get(dossier)):
+            continue
+        try:
+            fresh = Shard(dossier)
+        except Exception as e:
+            _failed_generations[dossier] = generation  # pas de nouvel essai avant la génération suivante
+            print(f"⚠️ [{dossier}] Génération {generation} non chargée, {shard.generation or 'index historique'} "
+                  f"gardé : {e}")
+            continue
+        with _shards_lock:
+            if _shards.get(dossier) is shard:  # pas déchargé ni remplacé entre-temps
+                _shards[dossier] = fresh
+        print(f"🔄 [{dossier}] Génération {fresh.generation} en service "
+              f"(précédente : {shard.generation or 'index historique'})")
+
+
+def _watch_generations():
+    while True:
+        time.sleep(INDEX_POLL_S)
+        try:
+            swap_new_generations()
+        except Exception as e:
+            print(f"⚠️ Surveillance des générations d'index : {e}")
+
+
+_failed_generations = {}  # dossier → génération dont le chargement a échoué
+if INDEX_POLL_S > 0:
+    threading.Thread(target=_watch_generations, name="index-generations", daemon=True).start()
+
+
+def loaded_shards():
+    """Statistiques des dossiers actuellement chargés en mémoire."""
+    with _shards_lock:
+        shards = list(_shards.values())
+    return [shard.stats() for shard in shards]
+
+
+# === INITIALISATION ===
+print(f"🔹 Chargement du modèle d'embedding (backend {EMBEDDING_BACKEND}) et de l'index...")
+model = load_embedder(MODEL_NAME)
+default_shard = get_shard(DEFAULT_DOSSIER)
+tables = default_shard.tables
 
-# Initialisation du client DeepSeek
-client = OpenAI(
-    api_key=API_KEY,
-    base_url="https://api.deepseek.com/v1"  # endpoint officiel DeepSeek
-)
 
 # === FONCTIONS ===
-def retrieve(query, top_k=TOP_K):
-    """Recherche les chunks les plus proches de la requête."""
-    q_emb = model.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(q_emb, top_k)
-    return [chunks[i] for i in indices[0]]
+def as_dossier_list(dossiers):
+    if not dossiers:
+        return [DEFAULT_DOSSIER]
+    if isinstance(dossiers, str):
+        return [dossiers]
+    return list(dict.fromkeys(dossiers))
 
-import os
 
-def get_tabular_info(doc_id):
+def search_hits(query, top_k, names, filters=None):
+    """Candidats (chunk, score RRF) de la recherche hybride, fusionnés entre dossiers."""
+    with timed("rag", "encode_query"):
+        q_emb = model.encode([query], convert_to_numpy=True)
+    with timed("rag", "search") as info:
+        info["dossiers"] = len(names)
+        if filters:
+            info["filtered"] = True
+        if len(names) == 1:
+            return get_shard(names[0]).search(query, q_emb, top_k, filters)
+        per_shard = _fanout_pool.map(lambda d: get_shard(d).search(query, q_emb, top_k, filters), names)
+        hits = [hit for shard_hits in per_shard for hit in shard_hits]
+        hits.sort(key=lambda x: x[1], reverse=True)
+        return hits[:top_k]
+
+
+def retrieve(query, top_k=None, dossiers=None, rerank=None, report=None, filters=None):
+    """
+    Recherche les chunks les plus pertinents. Limitée au dossier par défaut,
+    ou répartie en parallèle sur plusieurs dossiers avec fusion du top-k.
+    `filters` restreint la recherche par métadonnées avant classement, ex.
+    {"doc_type": ["jugement", "plan"], "date_from": "2024", "pages": (1, 10)} (cf. doc_metadata.py).
+    Avec re-classement (RERANK=1), RERANK_CANDIDATES candidats sont notés par le
+    cross-encoder et seuls les RERANK_TOP_K meilleurs sont gardés.
+    """
+    names = as_dossier_list(dossiers)
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    if not rerank:
+        return [chunk for chunk, _ in search_hits(query, top_k or TOP_K, names, filters)]
+
+    candidates = [chunk for chunk, _ in search_hits(query, max(RERANK_CANDIDATES, top_k or 0), names, filters)]
+    if report is not None:
+        report["baseline"] = candidates[:TOP_K]  # ce qu'aurait envoyé la recherche seule
+    with timed("rag", "rerank") as info:
+        info["candidates"] = len(candidates)
+        return get_reranker().rerank(query, candidates, top_k or RERANK_TOP_K, report=report)
+
+
+def get_tabular_info(doc_id, dossier=None):
     """Associe les infos tabulaires au document, en tolérant les variations de nom."""
-    results = []
-    doc_id_clean = os.path.splitext(doc_id.lower().strip())[0]
-    for t in tables:
-        src_clean = os.path.splitext(t.get("source", "").lower().strip())[0]
-        if src_clean == doc_id_clean:
-            results.append(t)
-    return results
-
-def build_context(query):
-    """Construit le contexte complet à envoyer au LLM."""
-    results = retrieve(query)
+    return get_shard(dossier).get_tabular_info(doc_id)
+
+
+def format_context(results, multi=False, seen_docs=None):
+    """Met en forme les chunks ; avec `seen_docs`, les tableaux d'un document ne sont ajoutés qu'une fois."""
     context = ""
     for r in results:
-        context += f"\n---\n📄 {r['doc_id']}\n{r['text']}\n"
-        tab = get_tabular_info(r["doc_id"])
+        source = f"[{r['dossier']}] {r['doc_id']}" if multi else r["doc_id"]
+        context += f"\n---\n📄 {source}\n{r['text']}\n"
+        if seen_docs is not None:
+            if (r["dossier"], r["doc_id"]) in seen_docs:
+                continue
+            seen_docs.add((r["dossier"], r["doc_id"]))
+        tab = get_tabular_info(r["doc_id"], r["dossier"])
         if tab:
             context += f"\n📊 Données tabulaires : {json.dumps(tab, ensure_ascii=False, indent=2)}\n"
     return context.strip()
 
 
+def build_context(query, dossiers=None, report=None, filters=None):
+    """
+    Construit le contexte complet à envoyer au LLM.
+    `report` (dict) reçoit le coût du re-classement et la taille du contexte évitée.
+    """
+    multi = len(as_dossier_list(dossiers)) > 1
+    report = {} if report is None else report
+    with timed("rag", "context") as info:
+        results = retrieve(query, dossiers=dossiers, report=report, filters=filters)
+        context = format_context(results, multi)
+        info["context_chars"] = len(context)
+    baseline = report.pop("baseline", None)
+    if baseline is not None:
+        report["context_chars"] = len(context)
+        report["baseline_chars"] = len(format_context(baseline, multi))
+    return context
+
+
+# === COÛT DU RE-CLASSEMENT ===
+_llm_rate = {"s_per_char": None}  # latence LLM par caractère de contexte (moyenne glissante)
+rerank_reports = deque(maxlen=RERANK_REPORTS)
+_rate_lock = threading.Lock()
+
+
+def record_llm_time(context_chars, llm_s, report=None):
+    """
+    Met à jour la latence LLM par caractère de contexte et estime le temps économisé
+    par le re-classement (contexte de base − contexte re-classé) × latence par caractère.
+    """
+    with _rate_lock:
+        if context_chars:
+            rate = llm_s / context_chars
+            previous = _llm_rate["s_per_char"]
+            _llm_rate["s_per_char"] = rate if previous is None else 0.8 * previous + 0.2 * rate
+        rate = _llm_rate["s_per_char"]
+        if report and "baseline_chars" in report:
+            report["llm_s"] = round(llm_s, 2)
+            saved_chars = report["baseline_chars"] - report["context_chars"]
+            report["llm_s_saved"] = round(saved_chars * rate, 2) if rate else None
+            rerank_reports.append(dict(report))
+
+
+def format_rerank_report(report):
+    saved = report.get("llm_s_saved")
+    saved = f"~{saved:.2f} s" if saved is not None else "n/a"
+    return (f"⚖️ Re-classement : {report['candidates']} candidats → {report['kept']} chunks en "
+            f"{report['rerank_ms']:.0f} ms ({report['cache_hits']} scores en cache) | contexte "
+            f"{report['baseline_chars']} → {report['context_chars']} caractères | "
+            f"LLM {report['llm_s']:.2f} s, temps économisé {saved}")
+
 
 def ask_deepseek(query, context):
     messages = [
-        {
-            "role": "system",
-            "content": (
-                "Tu es un assistant juridique expert en restructuration d'entreprise. "
-                "Utilise uniquement les informations du contexte fourni pour répondre précisément."
-            )
-        },
+        {"role": "system", "content": SYSTEM_PROMPT},
         {
             "role": "user",
             "content": f"Contexte :\n{context}\n\nQuestion : {query}"
         }
     ]
 
-    response = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=messages,
-        temperature=0.2,
-    )
+    # Client DeepSeek partagé (connexions gardées ouvertes, relances, limite de concurrence)
+    answer, metrics = complete(messages, provider="deepseek", model=LLM_MODEL, source="assistant",
+                               temperature=0.2)
+    print(format_usage(metrics))
+
+    return answer
+
+
+# === CONVERSATION MULTI-TOURS ===
+def chunk_key(chunk):
+    return chunk["dossier"], chunk.get("generation"), chunk.get("chunk_id") or chunk["text"]
+
+
+class ChatSession:
+    """
+    Conversation multi-tours sur un ou plusieurs dossiers.
+    Les messages envoyés ne sont jamais réordonnés ni réécrits : prompt système, puis pour
+    chaque tour le contexte nouvellement récupéré, la question et la réponse. Le prompt d'un
+    tour prolonge donc celui du tour précédent, que DeepSeek sert depuis son cache de préfixe.
+    Seuls les chunks (et tableaux) absents de la conversation sont ajoutés aux questions suivantes.
+    """
+
+    def __init__(self, dossiers=None, max_prompt_chars=SESSION_MAX_PROMPT_CHARS):
+        self.dossiers = as_dossier_list(dossiers)
+        self.max_prompt_chars = max_prompt_chars
+        self.reset()
+
+    def reset(self):
+        self.messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        self.seen_chunks = set()
+        self.seen_docs = set()
+        self.turns = []  # métriques par tour
+        self._pending = None
+
+    def prompt_chars(self):
+        return sum(len(m["content"]) for m in self.messages)
+
+    def add_context(self, query):
+        """
+        Récupère les chunks de la question et prépare le contexte à ajouter (chunks nouveaux
+        seulement). Retourne (nombre de chunks nouveaux, nombre de chunks déjà en contexte).
+        """
+        report = {}
+        with timed("assistant", "retrieve"):
+            results = retrieve(query, dossiers=self.dossiers, report=report)
+        multi = len(self.dossiers) > 1
+        fresh = [r for r in results if chunk_key(r) not in self.seen_chunks]
+        seen_docs = set(self.seen_docs)
+        context = format_context(fresh, multi, seen_docs)
+        if self.turns and self.prompt_chars() + len(context) + len(query) > self.max_prompt_chars:
+            print(f"♻️ Conversation trop longue ({self.prompt_chars()} caractères) : nouveau contexte")
+            self.reset()
+            fresh, seen_docs = results, set()
+            context = format_context(fresh, multi, seen_docs)
+        baseline = report.pop("baseline", None)
+        if baseline is not None:
+            # contexte qu'aurait ajouté la recherche seule, mêmes chunks déjà en conversation exclus
+            report["context_chars"] = len(context)
+            report["baseline_chars"] = len(format_context(
+                [b for b in baseline if chunk_key(b) not in self.seen_chunks], multi, set(self.seen_docs)))
+        self._pending = {"query": query, "chunks": fresh, "docs": seen_docs, "context": context,
+                         "reused": len(results) - len(fresh), "report": report}
+        return len(fresh), len(results) - len(fresh)
+
+    def ask(self, query):
+        """Pose une question dans la conversation ; retourne (réponse, métriques du tour)."""
+        if self._pending is None or self._pending["query"] != query:
+            self.add_context(query)
+        pending, self._pending = self._pending, None
+        if pending["context"]:
+            content = f"Contexte :\n{pending['context']}\n\nQuestion : {query}"
+        else:
+            content = f"Question : {query}"
+        messages = self.messages + [{"role": "user", "content": content}]
+
+        start = time.perf_counter()
+        with timed("assistant", "llm") as info:
+            answer, metrics = complete(messages, provider="deepseek", model=LLM_MODEL, source="assistant",
+                                       temperature=0.2)
+            info.update(prompt_tokens=metrics["prompt_tokens"], context_chars=len(pending["context"]))
+        record_llm_time(len(pending["context"]), time.perf_counter() - start, pending["report"])
+        metrics.update({"turn": len(self.turns) + 1, "new_chunks": len(pending["chunks"]),
+                        "reused_chunks": pending["reused"], "context_chars": len(pending["context"])})
 
-    return response.choices[0].message.content
+        self.messages = messages + [{"role": "assistant", "content": answer}]
+        self.seen_chunks.update(chunk_key(c) for c in pending["chunks"])
+        self.seen_docs = pending["docs"]
+        self.turns.append(metrics)
+        print(f"{format_usage(metrics)} · {metrics['new_chunks']} chunks ajoutés, "
+              f"{metrics['reused_chunks']} déjà en contexte")
+        return answer, metrics
 
 
 # === PIPELINE RAG COMPLET ===
-def rag_query(query):
+def rag_query(query, dossiers=None):
     """Exécute une requête RAG complète."""
     print(f"\n🔍 Requête : {query}")
-    context = build_context(query)
+    report = {}
+    context = build_context(query, dossiers=dossiers, report=report)
     print(f"📚 Contexte construit ({len(context)} caractères)")
+    start = time.perf_counter()
     answer = ask_deepseek(query, context)
+    record_llm_time(len(context), time.perf_counter() - start, report)
+    if "llm_s" in report:
+        print(format_rerank_report(report))
     print("\n🧠 Réponse DeepSeek :\n")
     print(answer)
     return answer
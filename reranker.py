@@ -0,0 +1,97 @@
+"""
+Re-classement des candidats de la recherche hybride par un cross-encoder CPU.
+La recherche (FAISS + BM25) fournit un large ensemble de candidats ; le cross-encoder
+lit chaque couple (question, chunk) en un seul batch et ne garde que les meilleurs :
+le contexte envoyé au LLM est plus court sans perdre les passages pertinents.
+Les scores sont mis en cache (question, dossier, chunk) : les questions répétées
+(diagnostics régénérés, agents) ne repassent pas par le modèle.
+
+Activation : RERANK=1 (cf. rag_query.py).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# === CONFIG ===
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # multilingue (français)
+RERANK_CANDIDATES = 50  # candidats issus de la recherche hybride
+RERANK_TOP_K = 5  # chunks gardés pour le contexte
+RERANK_MAX_LENGTH = 256  # tokens (question + chunk de 500 caractères)
+RERANK_BATCH_SIZE = 64
+RERANK_CACHE_SIZE = 20000
+
+
+class Reranker:
+    """Cross-encoder chargé à la première utilisation, avec cache LRU des scores."""
+
+    def __init__(self, model_name: str = RERANK_MODEL, cache_size: int = RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            print(f"🔹 Chargement du cross-encoder {self.model_name}...")
+            self._model = CrossEncoder(self.model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+        return self._model
+
+    @staticmethod
+    def _key(query: str, chunk: Dict) -> Tuple[str, str, str, str]:
+        # La génération d'index distingue deux chunks de même identifiant après une réindexation
+        return query, chunk.get("dossier", ""), chunk.get("generation") or "", chunk.get("chunk_id") or chunk["text"]
+
+    def score(self, query: str, chunks: List[Dict]) -> Tuple[List[float], int]:
+        """Scores de pertinence des chunks ; seuls les couples absents du cache sont calculés (un batch)."""
+        keys = [self._key(query, c) for c in chunks]
+        with self._lock:
+            missing = [i for i, k in enumerate(keys) if k not in self._cache]
+            if missing:
+                pairs = [(query, chunks[i]["text"]) for i in missing]
+                scores = self.model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+                for i, s in zip(missing, scores):
+                    self._cache[keys[i]] = float(s)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for k in keys:
+                self._cache.move_to_end(k)
+            return [self._cache[k] for k in keys], len(missing)
+
+    def rerank(self, query: str, chunks: List[Dict], top_k: int = RERANK_TOP_K,
+               report: Optional[Dict] = None) -> List[Dict]:
+        """Garde les `top_k` chunks les mieux notés ; complète `report` (coût du re-classement)."""
+        if not chunks:  # index vide ou filtre sans correspondance : rapport à zéro
+            if report is not None:
+                report.update({"rerank_ms": 0.0, "candidates": 0, "scored": 0, "cache_hits": 0, "kept": 0})
+            return []
+        start = time.perf_counter()
+        scores, computed = self.score(query, chunks)
+        order = sorted(range(len(chunks)), key=lambda i: -scores[i])[:top_k]
+        if report is not None:
+            report.update({
+                "rerank_ms": round((time.perf_counter() - start) * 1000, 1),
+                "candidates": len(chunks),
+                "scored": computed,
+                "cache_hits": len(chunks) - computed,
+                "kept": len(order),
+            })
+        return [dict(chunks[i], rerank_score=scores[i]) for i in order]
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Reranker:
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
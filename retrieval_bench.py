@@ -0,0 +1,328 @@
+"""
+Banc d'essai de la recherche (qualité et latence), hors ligne et sans LLM.
+
+Construit des index à partir des textes du corpus (data/texts par défaut) pour chaque
+combinaison de paramètres (taille et chevauchement des chunks, top_k, stockage FAISS,
+modèle et backend d'embedding, recherche dense ou hybride) puis rejoue un jeu de
+requêtes annotées (data/retrieval_queries.json) : chaque requête indique les passages
+sources attendus (dates de jugement, montants, noms de créanciers...).
+
+Un chunk est pertinent s'il couvre au moins RELEVANT_COVERAGE du passage attendu :
+le jugement ne dépend donc pas du découpage testé.
+
+Mesures : rappel@k, MRR, latence des requêtes (p50 / p95 / p99), temps de construction
+(découpage, encodage, index, BM25) et mémoire. Le rapport JSON est écrit dans
+benchmarks/ pour comparer les runs entre eux.
+
+Usage :
+    python retrieval_bench.py --chunk-size 300 500 800 --overlap 80 --mode dense hybrid
+    python retrieval_bench.py --compare benchmarks/avant.json benchmarks/apres.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from chunking import BATCH_SIZE, CHUNK_OVERLAP, CHUNK_SIZE, MODEL_NAME, chunk_spans
+from embedding_backend import BACKENDS, EMBEDDING_BACKEND, load_embedder
+from index_storage import DEFAULT_NPROBE, STORAGE_MODES, build_index, set_nprobe
+from lexical_index import HYBRID_CANDIDATES, BM25Index, hybrid_ranking
+from profiler import mb, peak_rss, process_rss
+from text_normalize import Boilerplate, Normalizer
+
+# === CONFIG ===
+TEXT_DIR = "data/texts"
+QUERIES_PATH = "data/retrieval_queries.json"
+REPORT_DIR = "benchmarks"
+TOP_K = 10
+RECALL_AT = (1, 3, 5, 10)
+RELEVANT_COVERAGE = 0.5  # part du passage attendu qu'un chunk doit contenir
+SEARCH_MODES = ("dense", "hybrid")
+
+
+# === CORPUS ET REQUÊTES ===
+def load_corpus(text_dir: str = TEXT_DIR) -> Dict[str, str]:
+    """Textes du corpus, lus comme à l'indexation (chunking.py)."""
+    corpus = {}
+    for filename in sorted(os.listdir(text_dir)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(text_dir, filename), "r", encoding="utf-8") as f:
+                corpus[filename] = f.read().strip()
+    return corpus
+
+
+def passage_pattern(text: str) -> re.Pattern:
+    """Passage attendu tolérant aux retours à la ligne, à la casse et au type d'apostrophe."""
+    words = [re.sub("['’]", "['’]", re.escape(w)) for w in text.split()]
+    return re.compile(r"\s+".join(words), re.IGNORECASE)
+
+
+def locate_passages(corpus: Dict[str, str], queries: List[Dict]) -> List[Dict]:
+    """
+    Retrouve la position de chaque passage attendu dans le corpus. Un passage présent
+    dans plusieurs documents (copies, annexes) est satisfait par n'importe laquelle.
+    """
+    labeled = []
+    for q in queries:
+        passages = []
+        for p in q["passages"]:
+            pattern = passage_pattern(p["text"])
+            spans = [(doc, m.start(), m.end())
+                     for doc, text in corpus.items() if p.get("doc", "") in doc
+                     for m in pattern.finditer(text)]
+            if not spans:
+                print(f"⚠️ [{q['id']}] Passage introuvable dans le corpus : {p['text']!r}")
+                continue
+            passages.append(spans)
+        if passages:
+            labeled.append({"id": q["id"], "query": q["query"], "passages": passages})
+    return labeled
+
+
+def normalize_corpus(corpus: Dict[str, str]) -> Tuple[Dict[str, str], Normalizer]:
+    """Corpus débarrassé de ses lignes répétées, comme à l'indexation (NORMALIZE de chunking.py)."""
+    normalizer = Normalizer(Boilerplate.fit(corpus))
+    return {doc: normalizer.clean(doc, text) for doc, text in corpus.items()}, normalizer
+
+
+def build_chunks(corpus: Dict[str, str], chunk_size: int, overlap: int,
+                 normalizer: Optional[Normalizer] = None) -> List[Dict]:
+    """Chunks avec leur position ; sans les chunks en double si un normaliseur est fourni."""
+    chunks = []
+    for doc, text in corpus.items():
+        for i, (start, piece) in enumerate(chunk_spans(text, chunk_size, overlap)):
+            if normalizer is not None and not normalizer.keep(piece):
+                continue
+            chunks.append({"doc_id": doc, "chunk_id": f"{doc}_{i}", "start": start,
+                           "end": start + len(piece), "text": piece})
+    return chunks
+
+
+def covers(chunk: Dict, span) -> bool:
+    doc, start, end = span
+    if chunk["doc_id"] != doc:
+        return False
+    overlap = min(chunk["end"], end) - max(chunk["start"], start)
+    return overlap >= RELEVANT_COVERAGE * (end - start)
+
+
+def relevance(chunks: List[Dict], labeled: List[Dict]) -> List[List[set]]:
+    """Pour chaque requête et chaque passage attendu : indices des chunks pertinents."""
+    return [[{i for i, c in enumerate(chunks) if any(covers(c, s) for s in spans)}
+             for spans in q["passages"]] for q in labeled]
+
+
+# === CONSTRUCTION ===
+class BenchIndex:
+    """Index construit pour une configuration : FAISS + BM25 sur les mêmes chunks."""
+
+    def __init__(self, chunks: List[Dict], embeddings: np.ndarray, storage: str, nprobe: int):
+        self.chunks = chunks
+        rss_before = process_rss()
+
+        start = time.perf_counter()
+        self.index = build_index(embeddings, storage)
+        set_nprobe(self.index, nprobe)
+        self.index_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.bm25 = BM25Index.build(c["text"] for c in chunks)
+        self.bm25_s = time.perf_counter() - start
+
+        self.rss_delta = process_rss() - rss_before
+        self.index_bytes = int(faiss.serialize_index(self.index).nbytes)
+
+    def search(self, query: str, q_emb: np.ndarray, top_k: int, mode: str) -> List[int]:
+        n_candidates = max(top_k, HYBRID_CANDIDATES) if mode == "hybrid" else top_k
+        _, indices = self.index.search(q_emb, n_candidates)
+        dense_ranking = [int(i) for i in indices[0] if i >= 0]
+        if mode == "dense":
+            return dense_ranking[:top_k]
+        return [i for i, _ in hybrid_ranking(query, dense_ranking, self.bm25, n_candidates)[:top_k]]
+
+
+# === ÉVALUATION ===
+def evaluate(bench: BenchIndex, model, labeled: List[Dict], relevant: List[List[set]],
+             top_k: int, mode: str) -> Dict:
+    """Rappel@k (part des passages attendus retrouvés), MRR et latence par requête."""
+    ks = sorted({k for k in RECALL_AT if k <= top_k} | {top_k})
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks, encode_ms, search_ms, per_query = [], [], [], []
+
+    model.encode([labeled[0]["query"]], convert_to_numpy=True)  # warm-up
+    for q, passages in zip(labeled, relevant):
+        start = time.perf_counter()
+        q_emb = np.asarray(model.encode([q["query"]], convert_to_numpy=True), dtype="float32")
+        encoded = time.perf_counter()
+        ranking = bench.search(q["query"], q_emb, top_k, mode)
+        searched = time.perf_counter()
+        encode_ms.append((encoded - start) * 1000)
+        search_ms.append((searched - encoded) * 1000)
+
+        all_relevant = set().union(*passages)
+        first = next((rank for rank, i in enumerate(ranking, 1) if i in all_relevant), None)
+        reciprocal_ranks.append(1 / first if first else 0.0)
+        for k in ks:
+            found = sum(1 for ids in passages if ids & set(ranking[:k]))
+            recalls[k].append(found / len(passages))
+        per_query.append({"id": q["id"], "first_relevant_rank": first,
+                          "recall": round(recalls[top_k][-1], 3)})
+
+    total_ms = [e + s for e, s in zip(encode_ms, search_ms)]
+    return {
+        **{f"recall@{k}": round(float(np.mean(v)), 4) for k, v in recalls.items()},
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "latency_ms": {name: {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+                       for name, values in (("encode", encode_ms), ("search", search_ms), ("total", total_ms))},
+        "misses": [r["id"] for r in per_query if r["first_relevant_rank"] is None],
+        "queries": per_query,
+    }
+
+
+def run_benchmark(corpus: Dict[str, str], queries: List[Dict], chunk_sizes: List[int], overlaps: List[int],
+                  top_ks: List[int], storages: List[str], models: List[str], backends: List[str],
+                  modes: List[str], nprobe: int = DEFAULT_NPROBE, normalize: List[bool] = (False,)) -> Dict:
+    """Évalue toutes les combinaisons ; modèle et embeddings sont réutilisés entre configurations."""
+    labeled = locate_passages(corpus, queries)
+    variants = {False: (corpus, labeled, None)}
+    if True in normalize:
+        clean_corpus, normalizer = normalize_corpus(corpus)
+        variants[True] = (clean_corpus, locate_passages(clean_corpus, queries), normalizer)
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "n_documents": len(corpus),
+              "corpus_chars": sum(len(t) for t in corpus.values()), "n_queries": len(labeled),
+              "relevant_coverage": RELEVANT_COVERAGE, "nprobe": nprobe, "runs": []}
+
+    for model_name in models:
+        for backend in backends:
+            rss_before = process_rss()
+            start = time.perf_counter()
+            model = load_embedder(model_name, backend)
+            model_load_s = time.perf_counter() - start
+            model_rss = process_rss() - rss_before
+            print(f"⚙️ Modèle {model_name} ({backend}) chargé en {model_load_s:.1f} s")
+
+            for chunk_size, overlap, norm in itertools.product(chunk_sizes, overlaps, normalize):
+                if overlap >= chunk_size:
+                    print(f"⚠️ Chevauchement {overlap} ≥ taille {chunk_size} : configuration ignorée")
+                    continue
+                texts, labeled, normalizer = variants[norm]
+                if normalizer is not None:
+                    normalizer.seen.clear()  # dédoublonnage propre à chaque découpage
+                start = time.perf_counter()
+                chunks = build_chunks(texts, chunk_size, overlap, normalizer)
+                chunk_s = time.perf_counter() - start
+                relevant = relevance(chunks, labeled)
+
+                start = time.perf_counter()
+                embeddings = np.asarray(model.encode([c["text"] for c in chunks], batch_size=BATCH_SIZE,
+                                                     convert_to_numpy=True, show_progress_bar=False),
+                                        dtype="float32")
+                encode_s = time.perf_counter() - start
+
+                for storage in storages:
+                    bench = BenchIndex(chunks, embeddings, storage, nprobe)
+                    build = {"chunk_s": round(chunk_s, 3), "encode_s": round(encode_s, 3),
+                             "index_s": round(bench.index_s, 3), "bm25_s": round(bench.bm25_s, 3),
+                             "chunks_per_s": round(len(chunks) / max(encode_s, 1e-9), 1)}
+                    memory = {"model_rss_mb": mb(model_rss), "index_rss_mb": mb(bench.rss_delta),
+                              "index_mb": mb(bench.index_bytes), "peak_rss_mb": mb(peak_rss())}
+                    for mode in modes:
+                        for top_k in top_ks:
+                            config = {"model": model_name, "backend": backend, "chunk_size": chunk_size,
+                                      "overlap": overlap, "normalize": norm, "storage": storage, "mode": mode,
+                                      "top_k": top_k}
+                            run = {"config": config, "n_chunks": len(chunks), "build": build, "memory": memory,
+                                   **evaluate(bench, model, labeled, relevant, top_k, mode)}
+                            report["runs"].append(run)
+                            print(f"✅ {config_label(config)} : rappel@{top_k} {run[f'recall@{top_k}']:.3f}, "
+                                  f"MRR {run['mrr']:.3f}, p95 {run['latency_ms']['total']['p95']:.1f} ms")
+                    del bench
+            del model
+    return report
+
+
+# === RAPPORT ===
+def config_label(config: Dict) -> str:
+    norm = " normalisé" if config.get("normalize") else ""
+    return (f"{os.path.basename(config['model'])}/{config['backend']} taille={config['chunk_size']} "
+            f"chev={config['overlap']}{norm} {config['storage']} {config['mode']} k={config['top_k']}")
+
+
+def print_report(report: Dict):
+    print(f"\n📊 Recherche : {report['n_queries']} requêtes, {report['n_documents']} documents")
+    print(f"{'configuration':<68} {'chunks':>7} {'rappel@1':>9} {'rappel@k':>9} {'MRR':>6} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'encodage':>9} {'index Mo':>9}")
+    for run in report["runs"]:
+        c, recall_k = run["config"], run[f"recall@{run['config']['top_k']}"]
+        print(f"{config_label(c):<68} {run['n_chunks']:>7} {run['recall@1']:>9.3f} "
+              f"{recall_k:>9.3f} {run['mrr']:>6.3f} "
+              f"{run['latency_ms']['total']['p50']:>7.1f} {run['latency_ms']['total']['p95']:>7.1f} "
+              f"{run['build']['encode_s']:>8.1f}s {run['memory']['index_mb']:>9.2f}")
+
+
+def compare_reports(before: Dict, after: Dict):
+    """Écarts entre deux rapports, pour les configurations présentes dans les deux."""
+    runs_before = {config_label(r["config"]): r for r in before["runs"]}
+    print(f"\n🔍 Comparaison ({before['created']} → {after['created']})")
+    print(f"{'configuration':<68} {'Δ rappel@k':>11} {'Δ MRR':>8} {'Δ p95 ms':>9} {'Δ encodage':>11}")
+    for run in after["runs"]:
+        label = config_label(run["config"])
+        ref = runs_before.get(label)
+        if ref is None:
+            continue
+        k = run["config"]["top_k"]
+        print(f"{label:<68} {run[f'recall@{k}'] - ref[f'recall@{k}']:>+11.3f} {run['mrr'] - ref['mrr']:>+8.3f} "
+              f"{run['latency_ms']['total']['p95'] - ref['latency_ms']['total']['p95']:>+9.1f} "
+              f"{run['build']['encode_s'] - ref['build']['encode_s']:>+10.1f}s")
+        lost = sorted(set(run["misses"]) - set(ref["misses"]))
+        if lost:
+            print(f"   ⚠️ requêtes perdues : {', '.join(lost)}")
+
+
+def save_report(report: Dict, path: Optional[str] = None) -> str:
+    path = path or os.path.join(REPORT_DIR, f"retrieval_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc d'essai de la recherche (rappel, MRR, latence, mémoire)")
+    parser.add_argument("--texts", default=TEXT_DIR, help="dossier des textes à indexer")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="requêtes annotées (JSON)")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[CHUNK_SIZE])
+    parser.add_argument("--overlap", type=int, nargs="+", default=[CHUNK_OVERLAP])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[TOP_K])
+    parser.add_argument("--storage", nargs="+", default=["flat"], choices=STORAGE_MODES)
+    parser.add_argument("--model", nargs="+", default=[MODEL_NAME])
+    parser.add_argument("--backend", nargs="+", default=[EMBEDDING_BACKEND], choices=BACKENDS)
+    parser.add_argument("--mode", nargs="+", default=list(SEARCH_MODES), choices=SEARCH_MODES)
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="listes IVF visitées (stockages compressés)")
+    parser.add_argument("--normalize", nargs="+", default=["off"], choices=("off", "on"),
+                        help="lignes répétées retirées et chunks en double écartés (cf. text_normalize.py)")
+    parser.add_argument("--out", help=f"fichier JSON du rapport (défaut : {REPORT_DIR}/retrieval_<date>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"), help="compare deux rapports existants")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "r", encoding="utf-8") as f_before, \
+                open(args.compare[1], "r", encoding="utf-8") as f_after:
+            compare_reports(json.load(f_before), json.load(f_after))
+        raise SystemExit(0)
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        query_set = json.load(f)
+    result = run_benchmark(load_corpus(args.texts), query_set, args.chunk_size, args.overlap, args.top_k,
+                           args.storage, args.model, args.backend, args.mode, args.nprobe,
+                           [v == "on" for v in args.normalize])
+    print_report(result)
+    print(f"\n💾 Rapport sauvegardé dans {save_report(result, args.out)}")
@@ -0,0 +1,223 @@
+"""
+Couche de sortie structurée (JSON) commune aux appels LLM.
+- demande le mode JSON quand le fournisseur le permet (response_format json_object)
+- répare localement les défauts courants : blocs ```json, texte autour, commentaires,
+  guillemets simples, clés sans guillemets, virgules finales, littéraux Python (None, True, False)
+- valide et normalise selon le schéma attendu (tableaux, graphiques du dashboard)
+- une seule relance ciblée, et seulement si la réponse reste inexploitable : le LLM
+  reçoit sa réponse et l'erreur à corriger, pas le texte source
+"""
+
+import json
+import re
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from table_query import parse_number
+
+# === CONFIG ===
+MAX_RETRIES = 1
+RETRY_PROMPT = (
+    "Ta réponse précédente n'est pas un JSON exploitable ({error}). "
+    "Renvoie uniquement le JSON corrigé, au format demandé, sans texte autour ni bloc de code."
+)
+CHART_TYPES = ("bar", "pie", "line")
+
+FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.S)
+CLOSING_RE = re.compile(r"\s*[\]}]")
+BARE_WORD_RE = re.compile(r"\w+")
+KEY_COLON_RE = re.compile(r"\s*:")
+PY_LITERALS = {"None": "null", "True": "true", "False": "false", "NaN": "null"}
+
+STATS = {"calls": 0, "parsed": 0, "repaired": 0, "retried": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+class StructuredOutputError(ValueError):
+    """Réponse LLM non exploitable, même après réparation locale et relance."""
+
+
+def _count(key: str):
+    with _stats_lock:
+        STATS[key] += 1
+
+
+# === RÉPARATION ===
+def _normalize_tokens(text: str) -> str:
+    """
+    Parcourt le texte hors chaînes pour : convertir les chaînes entre guillemets simples,
+    mettre entre guillemets les clés nues ({évolution: 1}), retirer les commentaires // et /* */,
+    les virgules finales et les littéraux Python.
+    """
+    out, i, n = [], 0, len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':  # chaîne JSON : recopiée telle quelle
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif c == "'":  # chaîne entre guillemets simples ; une apostrophe interne (d'affaires) ne la ferme pas
+            j, buf = i + 1, []
+            while j < n:
+                if text[j] == "\\" and j + 1 < n:
+                    buf.append(text[j:j + 2])
+                    j += 2
+                    continue
+                if text[j] == "'" and re.match(r"\s*[,:}\]]", text[j + 1:j + 20]):
+                    break
+                buf.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            out.append('"' + "".join(buf) + '"')
+            i = j + 1
+        elif text.startswith("//", i):
+            i = text.find("\n", i) if "\n" in text[i:] else n
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif c == ",":
+            if not CLOSING_RE.match(text, i + 1):  # virgule finale supprimée
+                out.append(c)
+            i += 1
+        elif c.isalpha():
+            word = BARE_WORD_RE.match(text, i).group(0)  # \w : lettres accentuées comprises
+            i += len(word)
+            if KEY_COLON_RE.match(text, i):
+                out.append(json.dumps(word, ensure_ascii=False))
+            else:
+                out.append(PY_LITERALS.get(word, word))
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+
+def extract_json_text(text: str) -> str:
+    """Isole le JSON d'une réponse : bloc de code, sinon du premier [ ou { au dernier ] ou }."""
+    fence = FENCE_RE.search(text)
+    if fence:
+        text = fence.group(1)
+    starts = [p for p in (text.find("["), text.find("{")) if p >= 0]
+    if not starts:
+        return text.strip()
+    start = min(starts)
+    end = max(text.rfind("]"), text.rfind("}"))
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def parse_json(text: str) -> Tuple[object, bool]:
+    """Parse une réponse LLM ; retourne (objet, réparé ?) ou lève StructuredOutputError."""
+    try:
+        return json.loads(text), False
+    except (json.JSONDecodeError, TypeError):
+        pass
+    candidate = extract_json_text(text or "")
+    for attempt in (candidate, _normalize_tokens(candidate)):
+        try:
+            return json.loads(attempt), True
+        except json.JSONDecodeError as e:
+            error = e
+    raise StructuredOutputError(f"JSON invalide : {error.msg} (position {error.pos})")
+
+
+# === SCHÉMAS ===
+def _unwrap_list(data, keys: Tuple[str, ...]) -> list:
+    """Accepte une liste, un objet unique ou un objet enveloppe ({"tables": [...]}) en mode JSON."""
+    if isinstance(data, dict):
+        for key in keys:
+            if isinstance(data.get(key), list):
+                return data[key]
+        return [data]
+    if isinstance(data, list):
+        return data
+    raise StructuredOutputError(f"liste attendue, reçu {type(data).__name__}")
+
+
+def validate_tables(data, source_name: str = "") -> List[Dict]:
+    """
+    Valide et normalise des tableaux au format llm_structure
+    ({"source", "titre", "unit", "data": [{"label", <colonne>: nombre | null}]}).
+    Les nombres en texte ("1 234,5") sont convertis ; les tableaux sans lignes exploitables écartés.
+    """
+    tables = []
+    # Un objet dont "data" est une liste de lignes est un tableau unique, pas une enveloppe
+    candidates = _unwrap_list(data, ("tables", "tableaux"))
+    for table in candidates:
+        if not isinstance(table, dict) or not isinstance(table.get("data"), list):
+            continue
+        rows = []
+        for row in table["data"]:
+            if not isinstance(row, dict):
+                continue
+            clean = {"label": str(row.get("label") or "").strip()}
+            for column, value in row.items():
+                if column != "label":
+                    clean[str(column)] = value if value is None else parse_number(value)
+            if len(clean) > 1:
+                rows.append(clean)
+        if not rows:
+            continue
+        unit = table.get("unit")
+        tables.append({
+            "source": table.get("source") or source_name,
+            "titre": str(table.get("titre") or "").strip(),
+            "unit": str(unit) if unit not in (None, "") else None,
+            "data": rows,
+        })
+    if not tables and candidates:
+        raise StructuredOutputError("aucun tableau conforme au schéma (clé \"data\" avec des lignes)")
+    return tables
+
+
+def validate_chart_priorities(data) -> List[Dict]:
+    """Valide la réponse de l'agent de visualisation : [{"titre", "pertinence" 1-5, "type"}]."""
+    charts = []
+    for item in _unwrap_list(data, ("graphiques", "charts", "resultats")):
+        if not isinstance(item, dict) or not item.get("titre"):
+            continue
+        try:
+            pertinence = min(5, max(1, int(item.get("pertinence", 1))))
+        except (TypeError, ValueError):
+            pertinence = 1
+        chart_type = str(item.get("type", "bar")).lower()
+        charts.append({"titre": str(item["titre"]), "pertinence": pertinence,
+                       "type": chart_type if chart_type in CHART_TYPES else "bar"})
+    if not charts:
+        raise StructuredOutputError("aucun graphique conforme (titre, pertinence, type)")
+    return charts
+
+
+# === APPEL ===
+def complete_json(send: Callable[[List[Dict]], str], messages: List[Dict],
+                  validate: Callable[[object], object], schema_hint: str = "",
+                  max_retries: int = MAX_RETRIES):
+    """
+    Envoie `messages` via `send` (qui retourne le texte de la réponse), répare et valide
+    le JSON. Une réponse inexploitable déclenche au plus `max_retries` relances ciblées
+    (réponse fautive + erreur + `schema_hint`, sans renvoyer le texte source).
+    Retourne la valeur validée ou lève StructuredOutputError.
+    """
+    _count("calls")
+    text = send(messages)
+    for attempt in range(max_retries + 1):
+        try:
+            data, repaired = parse_json(text)
+            result = validate(data)
+            _count("repaired" if repaired else "parsed")
+            return result
+        except StructuredOutputError as e:
+            if attempt == max_retries:
+                _count("failed")
+                raise
+            _count("retried")
+            text = send([
+                {"role": "user", "content": RETRY_PROMPT.format(error=e)
+                 + (f"\nFormat attendu : {schema_hint}" if schema_hint else "")
+                 + "\n\nRéponse à corriger :\n" + (text or "")[:8000]},
+            ])
+
+
+def stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(STATS)
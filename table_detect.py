@@ -0,0 +1,81 @@
+"""
+Détection locale de contenu tabulaire (sans LLM).
+Une ligne est "tabulaire" si elle se termine par au moins deux montants (quelle que soit
+la longueur du libellé : « Autres immobilisations financières 88 520 88 520 »), si elle
+porte plusieurs nombres avec une forte densité de chiffres, ou si elle est découpée en
+colonnes (tabulations, |, espaces multiples).
+Un texte contient un tableau s'il a une suite de lignes tabulaires consécutives ; les
+libellés seuls (« ACTIF CIRCULANT », intitulé sur deux lignes) n'interrompent pas un tableau.
+La prose juridique (dates, numéros d'articles isolés) est écartée.
+"""
+
+import re
+from typing import List
+
+# === CONFIG ===
+DETECT_VERSION = 2  # à incrémenter si les règles changent : invalide les tableaux extraits (pipeline.py)
+MIN_TABLE_LINES = 3  # lignes tabulaires consécutives pour conclure à un tableau
+MIN_DIGIT_RATIO = 0.25  # part de chiffres parmi les caractères non blancs d'une ligne
+MIN_COLUMNS = 3
+MAX_GAP_LINES = 1  # lignes non tabulaires tolérées au sein d'un même tableau (libellé sur 2 lignes...)
+MAX_LABEL_LINES = 4  # libellés seuls (sans chiffre) consécutifs tolérés au sein d'un tableau
+MAX_LABEL_CHARS = 80
+
+NUMBER_RE = re.compile(r"\(?-?\d{1,3}(?:[ \u00a0\u202f.]\d{3})+(?:,\d+)?\)?|\(?-?\d+(?:[.,]\d+)?\)?")
+PAGE_NUMBER_RE = re.compile(r"\d{1,3}")
+COLUMN_SEP_RE = re.compile(r"\t|\||\s{2,}")
+# Au moins deux montants en fin de ligne, chacun précédé d'un espace (pas « L. 631-1 »)
+TRAILING_AMOUNTS_RE = re.compile(rf"(?:^|\s)(?:{NUMBER_RE.pattern})\s+(?:{NUMBER_RE.pattern})\s*$")
+
+
+def is_tabular_line(line: str) -> bool:
+    """Ligne de tableau : colonnes explicites ou plusieurs nombres denses."""
+    stripped = line.strip()
+    if not stripped:
+        return False
+    numbers = NUMBER_RE.findall(stripped)
+    if not numbers or PAGE_NUMBER_RE.fullmatch(stripped):  # numéro de page isolé
+        return False
+    if TRAILING_AMOUNTS_RE.search(stripped):  # libellé suivi des montants des colonnes
+        return True
+    cells = [c for c in COLUMN_SEP_RE.split(stripped) if c.strip()]
+    if len(cells) >= MIN_COLUMNS:
+        return True
+    chars = [c for c in stripped if not c.isspace()]
+    digit_ratio = sum(c.isdigit() for c in chars) / len(chars)
+    return digit_ratio >= MIN_DIGIT_RATIO and (len(numbers) >= 2 or digit_ratio >= 2 * MIN_DIGIT_RATIO)
+
+
+def is_label_line(line: str) -> bool:
+    """Libellé seul (intitulé de rubrique, libellé sur deux lignes) : court et sans chiffre."""
+    stripped = line.strip()
+    return bool(stripped) and len(stripped) <= MAX_LABEL_CHARS and not any(c.isdigit() for c in stripped)
+
+
+def tabular_runs(lines: List[str]) -> List[int]:
+    """Longueurs des suites de lignes tabulaires (libellés seuls et quelques lignes intercalaires tolérés)."""
+    runs, current, gap, labels = [], 0, 0, 0
+    for line in lines:
+        if not line.strip():
+            continue
+        if is_tabular_line(line):
+            current += 1
+            gap, labels = 0, 0
+        elif current and is_label_line(line) and labels < MAX_LABEL_LINES:
+            labels += 1
+        elif current and gap < MAX_GAP_LINES:
+            gap += 1
+        else:
+            if current:
+                runs.append(current)
+            current, gap, labels = 0, 0, 0
+    if current:
+        runs.append(current)
+    return runs
+
+
+def has_tabular_content(text: str, min_lines: int = MIN_TABLE_LINES) -> bool:
+    """Vrai si le texte contient au moins un bloc tabulaire (ou un tableau déjà extrait)."""
+    if "[Tableau " in text:
+        return True
+    return any(run >= min_lines for run in tabular_runs(text.splitlines()))
@@ -0,0 +1,331 @@
+"""
+Moteur de requêtes structurées sur all_tables.json.
+Répond directement (sans appel LLM) aux questions de consultation, de comparaison
+et d'agrégation sur les tableaux financiers extraits : "évolution du chiffre
+d'affaires 2013-2015", "loyer annuel de Mérignac", "total des dettes N"...
+"""
+
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Union
+
+from lexical_index import tokenize
+
+# === CONFIG ===
+TABLES_PATH = "data/all_tables.json"
+MIN_COVERAGE = 0.5  # part minimale des termes de la question retrouvés dans un fait
+MAX_SERIES = 5
+
+YEAR_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+YEAR_RANGE_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})\s*(?:-|–|à|au|a)\s*((?:19|20)\d{2})(?!\d)")
+RELATIVE_PERIOD_RE = re.compile(r"\bN(?:\s*-\s*(\d))?$")
+
+COMPARE_TERMS = {"evolution", "variation", "compare", "comparer", "comparaison", "progression",
+                 "hausse", "baisse", "entre"}
+AGGREGATE_TERMS = {
+    "total": "sum", "somme": "sum", "cumul": "sum", "cumule": "sum",
+    "moyenne": "mean", "moyen": "mean",
+    "maximum": "max", "max": "max",
+    "minimum": "min", "min": "min",
+}
+
+
+# === NORMALISATION ===
+def parse_number(value) -> Optional[float]:
+    """Convertit une valeur de tableau en nombre ("1 234,56" → 1234.56, "(500)" → -500)."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        return None
+
+    text = value.strip().replace("\u00a0", " ").replace("\u202f", " ").replace("€", "").replace("%", "")
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("() ")
+    if text.startswith("-"):
+        negative = True
+        text = text[1:]
+    text = text.replace(" ", "")
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(?:\.\d{3})+", text):
+        text = text.replace(".", "")
+    if not re.fullmatch(r"\d+(?:\.\d+)?", text):
+        return None
+
+    number = float(text)
+    if number.is_integer():
+        number = int(number)
+    return -number if negative else number
+
+
+def column_period(column: str) -> Optional[str]:
+    """Déduit la période d'une colonne ("2015", "Exercice N-1" → "N-1"), sinon None."""
+    years = YEAR_RE.findall(column)
+    if len(years) == 1:
+        return years[0]
+    match = RELATIVE_PERIOD_RE.search(column.strip())
+    if match:
+        return f"N-{match.group(1)}" if match.group(1) else "N"
+    return None
+
+
+def normalize_tables(tables: List[Dict]) -> List[Dict]:
+    """Aplatit les tableaux en faits (source, titre, unité, libellé, colonne, période, valeur)."""
+    facts = []
+    for table_idx, table in enumerate(tables):
+        for row in table.get("data", []):
+            if not isinstance(row, dict):
+                continue
+            label = str(row.get("label", "")).strip()
+            for column, raw in row.items():
+                if column == "label":
+                    continue
+                value = parse_number(raw)
+                if value is None:
+                    continue
+                facts.append({
+                    "source": table.get("source", ""),
+                    "titre": table.get("titre", ""),
+                    "unit": table.get("unit"),
+                    "label": label,
+                    "column": column,
+                    "period": column_period(column),
+                    "value": value,
+                    "table_idx": table_idx,
+                })
+    return facts
+
+
+def requested_periods(question: str) -> List[str]:
+    """Extrait les années demandées, en développant les intervalles ("2013-2015")."""
+    periods = []
+    for start, end in YEAR_RANGE_RE.findall(question):
+        lo, hi = sorted((int(start), int(end)))
+        periods.extend(str(y) for y in range(lo, hi + 1))
+    periods.extend(YEAR_RE.findall(question))
+    return list(dict.fromkeys(periods))
+
+
+# === MOTEUR ===
+_engines = {}  # chemin → ((mtime, taille) du fichier, moteur)
+_engines_lock = threading.Lock()
+
+
+class TableQueryEngine:
+    """Index en mémoire des faits tabulaires, par source, titre, libellé, période et unité."""
+
+    def __init__(self, tables: List[Dict]):
+        self.tables = tables
+        self.facts = normalize_tables(tables)
+        self.by_source = defaultdict(list)
+        self.by_titre = defaultdict(list)
+        self.by_period = defaultdict(list)
+        self.by_unit = defaultdict(list)
+        self.by_term = defaultdict(set)
+        self.label_terms = []
+        self.context_terms = []
+
+        for i, fact in enumerate(self.facts):
+            self.by_source[fact["source"]].append(i)
+            self.by_titre[fact["titre"]].append(i)
+            self.by_period[fact["period"]].append(i)
+            self.by_unit[fact["unit"]].append(i)
+
+            label_terms = {t for t in tokenize(fact["label"]) if not YEAR_RE.fullmatch(t)}
+            context_terms = {t for t in tokenize(f"{fact['titre']} {fact['column']}") if not YEAR_RE.fullmatch(t)}
+            self.label_terms.append(label_terms)
+            self.context_terms.append(context_terms)
+            for term in label_terms | context_terms:
+                self.by_term[term].add(i)
+
+    @classmethod
+    def from_file(cls, path: str = TABLES_PATH) -> "TableQueryEngine":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def for_file(cls, path: str = TABLES_PATH) -> "TableQueryEngine":
+        """
+        Moteur partagé d'un fichier de tableaux, reconstruit quand le fichier change
+        (merge_tables, réindexation) ; moteur vide si le fichier n'existe pas.
+        """
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+        with _engines_lock:
+            cached = _engines.get(path)
+            if cached and cached[0] == version:
+                return cached[1]
+            engine = cls.from_file(path) if version else cls([])
+            _engines[path] = (version, engine)
+            return engine
+
+    # --- Recherche de faits ---
+    def find(self, terms: List[str], periods: Optional[List[str]] = None, source: Optional[str] = None,
+             unit: Optional[str] = None) -> List[Dict]:
+        """Retourne les faits qui couvrent au moins MIN_COVERAGE des termes, les mieux notés d'abord."""
+        terms = set(terms)
+        if not terms:
+            return []
+
+        candidates = set()
+        for term in terms:
+            candidates |= self.by_term.get(term, set())
+        if periods:
+            candidates &= {i for p in periods for i in self.by_period.get(p, [])}
+        if source:
+            candidates &= set(self.by_source.get(source, []))
+        if unit:
+            candidates &= set(self.by_unit.get(unit, []))
+
+        scored = []
+        for i in candidates:
+            label_hits = len(terms & self.label_terms[i])
+            context_hits = len(terms & self.context_terms[i] - self.label_terms[i])
+            if label_hits == 0 or (label_hits + context_hits) / len(terms) < MIN_COVERAGE:
+                continue
+            scored.append((2 * label_hits + context_hits, i))
+
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [dict(self.facts[i], score=score) for score, i in scored]
+
+    def series(self, facts: List[Dict]) -> List[Dict]:
+        """Regroupe des faits en séries (une par source / titre / libellé / unité)."""
+        grouped = {}
+        for fact in facts:
+            key = (fact["source"], fact["titre"], fact["label"], fact["unit"])
+            if key not in grouped:
+                grouped[key] = {
+                    "source": fact["source"],
+                    "titre": fact["titre"],
+                    "label": fact["label"],
+                    "unit": fact["unit"],
+                    "score": fact["score"],
+                    "values": {},
+                }
+            grouped[key]["values"].setdefault(fact["period"] or fact["column"], fact["value"])
+        return list(grouped.values())[:MAX_SERIES]
+
+    # --- Opérations ---
+    def lookup(self, terms: List[str], periods: Optional[List[str]] = None, **filters) -> Dict:
+        """Consultation simple : valeurs correspondant aux termes (et périodes) demandés."""
+        return {"type": "lookup", "results": self.series(self.find(terms, periods, **filters))}
+
+    def compare(self, terms: List[str], periods: Optional[List[str]] = None, **filters) -> Dict:
+        """Comparaison entre périodes, avec variations absolues et relatives."""
+        results = []
+        for serie in self.series(self.find(terms, periods, **filters)):
+            ordered = sorted((p, v) for p, v in serie["values"].items() if YEAR_RE.fullmatch(str(p)))
+            variations = []
+            for (p0, v0), (p1, v1) in zip(ordered, ordered[1:]):
+                variations.append({
+                    "from": p0,
+                    "to": p1,
+                    "delta": v1 - v0,
+                    "pct": round((v1 - v0) / abs(v0) * 100, 2) if v0 else None,
+                })
+            results.append(dict(serie, variations=variations))
+        return {"type": "compare", "results": results}
+
+    def aggregate(self, terms: List[str], op: str = "sum", periods: Optional[List[str]] = None,
+                  **filters) -> Dict:
+        """
+        Agrégation (sum, mean, min, max) par série sur les périodes demandées, limitée aux
+        colonnes d'exercice (années) : mois, N/N-1 ou pourcentages d'une même ligne ne se
+        cumulent pas. Une série sans année est écartée (le LLM prend le relais).
+        """
+        funcs = {
+            "sum": sum,
+            "mean": lambda xs: sum(xs) / len(xs),
+            "min": min,
+            "max": max,
+        }
+        results = []
+        for serie in self.series(self.find(terms, periods, **filters)):
+            years = {p: v for p, v in serie["values"].items() if YEAR_RE.fullmatch(str(p))}
+            if not years:
+                continue
+            values = list(years.values())
+            results.append(dict(serie, values=years, op=op, value=funcs[op](values), count=len(values)))
+        return {"type": "aggregate", "results": results}
+
+    def answer(self, question: str) -> Optional[Dict]:
+        """
+        Interprète une question en langage naturel et y répond sans LLM.
+        Retourne None si aucun fait ne correspond (le LLM prend alors le relais).
+        """
+        periods = requested_periods(question)
+        tokens = tokenize(question)
+        ops = [AGGREGATE_TERMS[t] for t in tokens if t in AGGREGATE_TERMS]
+        wants_compare = any(t in COMPARE_TERMS for t in tokens) or len(periods) > 1
+        terms = [t for t in tokens
+                 if t not in COMPARE_TERMS and t not in AGGREGATE_TERMS and not YEAR_RE.fullmatch(t)]
+
+        if ops:
+            result = self.aggregate(terms, op=ops[0], periods=periods)
+        elif wants_compare:
+            result = self.compare(terms, periods=periods)
+        else:
+            result = self.lookup(terms, periods=periods)
+
+        if not result["results"]:
+            return None
+        result["question"] = question
+        result["periods"] = periods
+        return result
+
+
+# === MISE EN FORME ===
+def format_value(value: Union[int, float, None], unit: Optional[str] = None) -> str:
+    """Formate un nombre à la française ("1 234 567,5 EUR")."""
+    if value is None:
+        return "n.d."
+    text = f"{value:,.2f}".rstrip("0").rstrip(".").replace(",", " ").replace(".", ",")
+    return f"{text} {unit}" if unit else text
+
+
+def format_markdown(result: Dict) -> str:
+    """Met en forme un résultat structuré en Markdown (pour l'UI ou un prompt)."""
+    lines = []
+    for serie in result["results"]:
+        lines.append(f"**{serie['label']}** — {serie['titre']} ({serie['source']})")
+        for period, value in serie["values"].items():
+            lines.append(f"- {period} : {format_value(value, serie['unit'])}")
+        for var in serie.get("variations", []):
+            pct = f" ({var['pct']:+.2f} %)".replace(".", ",") if var["pct"] is not None else ""
+            lines.append(f"- Variation {var['from']} → {var['to']} : "
+                         f"{format_value(var['delta'], serie['unit'])}{pct}")
+        if "op" in serie:
+            lines.append(f"- {serie['op']} ({serie['count']} valeurs) : {format_value(serie['value'], serie['unit'])}")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def to_rows(result: Dict) -> List[Dict]:
+    """Aplatit un résultat en lignes (label, période, valeur) pour pandas / plotly."""
+    rows = []
+    for serie in result["results"]:
+        for period, value in serie["values"].items():
+            rows.append({"label": serie["label"], "titre": serie["titre"],
+                         "serie": f"{serie['label']} — {serie['titre']}", "periode": str(period),
+                         "valeur": value, "unit": serie["unit"]})
+    return rows
+
+
+# === TEST ===
+if __name__ == "__main__":
+    engine = TableQueryEngine.from_file()
+    print(f"✅ {len(engine.facts)} faits indexés depuis {len(engine.tables)} tableaux")
+
+    for q in ["évolution du chiffre d'affaires 2013-2015", "loyer annuel de Mérignac",
+              "total des dettes fournisseurs"]:
+        print(f"\n🔍 {q}")
+        res = engine.answer(q)
+        print(format_markdown(res) if res else "∅ Aucun fait trouvé (fallback LLM)")
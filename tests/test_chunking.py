@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import numpy as np
+
+import chunking
+from chunking import StreamChunker, chunk_spans, clean_with_pages, encode_length_sorted, index_standard
+from text_normalize import Normalizer
+
+TEXT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "texts")
+COMPTES = "E-CENTER - Comptes annuels 2024.txt"
+
+
+class FakeModel:
+    def encode(self, texts, **kwargs):
+        return [[0.0]] * len(texts)
+
+
+class LengthModel:
+    """Embedding = longueur du texte ; retient l'ordre d'encodage."""
+
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, **kwargs):
+        self.seen = list(texts)
+        return np.array([[len(t)] for t in texts], dtype="float32")
+
+
+class FakeIndex:
+    def __init__(self):
+        self.ntotal = 0
+
+    def add(self, embeddings):
+        self.ntotal += len(embeddings)
+
+
+def stream_text_chunks(doc_id, text, normalizer):
+    """Chunks du mode flux pour un texte déjà extrait (même boucle que index_streaming)."""
+    chunker = StreamChunker(doc_id, meta=chunking.describe(doc_id, text))
+    text, marks = clean_with_pages(normalizer, doc_id, text)
+    chunks = []
+    for (start, page), (end, _) in zip(marks, marks[1:] + [(len(text), None)]):
+        chunks += chunker.feed(text[start:end], page)
+    return chunks + chunker.close()
+
+
+def test_stream_chunker_matches_chunk_spans():
+    text = "".join(f"page {n} " + "x" * (37 * n % 90) + "\n\n" for n in range(1, 30)).strip()
+    chunker = StreamChunker("doc", max_chars=50, overlap=12)
+    chunks = []
+    for piece in text.split("\n\n"):
+        chunks += chunker.feed(piece + "\n\n")
+    chunks += chunker.close()
+    assert [c["text"] for c in chunks] == [c for _, c in chunk_spans(text, 50, 12)]
+    assert [c["chunk_id"] for c in chunks] == [f"doc_{i}" for i in range(len(chunks))]
+
+
+def test_stream_chunks_identical_to_index_standard(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunking, "log_debug", lambda message: None)
+    monkeypatch.setattr(chunking, "show_mem", lambda prefix="": None)
+    shutil.copy(os.path.join(TEXT_DIR, COMPTES), str(tmp_path))
+
+    standard, _ = index_standard(FakeModel(), FakeIndex(), str(tmp_path), normalizer=Normalizer(enabled=False))
+    with open(os.path.join(TEXT_DIR, COMPTES), "r", encoding="utf-8") as f:
+        stream = stream_text_chunks(COMPTES, f.read().strip(), Normalizer(enabled=False))
+
+    assert len(standard) > 10
+    assert [(c["chunk_id"], c["text"], c["page"]) for c in stream] == \
+        [(c["chunk_id"], c["text"], c["page"]) for c in standard]
+
+
+def test_encode_length_sorted_restores_order():
+    texts = ["moyen texte", "a", "le texte le plus long", "bb", "moyen texte"]
+    model = LengthModel()
+    embeddings = encode_length_sorted(model, texts)
+    assert model.seen == ["le texte le plus long", "moyen texte", "moyen texte", "bb", "a"]
+    assert embeddings[:, 0].tolist() == [len(t) for t in texts]
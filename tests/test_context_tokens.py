@@ -0,0 +1,41 @@
+from context_tokens import count_tokens, split_context, truncate_context
+
+
+def chunk(doc_id, n_lines):
+    """Chunk au format de rag_query.format_context(), avec ses données tabulaires."""
+    body = "\n".join(f"Ligne {i} du document {doc_id} : montant {i * 1000} euros" for i in range(n_lines))
+    return f"\n---\n📄 {doc_id}\n{body}\n\n📊 Données tabulaires : {{\"total\": {n_lines}}}\n"
+
+
+CONTEXT = "".join(chunk(f"doc{i}.txt", 5 + 3 * i) for i in range(8))
+
+
+def test_split_context_keeps_chunks_whole():
+    pieces = CONTEXT.split("\n---\n")[1:]
+    max_tokens = max(count_tokens(p) for p in pieces) + 20
+    groups = split_context(CONTEXT, max_tokens)
+    assert len(groups) > 1
+    assert all(count_tokens(g) <= max_tokens + len(pieces) for g in groups)  # + séparateurs "\n"
+    assert "\n".join(groups) == CONTEXT.lstrip("\n")
+    for group in groups:
+        for piece in ("\n" + group).split("\n---\n")[1:]:
+            assert piece in pieces  # aucun chunk (ni ses données tabulaires) coupé
+            assert "📊 Données tabulaires" in piece
+
+
+def test_split_context_slices_oversized_chunk():
+    big = "---\ngros.txt\n" + " ".join(f"ligne {i} montant {i * 1000} euros" for i in range(200))
+    groups = split_context(big, 100)
+    assert len(groups) > 1
+    assert "".join(groups) == big
+
+
+def test_split_context_single_group_when_small():
+    assert split_context(CONTEXT, 2 * count_tokens(CONTEXT)) == [CONTEXT.lstrip("\n")]
+
+
+def test_truncate_context():
+    assert truncate_context(CONTEXT, count_tokens(CONTEXT)) == CONTEXT
+    truncated = truncate_context(CONTEXT, 50)
+    assert truncated.endswith("[... Contexte tronqué pour respecter la limite de tokens ...]")
+    assert CONTEXT.startswith(truncated.split("\n\n[...")[0])
@@ -0,0 +1,62 @@
+import os
+
+import dossiers
+from diagnostic_store import FRESH, MISSING, STALE, DiagnosticStore
+from index_generations import GenerationWriter
+
+
+def make_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(dossiers, "DOSSIERS_DIR", str(tmp_path))
+    os.makedirs(str(tmp_path / "test"))
+    write_tables(tmp_path, "[]")
+    return DiagnosticStore("test")
+
+
+def write_tables(tmp_path, content):
+    with open(str(tmp_path / "test" / "all_tables.json"), "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_saved_diagnostic_is_fresh(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    assert store.load("chiffre", "t1", "gpt-4o-mini") == (None, MISSING)
+    store.save("chiffre", "t1", "gpt-4o-mini", "Diagnostic")
+    entry, status = store.load("chiffre", "t1", "gpt-4o-mini")
+    assert status == FRESH and entry["content"] == "Diagnostic"
+
+
+def test_prompt_or_model_change_is_stale(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    store.save("chiffre", "t1", "gpt-4o-mini", "Diagnostic")
+    entry, status = store.load("chiffre", "t2", "gpt-4o")
+    assert status == STALE
+    assert store.stale_reasons(entry, "chiffre", "t2", "gpt-4o") == ["prompt", "modèle"]
+
+
+def test_corpus_change_is_stale(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    store.save("chiffre", "t1", "gpt-4o-mini", "Diagnostic")
+    write_tables(tmp_path, '[{"titre": "Bilan"}]')
+    entry, status = store.load("chiffre", "t1", "gpt-4o-mini")
+    assert status == STALE
+    assert store.stale_reasons(entry, "chiffre", "t1", "gpt-4o-mini") == ["documents"]
+
+
+def test_new_index_generation_is_stale(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    store.save("chiffre", "t1", "gpt-4o-mini", "Diagnostic")
+    with GenerationWriter("test") as gen:
+        with open(gen.paths["chunks"], "w", encoding="utf-8") as f:
+            f.write("[]")
+    assert store.load("chiffre", "t1", "gpt-4o-mini")[1] == STALE
+    store.save("chiffre", "t1", "gpt-4o-mini", "Diagnostic régénéré")
+    assert store.load("chiffre", "t1", "gpt-4o-mini")[1] == FRESH
+
+
+def test_questions_have_their_own_entries(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    question = "Quel est le chiffre d'affaires ?"
+    store.save("chiffre", "t1", "gpt-4o-mini", "Réponse", query=question)
+    assert store.load("chiffre", "t1", "gpt-4o-mini", question)[1] == FRESH
+    assert store.load("chiffre", "t1", "gpt-4o-mini", "Quel est le résultat net ?")[1] == MISSING
+    assert store.load("chiffre", "t1", "gpt-4o-mini")[1] == MISSING
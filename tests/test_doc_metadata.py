@@ -0,0 +1,42 @@
+from doc_metadata import EMPTY_PAGE, describe, format_page, matches, page_at, page_blocks, text_blocks
+
+CHUNK = {"doc_type": "comptes", "date": "2016-06-30", "page": 4}
+
+
+def test_matches_doc_type():
+    assert matches(CHUNK, {"doc_type": "comptes"})
+    assert matches(CHUNK, {"doc_type": ["jugement", "comptes"]})
+    assert not matches(CHUNK, {"doc_type": "jugement"})
+
+
+def test_matches_dates_at_common_precision():
+    assert matches(CHUNK, {"date_from": "2016", "date_to": "2016"})
+    assert matches(CHUNK, {"date_from": "2016-06-30"})
+    assert not matches(CHUNK, {"date_from": "2016-07"})
+    assert not matches(CHUNK, {"date_to": "2015-12-31"})
+    assert matches({"date": "2016"}, {"date_from": "2016-03-01", "date_to": "2016-09-30"})
+
+
+def test_matches_pages():
+    assert matches(CHUNK, {"pages": 4})
+    assert matches(CHUNK, {"pages": (2, 5)})
+    assert not matches(CHUNK, {"pages": (5, 9)})
+
+
+def test_unknown_metadata_is_not_filtered_out():
+    assert matches({}, {"doc_type": "jugement", "date_from": "2020", "pages": (1, 2)})
+    assert matches(CHUNK, None)
+
+
+def test_describe_from_file_name():
+    assert describe("E-CENTER - Comptes annuels 2024.txt") == {"doc_type": "comptes", "date": "2024"}
+
+
+def test_pages_are_numbered_with_empty_pages():
+    text = "===== TEXTE EXTRAIT =====\n\n" + "\n\n".join(
+        format_page(p) for p in ["Bilan\n\nActif", None, "Passif"]) + "\n\n===== TABLEAUX EXTRAITS =====\n\n[Tableau 1]"
+    assert [(block, page) for _, block, page in text_blocks(text)] == [
+        ("===== TEXTE EXTRAIT =====", None), ("Bilan\nActif", 1), (EMPTY_PAGE, 2), ("Passif", 3),
+        ("===== TABLEAUX EXTRAITS =====", None), ("[Tableau 1]", None)]
+    marks = page_blocks(text)
+    assert page_at(marks, text.index("Passif") + 3) == 3
@@ -0,0 +1,27 @@
+import pytest
+
+from embedding_backend import check_index_compat, load_embedder, write_index_meta
+
+MINILM = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def test_backend_change_keeps_index_compatible(tmp_path):
+    index = str(tmp_path / "index.faiss")
+    write_index_meta(index, MINILM, "torch", 384)
+    assert check_index_compat(index, 384, MINILM, "onnx-int8")
+
+
+def test_model_or_dimension_change_requires_rebuild(tmp_path):
+    index = str(tmp_path / "index.faiss")
+    write_index_meta(index, MINILM, "torch", 384)
+    assert not check_index_compat(index, 384, "intfloat/multilingual-e5-small", "torch")
+    assert not check_index_compat(index, 768, MINILM, "torch")
+
+
+def test_index_without_metadata_is_minilm_torch(tmp_path):
+    assert check_index_compat(str(tmp_path / "index.faiss"), 384, MINILM, "onnx")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        load_embedder(backend="tensorrt")
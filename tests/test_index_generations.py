@@ -0,0 +1,64 @@
+import os
+
+import dossiers
+from index_generations import (GenerationWriter, collect_garbage, current_generation, index_paths,
+                               list_generations)
+
+
+def use_tmp_dossiers(tmp_path, monkeypatch):
+    monkeypatch.setattr(dossiers, "DOSSIERS_DIR", str(tmp_path))
+    os.makedirs(str(tmp_path / "test"))
+    return str(tmp_path / "test" / "index_generations")
+
+
+def write_generation(dossier, chunks):
+    with GenerationWriter(dossier) as gen:
+        with open(gen.paths["chunks"], "w", encoding="utf-8") as f:
+            f.write(chunks)
+    return gen.name
+
+
+def test_publish_switches_current(tmp_path, monkeypatch):
+    use_tmp_dossiers(tmp_path, monkeypatch)
+    assert current_generation("test") is None
+    name = write_generation("test", "[1]")
+    assert current_generation("test") == name
+    paths = index_paths("test")
+    assert paths["generation"] == name
+    with open(paths["chunks"], "r", encoding="utf-8") as f:
+        assert f.read() == "[1]"
+
+
+def test_abort_keeps_current_and_removes_tmp(tmp_path, monkeypatch):
+    folder = use_tmp_dossiers(tmp_path, monkeypatch)
+    name = write_generation("test", "[1]")
+    try:
+        with GenerationWriter("test") as gen:
+            with open(gen.paths["chunks"], "w", encoding="utf-8") as f:
+                f.write("[2")
+            raise RuntimeError("indexation interrompue")
+    except RuntimeError:
+        pass
+    assert current_generation("test") == name
+    assert sorted(os.listdir(folder)) == ["CURRENT", name]
+
+
+def test_collect_garbage_keeps_current_and_previous(tmp_path, monkeypatch):
+    folder = use_tmp_dossiers(tmp_path, monkeypatch)
+    names = [f"gen-20250301-10000{i}-000" for i in range(5)]
+    for name in names:
+        os.makedirs(os.path.join(folder, name))
+    with open(os.path.join(folder, "CURRENT"), "w", encoding="utf-8") as f:
+        f.write(names[3])  # retour arrière : la génération plus récente est conservée
+
+    assert collect_garbage("test", keep=2) == names[:1]
+    assert list_generations("test") == names[1:]
+
+
+def test_collect_garbage_ignores_unknown_current(tmp_path, monkeypatch):
+    folder = use_tmp_dossiers(tmp_path, monkeypatch)
+    os.makedirs(os.path.join(folder, "gen-20250301-100000-000"))
+    with open(os.path.join(folder, "CURRENT"), "w", encoding="utf-8") as f:
+        f.write("gen-absente")
+    assert collect_garbage("test", keep=0) == []
+    assert list_generations("test") == ["gen-20250301-100000-000"]
@@ -0,0 +1,57 @@
+from lexical_index import BM25Index, has_identifier, hybrid_ranking, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    "Le compte bancaire 433 925 718 présente un solde débiteur.",
+    "Les dettes fiscales s'élèvent à 133 461 euros au 11/02/2025.",
+    "La société emploie 12 salariés dans ses magasins.",
+]
+
+
+def test_tokenize_compacts_numbers_and_dates():
+    tokens = tokenize("Solde débiteur du compte 433 925 718 au 5/2/2025")
+    assert "433925718" in tokens
+    assert "05022025" in tokens
+    assert "debiteur" in tokens  # accents retirés
+    assert "du" not in tokens and "au" not in tokens  # mots vides
+
+
+def test_tokenize_light_stemming():
+    assert tokenize("Créances clients") == tokenize("créance client")
+
+
+def test_search_finds_identifier_in_either_format():
+    bm25 = BM25Index.build(CHUNKS)
+    assert bm25.search("433925718", top_k=1)[0][0] == 0
+    assert bm25.search("compte 433 925 718", top_k=1)[0][0] == 0
+    assert bm25.search("dettes au 11.02.2025", top_k=1)[0][0] == 1
+
+
+def test_search_respects_allowed():
+    bm25 = BM25Index.build(CHUNKS)
+    assert bm25.search("dettes fiscales", allowed={0, 2}) == []
+
+
+def test_save_load_roundtrip(tmp_path):
+    bm25 = BM25Index.build(CHUNKS)
+    path = str(tmp_path / "bm25.json")
+    bm25.save(path)
+    assert BM25Index.load(path).search("salariés") == bm25.search("salariés")
+
+
+def test_rrf_favours_documents_ranked_by_both():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]])
+    assert [idx for idx, _ in fused] == [1, 3, 2, 4]
+
+
+def test_rrf_weights():
+    fused = reciprocal_rank_fusion([[1, 2], [2, 1]], weights=[1.0, 3.0])
+    assert [idx for idx, _ in fused] == [2, 1]
+
+
+def test_hybrid_ranking_boosts_lexical_for_identifiers():
+    bm25 = BM25Index.build(CHUNKS)
+    dense = [2, 1, 0]  # l'identifiant exact est classé dernier par les embeddings
+    assert has_identifier("compte 433925718")
+    assert hybrid_ranking("compte 433925718", dense, bm25)[0][0] == 0
+    assert hybrid_ranking("magasins", dense, bm25)[0][0] == 2
+    assert [idx for idx, _ in hybrid_ranking("magasins", dense)] == dense
@@ -0,0 +1,50 @@
+import llm_structure
+import local_tables
+from local_tables import extract_tables_hybrid, parse_table
+
+
+def test_parse_table_with_period_columns():
+    table = parse_table([["En milliers d'euros", "2023", "2024"],
+                         ["Chiffre d'affaires", "1 200", "1 350,5"],
+                         ["Résultat net", "(50)", "-"]], source="comptes.txt", titre="Compte de résultat")
+    assert table["data"] == [{"label": "Chiffre d'affaires", "2023": 1200, "2024": 1350.5},
+                             {"label": "Résultat net", "2023": -50, "2024": None}]
+    assert table["unit"] == "KEUR"
+    assert table["confidence"] == 1.0
+
+
+def test_parse_table_expands_stacked_rows():
+    table = parse_table([["Poste", "Montant"],
+                         ["Stocks\nCréances clients", "180 027\n309 119"]], source="cessation.txt")
+    assert table["data"] == [{"label": "Stocks", "Montant": 180027},
+                             {"label": "Créances clients", "Montant": 309119}]
+    assert table["confidence"] == 0.85  # pas de colonne d'exercice
+
+
+def test_unresolved_stacked_values_lower_confidence():
+    table = parse_table([["Poste", "2024"],
+                         ["Dettes fiscales", "3 576\n129 884"],
+                         ["Dettes sociales", "48 564"],
+                         ["Dettes fournisseurs", "212 310"],
+                         ["Autres dettes", "9 870"]], source="cessation.txt")
+    assert table["confidence"] < local_tables.MIN_CONFIDENCE
+
+
+def test_non_numeric_table_is_ignored():
+    assert parse_table([["Nom", "Fonction"], ["Dupont", "Président"], ["Martin", "DAF"]], source="x.txt") is None
+
+
+def test_hybrid_sends_selected_pages_without_prefilter(monkeypatch):
+    calls = []
+    monkeypatch.setattr(local_tables, "extract_local_tables",
+                        lambda pdf_path, source: ([{"titre": "local"}], [(2, "ACTIFS\nStocks : 180 027")]))
+
+    def fake_extract(text, **kwargs):
+        calls.append((text, kwargs))
+        return [{"titre": "llm"}]
+
+    monkeypatch.setattr(llm_structure, "extract_tables_from_text", fake_extract)
+    tables, _ = extract_tables_hybrid("cessation.pdf", "cessation.txt")
+    assert [t["titre"] for t in tables] == ["local", "llm"]
+    assert calls[0][0] == "ACTIFS\nStocks : 180 027"
+    assert calls[0][1]["prefilter"] is False
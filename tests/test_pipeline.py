@@ -0,0 +1,66 @@
+import pipeline
+from pipeline import Task, run_pipeline
+
+
+def upper(src, dst):
+    with open(src, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(dst, "w", encoding="utf-8") as f:
+        f.write(text.upper())
+
+
+def setup(tmp_path, monkeypatch, params=None):
+    """Graphe à deux tâches : source.txt → a.txt → b.txt."""
+    src, a, b = (str(tmp_path / name) for name in ("source.txt", "a.txt", "b.txt"))
+    tasks = [Task("a", upper, (src, a), inputs=[src], outputs=[a], params=params or {"version": 1}),
+             Task("b", upper, (a, b), inputs=[a], outputs=[b], deps=["a"])]
+    monkeypatch.setattr(pipeline, "plan", lambda dossier: tasks)
+    monkeypatch.setattr(pipeline, "dossier_paths", lambda dossier: {
+        "state": str(tmp_path / "pipeline_state.json"), "tables": str(tmp_path / "all_tables.json"),
+        "tables_dir": str(tmp_path / "tables")})
+    return src, b
+
+
+def test_unchanged_tasks_are_skipped(tmp_path, monkeypatch):
+    src, b = setup(tmp_path, monkeypatch)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("bilan")
+    assert run_pipeline("test", workers=1) == {"a": "ok", "b": "ok"}
+    assert run_pipeline("test", workers=1) == {"a": "à jour", "b": "à jour"}
+    with open(b, "r", encoding="utf-8") as f:
+        assert f.read() == "BILAN"
+
+
+def test_changed_input_reruns_downstream(tmp_path, monkeypatch):
+    src, b = setup(tmp_path, monkeypatch)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("bilan")
+    run_pipeline("test", workers=1)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("bilan 2024")
+    assert run_pipeline("test", workers=1) == {"a": "ok", "b": "ok"}
+    with open(b, "r", encoding="utf-8") as f:
+        assert f.read() == "BILAN 2024"
+
+
+def test_changed_params_rerun_task(tmp_path, monkeypatch):
+    src, _ = setup(tmp_path, monkeypatch)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("bilan")
+    run_pipeline("test", workers=1)
+    setup(tmp_path, monkeypatch, params={"version": 2})
+    # a est refaite ; sa sortie est identique, donc b reste à jour
+    assert run_pipeline("test", workers=1) == {"a": "ok", "b": "à jour"}
+
+
+def test_dry_run_propagates_without_running(tmp_path, monkeypatch):
+    src, b = setup(tmp_path, monkeypatch)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("bilan")
+    run_pipeline("test", workers=1)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("bilan 2024")
+    assert run_pipeline("test", workers=1, dry_run=True) == {"a": "à relancer", "b": "à relancer"}
+    with open(b, "r", encoding="utf-8") as f:
+        assert f.read() == "BILAN"
+    assert run_pipeline("test", workers=1) == {"a": "ok", "b": "ok"}
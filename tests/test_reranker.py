@@ -0,0 +1,48 @@
+from reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """Score : nombre de mots de la question présents dans le chunk."""
+
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, pairs, **kwargs):
+        self.pairs.extend(pairs)
+        return [sum(w in text for w in query.split()) for query, text in pairs]
+
+
+CHUNKS = [{"chunk_id": "a", "text": "loyer du magasin"},
+          {"chunk_id": "b", "text": "dettes fiscales et sociales"},
+          {"chunk_id": "c", "text": "dettes fiscales"}]
+
+
+def make_reranker():
+    reranker = Reranker()
+    reranker._model = FakeCrossEncoder()
+    return reranker
+
+
+def test_rerank_keeps_best_chunks():
+    reranker = make_reranker()
+    report = {}
+    kept = reranker.rerank("dettes sociales", CHUNKS, top_k=2, report=report)
+    assert [(c["chunk_id"], c["rerank_score"]) for c in kept] == [("b", 2), ("c", 1)]
+    assert {k: report[k] for k in ("candidates", "scored", "cache_hits", "kept")} == \
+        {"candidates": 3, "scored": 3, "cache_hits": 0, "kept": 2}
+
+
+def test_scores_are_cached_per_query_and_generation():
+    reranker = make_reranker()
+    reranker.rerank("dettes sociales", CHUNKS)
+    report = {}
+    reranker.rerank("dettes sociales", CHUNKS, report=report)
+    assert report["cache_hits"] == 3 and len(reranker.model.pairs) == 3
+    reranker.rerank("dettes sociales", [dict(CHUNKS[0], generation="gen-2")], report=report)
+    assert report["scored"] == 1  # même chunk_id, autre génération d'index
+
+
+def test_empty_candidates_give_zero_report():
+    report = {}
+    assert make_reranker().rerank("dettes", [], report=report) == []
+    assert report == {"rerank_ms": 0.0, "candidates": 0, "scored": 0, "cache_hits": 0, "kept": 0}
@@ -0,0 +1,56 @@
+import json
+import os
+
+from retrieval_bench import build_chunks, evaluate, load_corpus, locate_passages, relevance
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeModel:
+    def encode(self, texts, **kwargs):
+        return [[0.0]] * len(texts)
+
+
+class FixedRanking:
+    """Classement imposé par requête (au lieu d'une recherche FAISS/BM25)."""
+
+    def __init__(self, rankings):
+        self.rankings = rankings
+
+    def search(self, query, q_emb, top_k, mode):
+        return self.rankings[query][:top_k]
+
+
+def test_bundled_passages_are_found_in_corpus():
+    with open(os.path.join(ROOT, "data", "retrieval_queries.json"), "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    labeled = locate_passages(load_corpus(os.path.join(ROOT, "data", "texts")), queries)
+    assert [q["id"] for q in labeled] == [q["id"] for q in queries]
+    assert all(len(q["passages"]) == len(src["passages"]) for q, src in zip(labeled, queries))
+
+
+def test_passage_matching_ignores_line_breaks_and_apostrophes():
+    text = "Le tribunal ordonne l’ouverture d'une\nprocédure de sauvegarde."
+    labeled = locate_passages({"jugement.txt": text}, [{"id": "q1", "query": "procédure ?", "passages": [
+        {"text": "L'ouverture d’une procédure", "doc": "jugement"}]}])
+    start, end = text.index("l’ouverture"), text.index(" de sauvegarde")
+    assert labeled[0]["passages"] == [[("jugement.txt", start, end)]]
+
+
+def test_recall_and_mrr():
+    corpus = {"a.txt": "x" * 100 + "passage un" + "y" * 100, "b.txt": "z" * 50 + "passage deux"}
+    labeled = locate_passages(corpus, [
+        {"id": "q1", "query": "un", "passages": [{"text": "passage un"}]},
+        {"id": "q2", "query": "deux", "passages": [{"text": "passage deux"}, {"text": "passage un"}]},
+    ])
+    chunks = build_chunks(corpus, 60, 0)
+    relevant = relevance(chunks, labeled)
+    first_a = relevant[0][0]
+    (hit_b,) = relevant[1][0]
+    bench = FixedRanking({"un": [hit_b, *sorted(first_a)], "deux": [hit_b]})
+
+    metrics = evaluate(bench, FakeModel(), labeled, relevant, top_k=3, mode="dense")
+    assert metrics["mrr"] == 0.75  # q1 : rang 2, q2 : rang 1
+    assert metrics["recall@1"] == 0.25  # q1 : 0, q2 : 1 passage sur 2
+    assert metrics["recall@3"] == 0.75
+    assert metrics["misses"] == []
@@ -0,0 +1,28 @@
+import pytest
+
+from structured_output import StructuredOutputError, parse_json, validate_tables
+
+
+def test_accented_bare_keys_are_quoted():
+    data, repaired = parse_json("{évolution: 1, 'chiffre_d_affaires': None, total: True}")
+    assert repaired
+    assert data == {"évolution": 1, "chiffre_d_affaires": None, "total": True}
+
+
+def test_unrepairable_text_raises_structured_error():
+    with pytest.raises(StructuredOutputError):
+        parse_json("{évolution 1")
+
+
+def test_single_table_object_is_one_table():
+    data = {"source": "comptes.pdf", "titre": "T", "unit": "EUR", "data": [{"label": "CA", "2014": "1 234"}]}
+    tables = validate_tables(data)
+    assert len(tables) == 1
+    assert tables[0]["titre"] == "T"
+    assert tables[0]["data"] == [{"label": "CA", "2014": 1234.0}]
+
+
+def test_tables_envelope_is_unwrapped():
+    data = {"tables": [{"titre": "A", "data": [{"label": "CA", "2014": 1}]},
+                       {"titre": "B", "data": [{"label": "EBE", "2014": 2}]}]}
+    assert [t["titre"] for t in validate_tables(data, "x.pdf")] == ["A", "B"]
@@ -0,0 +1,73 @@
+from llm_structure import segment_text, select_tabular_blocks, split_blocks
+from table_detect import has_tabular_content, is_tabular_line
+
+# Déclaration de cessation des paiements E-CENTER, pages 2 et 3 (texte extrait)
+ACTIFS_PASSIF = """Page 2
+ACTIFS
+En euros Disponibles Non disponibles
+IMMOBILISATIONS :
+- Fonds de Commerce : Mémoire
+- Matériels et mobilier : 160 630
+- Véhicules : Mémoire
+- Immobilisations financières : 88 520
+0 249 150
+VALEURS D'EXPLOITATION :
+- Stocks : 180 027
+- En cours de production : Mémoire
+Total valeurs d'exploitation : 0 180 027
+VALEURS REALISABLES ET DISPONIBLES :
+- Créances clients au 11/02/25 : 309 119
+- Autres créances : Mémoire
+- Trésorerie (11/02/25): 278 034
+Total valeurs réalisables et disponibles : 278 034 309 119
+Total : 278 034 738 296
+Total global : 1 016 330
+
+Page 3
+PASSIF
+Sommes (en euros)
+A - CREANCIERS GARANTIS PAR DES PRIVILEGES GENERAUX
+Echues A échoir
+ADMINISTRATIONS FISCALES :
+DGE 3 576,44
+PRS BOULOGNE 129 884,98
+Total Administrations Fiscales : 133 461 0
+ORGANISMES SOCIAUX :
+Humanis TSA90002 34189 MONTPELLIER 6 203,77
+MALAKOFF MEDERIC AGIRC 1 737,84
+MALAKOFF MEDERIC ARRCO 4 973,99
+URSSAF 35 648,35
+Total Organismes Sociaux : 48 564 0
+Total : 182 025 0
+Total global : 182 025"""
+
+PROSE = """Par jugement du 25 novembre 2016, le Tribunal de commerce de Nanterre a arrêté le plan
+de sauvegarde de la société, conformément aux articles L. 626-1 et suivants du code de commerce.
+Le commissaire à l'exécution du plan veille à son exécution pendant une durée de 10 ans."""
+
+
+def test_long_labels_with_two_amounts_are_tabular():
+    assert is_tabular_line("Autres immobilisations financières 88 520 88 520")
+    assert is_tabular_line("Clients douteux ou litigieux 2 648 2 648")
+    assert not is_tabular_line("12")
+    assert not is_tabular_line("conformément aux articles L. 626-1 et suivants du code de commerce.")
+
+
+def test_actifs_passif_pages_reach_the_llm():
+    blocks = split_blocks(ACTIFS_PASSIF)
+    assert len(blocks) == 2
+    assert select_tabular_blocks(blocks) == blocks
+    assert "Total global : 1 016 330" in "\n".join(segment_text(ACTIFS_PASSIF))
+
+
+def test_prose_is_filtered_out():
+    assert not has_tabular_content(PROSE)
+    assert segment_text(PROSE) == []
+
+
+def test_period_header_stays_with_its_table():
+    rows = [f"Poste {i} {i} 100 {i} 200" for i in range(10)]
+    text = "\n".join(["BILAN PASSIF", "Exercice du 01/01/2024 au 31/12/2024"] + rows)
+    blocks = split_blocks(text)
+    assert len(blocks) == 1
+    assert select_tabular_blocks(blocks) == blocks
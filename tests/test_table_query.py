@@ -0,0 +1,66 @@
+import json
+
+from table_query import TableQueryEngine, parse_number, requested_periods
+
+TABLES = [
+    {"source": "Rapport.txt", "titre": "Compte de résultat", "unit": "EUR",
+     "data": [{"label": "Chiffre d'affaires", "2013": "1 200 000", "2014": "1 500 000", "2015": "1 350 000"},
+              {"label": "Résultat net", "2013": "(50 000)", "2014": "20 000", "2015": None}]},
+    {"source": "Baux.txt", "titre": "Loyers des magasins", "unit": "EUR",
+     "data": [{"label": "Loyer annuel Mérignac", "montant": "48 000"},
+              {"label": "Loyer annuel Bordeaux", "montant": "62 000"}]},
+]
+
+
+def test_parse_number():
+    assert parse_number("1 234,56") == 1234.56
+    assert parse_number("(500)") == -500
+    assert parse_number("1.234.567") == 1234567
+    assert parse_number("Mémoire") is None
+
+
+def test_requested_periods_expands_ranges():
+    assert requested_periods("évolution 2013-2015") == ["2013", "2014", "2015"]
+
+
+def test_lookup_returns_matching_row():
+    engine = TableQueryEngine(TABLES)
+    results = engine.lookup(["loyer", "merignac"])["results"]
+    assert results[0]["label"] == "Loyer annuel Mérignac"
+    assert results[0]["values"] == {"montant": 48000}
+
+
+def test_lookup_filters_by_period():
+    engine = TableQueryEngine(TABLES)
+    results = engine.lookup(["chiffre", "affaire"], periods=["2014"])["results"]
+    assert [s["values"] for s in results] == [{"2014": 1500000}]
+
+
+def test_compare_computes_variations():
+    engine = TableQueryEngine(TABLES)
+    serie = engine.compare(["chiffre", "affaire"])["results"][0]
+    assert [(v["from"], v["to"], v["delta"], v["pct"]) for v in serie["variations"]] == [
+        ("2013", "2014", 300000, 25.0), ("2014", "2015", -150000, -10.0)]
+
+
+def test_compare_from_negative_base():
+    engine = TableQueryEngine(TABLES)
+    serie = engine.compare(["resultat", "net"])["results"][0]
+    assert serie["values"] == {"2013": -50000, "2014": 20000}  # valeur absente ignorée
+    assert serie["variations"] == [{"from": "2013", "to": "2014", "delta": 70000, "pct": 140.0}]
+
+
+def test_answer_without_match_falls_back():
+    engine = TableQueryEngine(TABLES)
+    assert engine.answer("capital social de la holding") is None
+    assert engine.answer("évolution du chiffre d'affaires 2013-2015")["type"] == "compare"
+
+
+def test_for_file_rebuilds_when_file_changes(tmp_path):
+    path = tmp_path / "all_tables.json"
+    assert TableQueryEngine.for_file(str(path)).facts == []
+    path.write_text(json.dumps(TABLES), encoding="utf-8")
+    engine = TableQueryEngine.for_file(str(path))
+    assert engine.facts and TableQueryEngine.for_file(str(path)) is engine
+    path.write_text(json.dumps(TABLES[1:]), encoding="utf-8")
+    assert {f["source"] for f in TableQueryEngine.for_file(str(path)).facts} == {"Baux.txt"}
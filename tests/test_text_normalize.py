@@ -0,0 +1,31 @@
+import os
+
+from text_normalize import Boilerplate, split_pages
+
+TEXT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "texts")
+COMPTES = "E-CENTER - Comptes annuels 2024.txt"
+
+
+def clean_comptes():
+    with open(os.path.join(TEXT_DIR, COMPTES), "r", encoding="utf-8") as f:
+        text = f.read()
+    return text, Boilerplate.from_dir(TEXT_DIR).clean(COMPTES, text)[0]
+
+
+def count_lines(text, line):
+    return sum(1 for l in text.splitlines() if l.strip() == line)
+
+
+def test_period_headers_are_kept():
+    text, cleaned = clean_comptes()
+    for line in ("Exercice N Exercice N-1", "Exercice du 01/01/2024 au 31/12/2024"):
+        assert count_lines(text, line) > 1
+        assert count_lines(cleaned, line) == count_lines(text, line)
+
+
+def test_repeated_footer_and_page_numbers_are_removed():
+    text, cleaned = clean_comptes()
+    footer = "Dossier N°000302 enEuros. Mission de présentation"
+    assert sum(footer in page for page in split_pages(text)) > 20
+    assert sum(footer in page for page in split_pages(cleaned)) < 5
+    assert "E-CENTER SAS Page :4" not in cleaned
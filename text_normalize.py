@@ -0,0 +1,205 @@
+"""
+Normalisation des textes extraits avant découpage en chunks.
+
+Les PDF répètent sur chaque page leurs en-têtes, pieds de page, tampons du greffe et
+numéros de page (« E-CENTER SAS Page :9 », « Tour CB21 ... », « 12 »...). Découpés,
+encodés et envoyés au LLM avec le reste, ils gonflent l'index et les prompts sans
+rien apporter, et brouillent la recherche.
+
+- Lignes répétées : une ligne est un « boilerplate » quand elle revient en bord de page
+  (EDGE_LINES premières ou dernières lignes) sur une part importante des pages d'un
+  document, ou en bord de page dans plusieurs documents. Les chiffres sont masqués pour
+  la comparaison (« Page 3 » et « Page 4 » sont la même ligne). Seules les lignes en
+  bord de page sont retirées : le corps du texte n'est jamais touché. Une ligne répétée
+  qui porte une date ou une période (« Exercice N Exercice N-1 », « Exercice du 01/01/2024
+  au 31/12/2024 »), ou qui précède directement une ligne chiffrée (en-tête de tableau),
+  est gardée : elle dit à quoi correspondent les colonnes des comptes.
+- Chunks identiques : un chunk déjà indexé dans le corpus (même texte aux espaces près,
+  ex. le projet de plan recopié dans le rapport) n'est pas indexé une seconde fois.
+
+Les textes de data/texts restent bruts (les pages y sont séparées par une ligne vide,
+cf. pdf_extract.py) : seul ce qui est indexé est nettoyé.
+"""
+
+import hashlib
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from doc_metadata import EMPTY_PAGE
+
+# === CONFIG ===
+NORMALIZE_VERSION = 2  # à incrémenter si les règles changent : invalide l'index
+EDGE_LINES = 4  # lignes examinées en haut et en bas de chaque page
+MIN_PAGE_REPEATS = 3  # répétitions minimales dans un document...
+MIN_PAGE_SHARE = 0.2  # ... et part minimale de ses pages
+MIN_DOCS = 3  # ou présente en bord de page dans au moins MIN_DOCS documents
+MAX_LINE_CHARS = 200  # au-delà, une ligne est du contenu, jamais un en-tête
+
+DIGITS_RE = re.compile(r"\d+")
+NUMERIC_KEYS = {"#", "# #", "#,#", "# #,#", "#.#"}
+# Numéros de page seuls : « 12 », « Page 3 », « page 3 sur 10 », « - 3 - », « 3/10 ».
+# Testés sur la ligne elle-même (pas sur sa clé) : « 2024 » ou « 58 947 » restent du contenu.
+PAGE_MARKER_RE = re.compile(r"^(?:page\s*:?\s*\d{1,3}(?:\s*(?:sur|/)\s*\d{1,3})?|-\s*\d{1,3}\s*-|\d{1,3}\s*/\s*\d{1,3}|\d{1,3})$")
+# Dates et périodes (colonnes N / N-1, période de l'exercice) : jamais retirées
+PERIOD_RE = re.compile(r"\d{1,2}/\d{1,2}/\d{2,4}|(?<!\d)(?:19|20)\d{2}(?!\d)|\bexercices?\b|\bp[ée]riode\b|\bN\s*-\s*\d\b", re.I)
+NUMERIC_ROW_RE = re.compile(r"\d[\d\s.,)]*$")  # ligne de tableau : se termine par un nombre
+
+
+# === LIGNES RÉPÉTÉES ===
+def line_key(line: str) -> str:
+    """Forme comparable d'une ligne : espaces normalisés, minuscules, chiffres masqués."""
+    return DIGITS_RE.sub("#", " ".join(line.split()).lower())
+
+
+def split_pages(text: str) -> List[str]:
+    """Pages d'un texte extrait (blocs séparés par une ligne vide)."""
+    return text.split("\n\n")
+
+
+def edge_indices(lines: List[str]) -> List[int]:
+    """Indices des EDGE_LINES premières et dernières lignes non vides d'une page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:EDGE_LINES] + filled[-EDGE_LINES:]))
+
+
+def page_edge_keys(page: str) -> Set[str]:
+    lines = page.splitlines()
+    keys = (line_key(lines[i]) for i in edge_indices(lines) if len(lines[i]) <= MAX_LINE_CHARS)
+    return {k for k in keys if k}
+
+
+def is_protected(lines: List[str], i: int) -> bool:
+    """
+    Ligne répétée à garder : elle porte une date ou une période, ou précède directement une
+    ligne chiffrée (en-tête des colonnes d'un tableau). Les numéros de page ne le sont jamais.
+    """
+    if PAGE_MARKER_RE.match(" ".join(lines[i].split()).lower()):
+        return False
+    if PERIOD_RE.search(lines[i]):
+        return True
+    following = next((line.strip() for line in lines[i + 1:] if line.strip()), "")
+    return bool(NUMERIC_ROW_RE.search(following)) and not PAGE_MARKER_RE.match(" ".join(following.split()).lower())
+
+
+class Boilerplate:
+    """Lignes répétées apprises sur un corpus : par document et communes à plusieurs documents."""
+
+    def __init__(self, per_doc: Optional[Dict[str, Set[str]]] = None, shared: Optional[Set[str]] = None):
+        self.per_doc = per_doc or {}
+        self.shared = shared or set()
+
+    @classmethod
+    def fit(cls, texts: Dict[str, str]) -> "Boilerplate":
+        """Apprend les lignes répétées de textes {doc_id: texte}."""
+        per_doc, docs_by_key = {}, defaultdict(set)
+        for doc_id, text in texts.items():
+            pages = [p for p in split_pages(text) if p.strip()]
+            counts = Counter()
+            for page in pages:
+                keys = page_edge_keys(page)
+                counts.update(keys)
+                for k in keys:
+                    docs_by_key[k].add(doc_id)
+            threshold = max(MIN_PAGE_REPEATS, MIN_PAGE_SHARE * len(pages))
+            per_doc[doc_id] = {k for k, n in counts.items() if n >= threshold}
+        shared = {k for k, docs in docs_by_key.items() if len(docs) >= MIN_DOCS}
+        return cls(per_doc, shared)
+
+    @classmethod
+    def from_dir(cls, text_dir: str) -> "Boilerplate":
+        """Apprend les lignes répétées des textes .txt d'un dossier (vide si le dossier n'existe pas)."""
+        texts = {}
+        if os.path.isdir(text_dir):
+            for filename in sorted(os.listdir(text_dir)):
+                if filename.endswith(".txt"):
+                    with open(os.path.join(text_dir, filename), "r", encoding="utf-8") as f:
+                        texts[filename] = f.read()
+        return cls.fit(texts)
+
+    def is_boilerplate(self, doc_id: str, line: str) -> bool:
+        if PAGE_MARKER_RE.match(" ".join(line.split()).lower()):
+            return True
+        key = line_key(line)
+        if key in NUMERIC_KEYS:
+            return False  # nombres isolés : seuls les numéros de page (ci-dessus) sont du boilerplate
+        return key in self.shared or key in self.per_doc.get(doc_id, ())
+
+    def clean_page(self, doc_id: str, page: str) -> Tuple[str, int]:
+        """Retire les lignes répétées en bord de page ; retourne (page nettoyée, lignes retirées)."""
+        lines = page.splitlines()
+        drop = {i for i in edge_indices(lines)
+                if len(lines[i]) <= MAX_LINE_CHARS and self.is_boilerplate(doc_id, lines[i])
+                and not is_protected(lines, i)}
+        if not drop:
+            return page, 0
+        return "\n".join(line for i, line in enumerate(lines) if i not in drop), len(drop)
+
+    def clean(self, doc_id: str, text: str) -> Tuple[str, int]:
+        """Nettoie toutes les pages d'un texte, pages vides écartées ; retourne (texte nettoyé, lignes retirées)."""
+        pages, removed = [], 0
+        for page in split_pages(text):
+            page, n = self.clean_page(doc_id, page)
+            pages.append(page)
+            removed += n
+        return "\n\n".join(p for p in pages if p.strip() and p.strip() != EMPTY_PAGE), removed
+
+
+def strip_repeated_lines(text: str) -> str:
+    """Retire d'un texte isolé ses propres lignes répétées en bord de page (segments envoyés au LLM)."""
+    return Boilerplate.fit({"": text}).clean("", text)[0]
+
+
+# === CHUNKS IDENTIQUES ===
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+
+
+class Normalizer:
+    """
+    Nettoyage des textes et dédoublonnage des chunks pendant une indexation ;
+    compte ce qui a été retiré (stats). Désactivé, laisse tout passer.
+    """
+
+    def __init__(self, boilerplate: Optional[Boilerplate] = None, enabled: bool = True):
+        self.boilerplate = boilerplate or Boilerplate()
+        self.enabled = enabled
+        self.seen = set()
+        self.stats = {"lines_removed": 0, "chars_removed": 0, "duplicate_chunks": 0}
+
+    @classmethod
+    def for_dir(cls, text_dir: str, enabled: bool = True) -> "Normalizer":
+        return cls(Boilerplate.from_dir(text_dir) if enabled else None, enabled)
+
+    def _count(self, before: str, after: str, removed: int):
+        self.stats["lines_removed"] += removed
+        self.stats["chars_removed"] += len(before) - len(after)
+
+    def clean(self, doc_id: str, text: str) -> str:
+        if not self.enabled:
+            return text
+        cleaned, removed = self.boilerplate.clean(doc_id, text)
+        self._count(text, cleaned, removed)
+        return cleaned
+
+    def clean_page(self, doc_id: str, page: str) -> str:
+        if not self.enabled:
+            return page
+        cleaned, removed = self.boilerplate.clean_page(doc_id, page)
+        self._count(page, cleaned, removed)
+        return cleaned
+
+    def keep(self, text: str) -> bool:
+        """Faux si un chunk au texte identique a déjà été gardé dans ce corpus."""
+        if not self.enabled:
+            return True
+        h = chunk_hash(text)
+        if h in self.seen:
+            self.stats["duplicate_chunks"] += 1
+            return False
+        self.seen.add(h)
+        return True
+
+    def filter(self, chunks: Iterable[Dict]) -> List[Dict]:
+        return [c for c in chunks if self.keep(c["text"])]